@@ -0,0 +1,294 @@
+"""
+Supply-hour analytics over a user's event history, with an optional NumPy backend.
+
+A history is an EventSeries: event times as int64 microseconds since the
+epoch (naive UTC, like stored timestamps) and states as int8 (1 = on,
+0 = off), sorted by time. Both backends compute the same figures with the
+same rules the reports have always used:
+
+    on-interval   from the latest "on" since the previous "off" to that
+                  "off"; an "on" with no "off" after it runs until now
+    daily hours   each interval is credited to the day of the "off" that
+                  closes it; an open interval to the day of the last event
+    outage        from an "off" following an "on" (or starting the series)
+                  to the next "on", or until now
+
+The NumPy backend does this with vectorized array operations instead of a
+per-event loop. It is used when numpy is installed, unless
+ANALYTICS_BACKEND=python; numpy is only imported on first use so it doesn't
+add to the app's cold start. Compare the backends with
+`python benchmark.py analytics`.
+
+Reports shouldn't rebuild a series from log objects on every request, so file
+storage keeps each user's events in a SeriesBuffer, built on their first
+report and appended to as logs are written; `python benchmark.py report`
+times that path against building from logs.
+"""
+import importlib.util
+import os
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+DAY_US = 86400 * 1000000
+HOUR_US = 3600 * 1000000
+
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
+
+
+def to_us(moment: datetime) -> int:
+    """Naive UTC datetime -> microseconds since the epoch"""
+    return (moment - EPOCH) // MICROSECOND
+
+
+def log_event(log: Dict) -> Tuple[int, bool, Optional[str]]:
+    """(time_us, on, region_id) of a stored power log dict"""
+    timestamp = log.get('timestamp')
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return to_us(timestamp), log.get('event_type') == 'on', log.get('region_id')
+
+
+def day_start_us(day: date) -> int:
+    return (day - EPOCH.date()).days * DAY_US
+
+
+def day_from_number(day_number: int) -> date:
+    """Day number (days since the epoch) -> date"""
+    return EPOCH.date() + timedelta(days=int(day_number))
+
+
+class EventSeries(NamedTuple):
+    times: Sequence[int]   # microseconds since the epoch, ascending
+    states: Sequence[int]  # 1 = on, 0 = off
+
+
+class Outages(NamedTuple):
+    count: int
+    longest_us: int
+
+
+class PythonBackend:
+    """Reference implementation: one pass over the events"""
+    name = 'python'
+
+    def series(self, times: List[int], states: List[int]) -> EventSeries:
+        return EventSeries(times, states)
+
+    def put(self, times: List[int], states: List[int], length: int, time_us: int, state: int):
+        """Store event number `length`; returns the (possibly new) containers"""
+        times.append(time_us)
+        states.append(state)
+        return times, states
+
+    def search(self, times: List[int], length: int, start_us: int) -> int:
+        return bisect_left(times, start_us, 0, length)
+
+    def window(self, times: List[int], states: List[int], first: int, length: int) -> EventSeries:
+        return EventSeries(times[first:length], states[first:length])
+
+    @staticmethod
+    def _window_start(series: EventSeries, start_us: int) -> int:
+        return bisect_left(series.times, start_us)
+
+    def on_time(self, series: EventSeries, start_us: int, now_us: int) -> Tuple[int, int]:
+        """(on microseconds, event count) over the events at or after start_us"""
+        first = self._window_start(series, start_us)
+        times, states = series.times, series.states
+        on_since = None
+        total = 0
+        for index in range(first, len(times)):
+            if states[index]:
+                on_since = times[index]
+            elif on_since is not None:
+                total += times[index] - on_since
+                on_since = None
+        if on_since is not None:
+            total += now_us - on_since
+        return total, len(times) - first
+
+    def daily_on_time(self, series: EventSeries, now_us: int) -> Tuple[List[int], List[int]]:
+        """(day numbers with events, on microseconds credited to each)"""
+        days: List[int] = []
+        totals: List[int] = []
+        on_since = None
+        for moment, state in zip(series.times, series.states):
+            day = moment // DAY_US
+            if not days or days[-1] != day:
+                days.append(day)
+                totals.append(0)
+            if state:
+                on_since = moment
+            elif on_since is not None:
+                totals[-1] += moment - on_since
+                on_since = None
+        if on_since is not None and totals:
+            totals[-1] += now_us - on_since
+        return days, totals
+
+    def outages(self, series: EventSeries, start_us: int, now_us: int) -> Outages:
+        first = self._window_start(series, start_us)
+        times, states = series.times, series.states
+        count = longest = 0
+        off_since = None
+        for index in range(first, len(times)):
+            if states[index]:
+                if off_since is not None:
+                    longest = max(longest, times[index] - off_since)
+                    off_since = None
+            elif off_since is None:
+                off_since = times[index]
+                count += 1
+        if off_since is not None:
+            longest = max(longest, now_us - off_since)
+        return Outages(count, longest)
+
+
+class NumpyBackend:
+    """
+    Vectorized implementation over int64/int8 arrays. An "off" closes an
+    on-interval exactly when the event before it is an "on", which is then
+    the interval's start, so intervals are the on->off transitions
+    (states[i] > states[i + 1]) and outages run from an on->off transition
+    to the next off->on transition.
+    """
+    name = 'numpy'
+
+    def __init__(self):
+        import numpy
+        self.np = numpy
+
+    def series(self, times: List[int], states: List[int]) -> EventSeries:
+        np = self.np
+        return EventSeries(np.asarray(times, dtype=np.int64), np.asarray(states, dtype=np.int8))
+
+    def put(self, times, states, length: int, time_us: int, state: int):
+        """Store event number `length`, doubling the arrays when they are full"""
+        np = self.np
+        if length == len(times):
+            capacity = max(64, 2 * length)
+            grown_times, grown_states = np.empty(capacity, dtype=np.int64), np.empty(capacity, dtype=np.int8)
+            grown_times[:length], grown_states[:length] = times[:length], states[:length]
+            times, states = grown_times, grown_states
+        times[length] = time_us
+        states[length] = state
+        return times, states
+
+    def search(self, times, length: int, start_us: int) -> int:
+        return int(self.np.searchsorted(times[:length], start_us, side='left'))
+
+    def window(self, times, states, first: int, length: int) -> EventSeries:
+        # Views, not copies: slots below length are never written again
+        return EventSeries(times[first:length], states[first:length])
+
+    def _window(self, series: EventSeries, start_us: int):
+        first = int(self.np.searchsorted(series.times, start_us, side='left'))
+        return series.times[first:], series.states[first:]
+
+    def _on_intervals(self, times, states, now_us: int):
+        """(index of each closing "off", interval lengths, length of a still-open interval or 0)"""
+        closing = self.np.flatnonzero(states[:-1] > states[1:]) + 1
+        open_us = int(now_us - times[-1]) if states[-1] else 0
+        return closing, times[closing] - times[closing - 1], open_us
+
+    def on_time(self, series: EventSeries, start_us: int, now_us: int) -> Tuple[int, int]:
+        times, states = self._window(series, start_us)
+        if len(times) == 0:
+            return 0, 0
+        _, durations, open_us = self._on_intervals(times, states, now_us)
+        return int(durations.sum()) + open_us, len(times)
+
+    def daily_on_time(self, series: EventSeries, now_us: int) -> Tuple[List[int], List[int]]:
+        np = self.np
+        times, states = series.times, series.states
+        if len(times) == 0:
+            return [], []
+        days = times // DAY_US
+        new_day = days[1:] != days[:-1]
+        # Position of each event's day among the distinct days (times are sorted)
+        day_index = np.concatenate(([0], np.cumsum(new_day)))
+        distinct_days = days[np.concatenate(([True], new_day))]
+        closing, durations, open_us = self._on_intervals(times, states, now_us)
+        # Per-day sums stay far below 2**53, so the float64 weights are exact
+        totals = np.bincount(day_index[closing], weights=durations, minlength=len(distinct_days)).astype(np.int64)
+        totals[-1] += open_us
+        return distinct_days.tolist(), totals.tolist()
+
+    def outages(self, series: EventSeries, start_us: int, now_us: int) -> Outages:
+        np = self.np
+        times, states = self._window(series, start_us)
+        if len(times) == 0:
+            return Outages(0, 0)
+        starts = np.flatnonzero(states[:-1] > states[1:]) + 1
+        if states[0] == 0:
+            starts = np.concatenate(([0], starts))
+        if len(starts) == 0:
+            return Outages(0, 0)
+        # Starts and ends alternate, so the j-th end closes the j-th outage;
+        # one end short means the last outage is still going on
+        end_times = times[np.flatnonzero(states[:-1] < states[1:]) + 1]
+        if len(end_times) < len(starts):
+            end_times = np.concatenate((end_times, [now_us]))
+        return Outages(len(starts), int((end_times - times[starts]).max()))
+
+
+_backend = None
+
+
+def create_backend(name: Optional[str] = None):
+    """'numpy', 'python' or 'auto' (numpy if installed); defaults to ANALYTICS_BACKEND"""
+    name = (name or os.environ.get('ANALYTICS_BACKEND', 'auto')).lower()
+    if name == 'numpy' and not NUMPY_AVAILABLE:
+        raise RuntimeError('ANALYTICS_BACKEND=numpy but numpy is not installed')
+    if name == 'numpy' or (name == 'auto' and NUMPY_AVAILABLE):
+        return NumpyBackend()
+    return PythonBackend()
+
+
+def get_backend():
+    """Process-wide backend, created on first use"""
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+    return _backend
+
+
+def series_from_logs(logs: List, backend=None) -> EventSeries:
+    """EventSeries from storage_adapter power logs (sorted by timestamp)"""
+    backend = backend or get_backend()
+    return backend.series([to_us(log.timestamp) for log in logs],
+                          [1 if log.event_type == 'on' else 0 for log in logs])
+
+
+class SeriesBuffer:
+    """
+    One user's events in time order, kept between reports and appended to as
+    events are written. An append fills the next free slot and then publishes
+    a new (times, states, length) snapshot, so a reader's window is never
+    changed under it, without copying the history on each write.
+    """
+
+    def __init__(self, events: Sequence[Tuple[int, bool]] = (), backend=None):
+        self.backend = backend or get_backend()
+        series = self.backend.series([time_us for time_us, _ in events], [1 if on else 0 for _, on in events])
+        self._snapshot = (series.times, series.states, len(events))
+
+    def __len__(self) -> int:
+        return self._snapshot[2]
+
+    def append(self, time_us: int, on: bool) -> bool:
+        """Add an event; returns False, without adding it, if it is older than the latest one"""
+        times, states, length = self._snapshot
+        if length and time_us < times[length - 1]:
+            return False
+        times, states = self.backend.put(times, states, length, time_us, 1 if on else 0)
+        self._snapshot = (times, states, length + 1)
+        return True
+
+    def window(self, start_us: int, min_count: int = 0) -> EventSeries:
+        """Events from start_us on, extended back to at least min_count events"""
+        times, states, length = self._snapshot
+        first = min(self.backend.search(times, length, start_us), max(length - min_count, 0))
+        return self.backend.window(times, states, first, length)
@@ -1,44 +1,86 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from flask_mail import Mail, Message
-from datetime import datetime, timedelta
-try:
-    from flask_migrate import Migrate
-    FLASK_MIGRATE_AVAILABLE = True
-except ImportError:
-    FLASK_MIGRATE_AVAILABLE = False
-    Migrate = None
+from startup_timing import StartupTimer
+startup_timer = StartupTimer()
+
+import importlib.util
 import os
-import hashlib
-import jwt
-from functools import wraps
-import secrets
-import uuid
-import requests
-from dotenv import load_dotenv
-from database import init_db, STORAGE_MODE
-import database
-from region_mapper import infer_region_from_location
-from storage_adapter import (
-    get_user_by_username, get_user_by_email, create_user,
-    get_verification_code_by_email, get_verification_code_by_username,
-    create_or_update_verification_code, delete_verification_code,
-    create_power_log, get_power_logs_by_user, get_recent_power_logs,
-    create_device_id, get_device_ids_by_user, get_all_region_profiles
-)
+import time
+
+with startup_timer.phase('imports'):
+    from flask import Flask, request, jsonify, g, Response, send_file
+    from flask_cors import CORS
+    from datetime import datetime, timedelta, timezone
+    import csv
+    import hashlib
+    import io
+    import jwt
+    from functools import wraps
+    import logging
+    import secrets
+    import uuid
+    from dotenv import load_dotenv
+    from database import init_db, STORAGE_MODE
+    import database
+    from region_mapper import infer_region_from_location
+    from power_stats import stats_start_date, report_start_date, build_stats, build_report, region_power_summary
+    from email_queue import get_email_queue, STATUS_FAILED, STATUS_QUEUED
+    from password_hashing import hash_password, verify_password, needs_rehash
+    from auth_tokens import TokenService, TokenCache, TokenRevokedError
+    from rate_limiter import create_rate_limiter
+    from idempotency import create_idempotency_store, PROCEED, REPLAY, IN_PROGRESS
+    from structured_logging import setup_logging
+    from json_response import FastJSONProvider, create_compressor, accepted_encodings, gzip_stream
+    from event_bus import create_event_bus
+    from analytics import HOUR_US, to_us
+    from history_tiers import bucket_label
+    from supply_bitmaps import DAY_US, WEEKDAYS, grid_response
+    import metrics
+    from request_profiler import create_request_profiler, PROFILE_HEADER
+    from storage_adapter import (
+        get_user_by_username, get_user_by_email, create_user, update_user_password,
+        get_verification_code_by_email, get_verification_code_by_username,
+        create_or_update_verification_code, delete_verification_code, record_failed_verification,
+        create_power_log, create_power_logs, get_power_logs_by_user, get_recent_power_logs,
+        create_device_id, get_device_ids_by_user, get_all_region_profiles,
+        get_user_data_version, get_power_state, get_power_states, get_supply_bitmaps,
+        get_history_tiers, iter_power_logs_by_user, get_change_feed, get_event_series
+    )
+
+# Optional integrations are only probed here; they are imported on first use
+# (see get_google_cert_cache and get_mail) to keep cold starts fast
+FLASK_MIGRATE_AVAILABLE = importlib.util.find_spec('flask_migrate') is not None
 
 # Google OAuth
-try:
-    from google.auth.transport import requests as google_requests
-    from google.oauth2 import id_token
-    GOOGLE_AUTH_AVAILABLE = True
-except ImportError:
-    GOOGLE_AUTH_AVAILABLE = False
+GOOGLE_AUTH_AVAILABLE = importlib.util.find_spec('google') is not None and \
+    importlib.util.find_spec('google.auth') is not None
+if not GOOGLE_AUTH_AVAILABLE:
     print("⚠️  Google Auth libraries not available. Google OAuth will be disabled.")
 
+
+def get_google_cert_cache():
+    """Shared Google certificate cache (imports google-auth on first call)"""
+    from google_certs import get_google_cert_cache as _get_google_cert_cache
+    return _get_google_cert_cache()
+
+
 load_dotenv()
+setup_logging()
+
+# Named explicitly so LOG_LEVELS=app=DEBUG also works under `python app.py`
+logger = logging.getLogger('app')
+
+# FAST_STARTUP=true loads storage on a background thread so the first
+# request (e.g. the platform's health check) is answered right away
+FAST_STARTUP = os.environ.get('FAST_STARTUP', 'false').lower() == 'true'
 
 app = Flask(__name__)
+# orjson-backed jsonify (stdlib fallback) and gzip/brotli for larger responses
+app.json = FastJSONProvider(app)
+compressor = create_compressor()
+# Live updates for GET /api/events/stream
+event_bus = create_event_bus(app.json.dumps_bytes)
+metrics.REGISTRY.register(metrics.CallbackGauge(
+    'event_stream_subscribers', 'Open live event streams.', (),
+    lambda: {(): event_bus.subscriber_count()}))
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 
 # Email configuration
@@ -54,49 +96,79 @@ app.config['MAIL_SUPPRESS_SEND'] = os.environ.get('MAIL_SUPPRESS_SEND', 'false')
 # Add timeout settings for cloud deployment (Render, Railway, etc.)
 app.config['MAIL_TIMEOUT'] = 10  # 10 second timeout for SMTP operations
 
-try:
-    mail = Mail(app)
-except Exception as e:
-    print(f"⚠️  Warning: Mail initialization error: {str(e)}")
-    print("   Email functionality may not work, but continuing...")
-    mail = None
+# Access tokens are short-lived; clients renew them via /api/token/refresh
+with startup_timer.phase('token_service'):
+    token_service = TokenService(
+        app.config['SECRET_KEY'],
+        access_ttl=int(os.environ.get('ACCESS_TOKEN_TTL', 900)),
+        refresh_ttl=int(os.environ.get('REFRESH_TOKEN_TTL', 30 * 86400)),
+        cache=TokenCache(
+            max_entries=int(os.environ.get('TOKEN_CACHE_SIZE', 10000)),
+            ttl=float(os.environ.get('TOKEN_CACHE_TTL', 60))
+        )
+    )
+
+# Flask-Mail is initialized on first use; verification emails go through
+# the Resend queue, so most processes never need it
+mail = None
+
+
+def get_mail():
+    global mail
+    if mail is None:
+        try:
+            from flask_mail import Mail
+            mail = Mail(app)
+        except Exception as e:
+            print(f"⚠️  Warning: Mail initialization error: {str(e)}")
+            print("   Email functionality may not work, but continuing...")
+    return mail
+
 
 # Initialize file-based storage
 try:
-    init_db(app)
+    with startup_timer.phase('storage'):
+        init_db(app, background=FAST_STARTUP,
+                on_ready=(lambda seconds: startup_timer.record('storage_warmup', seconds)) if FAST_STARTUP else None)
 except Exception as e:
     print(f"❌ Fatal: Storage initialization failed: {str(e)}")
     print("   Application cannot start without storage")
     raise
 
 # CORS configuration - allow specific frontend URL in production, all origins in development
+# cors_origins is also read by asgi_app.py for its natively served routes
+cors_origins = '*'
 try:
-    frontend_url = os.environ.get('FRONTEND_URL', '*')
-    dev_origins_raw = os.environ.get('DEV_FRONTEND_URLS', 'http://localhost:3000,http://127.0.0.1:3000')
-    dev_origins = [url.strip() for url in dev_origins_raw.split(',') if url.strip()]
-    allow_dev_origins = os.environ.get('ALLOW_DEV_ORIGINS', 'true').lower() == 'true'
-
-    if frontend_url == '*':
-        # Development: allow all origins
-        CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
-        print("🌐 CORS: Allowing all origins (development mode)")
-    else:
-        # Production: allow specific frontend URL(s)
-        # Support multiple URLs separated by comma
-        origins = [url.strip() for url in frontend_url.split(',') if url.strip()]
-
-        if allow_dev_origins:
-            for dev_origin in dev_origins:
-                if dev_origin not in origins:
-                    origins.append(dev_origin)
-
-        CORS(
-            app,
-            resources={r"/api/*": {"origins": origins}},
-            supports_credentials=True,
-            allow_headers=['Content-Type', 'Authorization']
-        )
-        print(f"🌐 CORS: Allowing origins: {origins}")
+    with startup_timer.phase('cors'):
+        frontend_url = os.environ.get('FRONTEND_URL', '*')
+        dev_origins_raw = os.environ.get('DEV_FRONTEND_URLS', 'http://localhost:3000,http://127.0.0.1:3000')
+        dev_origins = [url.strip() for url in dev_origins_raw.split(',') if url.strip()]
+        allow_dev_origins = os.environ.get('ALLOW_DEV_ORIGINS', 'true').lower() == 'true'
+
+        if frontend_url == '*':
+            # Development: allow all origins
+            CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True,
+                 expose_headers=['Retry-After', 'X-Profile-Id', 'Idempotent-Replayed'])
+            print("🌐 CORS: Allowing all origins (development mode)")
+        else:
+            # Production: allow specific frontend URL(s)
+            # Support multiple URLs separated by comma
+            origins = [url.strip() for url in frontend_url.split(',') if url.strip()]
+
+            if allow_dev_origins:
+                for dev_origin in dev_origins:
+                    if dev_origin not in origins:
+                        origins.append(dev_origin)
+
+            cors_origins = origins
+            CORS(
+                app,
+                resources={r"/api/*": {"origins": origins}},
+                supports_credentials=True,
+                allow_headers=['Content-Type', 'Authorization', 'Idempotency-Key'],
+                expose_headers=['Retry-After', 'X-Profile-Id', 'Idempotent-Replayed']
+            )
+            print(f"🌐 CORS: Allowing origins: {origins}")
     print("✅ Application initialized successfully")
 except Exception as e:
     print(f"❌ Fatal: CORS initialization failed: {str(e)}")
@@ -106,6 +178,7 @@ except Exception as e:
 
 # Add a marker to confirm app module loaded completely
 print("✅ Flask app module loaded successfully - ready for gunicorn")
+routes_started = time.perf_counter()
 
 
 def resolve_region_id(location: str | None) -> str | None:
@@ -113,9 +186,6 @@ def resolve_region_id(location: str | None) -> str | None:
     return infer_region_from_location(location)
 
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
 def preview_value(value, length=20):
     """
     Safely preview sensitive values without causing slicing errors.
@@ -134,185 +204,168 @@ def preview_value(value, length=20):
 def generate_verification_code():
     return str(secrets.randbelow(1000000)).zfill(6)
 
+
+VERIFICATION_EMAIL_HTML = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body {{
+            font-family: Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+        }}
+        .container {{
+            max-width: 600px;
+            margin: 0 auto;
+            padding: 20px;
+            background-color: #f9f9f9;
+        }}
+        .header {{
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            padding: 20px;
+            text-align: center;
+            border-radius: 10px 10px 0 0;
+        }}
+        .content {{
+            background: white;
+            padding: 30px;
+            border-radius: 0 0 10px 10px;
+        }}
+        .code {{
+            font-size: 32px;
+            font-weight: bold;
+            color: #667eea;
+            text-align: center;
+            padding: 20px;
+            background: #f0f4ff;
+            border-radius: 8px;
+            margin: 20px 0;
+            letter-spacing: 5px;
+        }}
+        .footer {{
+            margin-top: 20px;
+            padding-top: 20px;
+            border-top: 1px solid #e0e0e0;
+            font-size: 12px;
+            color: #666;
+        }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🔌 Electricity Supply Logger</h1>
+        </div>
+        <div class="content">
+            <h2>Email Verification</h2>
+            <p>Thank you for registering! Please use the verification code below to verify your email address:</p>
+            <div class="code">{code}</div>
+            <p><strong>This code will expire in 10 minutes.</strong></p>
+            <p>If you didn't request this verification code, please ignore this email.</p>
+            <div class="footer">
+                <p>This is an automated message. Please do not reply to this email.</p>
+            </div>
+        </div>
+    </div>
+</body>
+</html>
+'''
+
+# Split the template once at import so each send is a plain concatenation
+_VERIFICATION_EMAIL_PREFIX, _VERIFICATION_EMAIL_SUFFIX = VERIFICATION_EMAIL_HTML.format(code='\0').split('\0')
+
+
+def render_verification_email(code):
+    return _VERIFICATION_EMAIL_PREFIX + code + _VERIFICATION_EMAIL_SUFFIX
+
+
 def send_verification_email(email, code):
     """
-    Send verification email to user using Resend API.
-    Returns True if email was sent successfully or if email is not configured (for development).
-    Returns False if email sending failed.
+    Queue a verification email for delivery via the Resend API.
+    Returns (email_sent, message_id). The request waits at most
+    EMAIL_SEND_WAIT_SECONDS for the first delivery attempt; after that the
+    email keeps going in the background and its outcome can be looked up
+    through /api/email-status/<message_id>.
+    email_sent is False when email is not configured or the first attempt
+    failed, so callers can fall back to the on-screen code.
     """
+    # Logs ship off-host, so they carry the recipient's domain and never the code
+    log_fields = {'email_domain': (email or '').rsplit('@', 1)[-1]}
     try:
         # Check if email sending is suppressed
         if app.config.get('MAIL_SUPPRESS_SEND'):
-            print(f"📧 MAIL_SUPPRESS_SEND enabled. Skipping actual email send for {email}. Verification code: {code}")
-            return True
+            logger.info('MAIL_SUPPRESS_SEND enabled, skipping verification email',
+                        extra=log_fields)
+            return True, None
         
         # Get Resend API key
         resend_api_key = os.environ.get('RESEND_API_KEY', '')
         resend_from_email = os.environ.get('RESEND_FROM_EMAIL', 'onboarding@resend.dev')
         
-        print(f"📧 Resend config check: RESEND_API_KEY={'SET' if resend_api_key else 'NOT SET'}, RESEND_FROM_EMAIL={resend_from_email}")
-        
         if not resend_api_key:
-            print(f"⚠️  RESEND_API_KEY not configured. Verification code for {email}: {code}")
-            print(f"   To enable email, set RESEND_API_KEY in your deployment platform's environment variables")
-            print(f"   Go to: Render/Railway Dashboard → Backend Service → Environment → Add RESEND_API_KEY")
-            return False  # Return False so fallback code is shown
-        
-        # Email HTML template
-        email_html = f'''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                }}
-                .container {{
-                    max-width: 600px;
-                    margin: 0 auto;
-                    padding: 20px;
-                    background-color: #f9f9f9;
-                }}
-                .header {{
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    padding: 20px;
-                    text-align: center;
-                    border-radius: 10px 10px 0 0;
-                }}
-                .content {{
-                    background: white;
-                    padding: 30px;
-                    border-radius: 0 0 10px 10px;
-                }}
-                .code {{
-                    font-size: 32px;
-                    font-weight: bold;
-                    color: #667eea;
-                    text-align: center;
-                    padding: 20px;
-                    background: #f0f4ff;
-                    border-radius: 8px;
-                    margin: 20px 0;
-                    letter-spacing: 5px;
-                }}
-                .footer {{
-                    margin-top: 20px;
-                    padding-top: 20px;
-                    border-top: 1px solid #e0e0e0;
-                    font-size: 12px;
-                    color: #666;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🔌 Electricity Supply Logger</h1>
-                </div>
-                <div class="content">
-                    <h2>Email Verification</h2>
-                    <p>Thank you for registering! Please use the verification code below to verify your email address:</p>
-                    <div class="code">{code}</div>
-                    <p><strong>This code will expire in 10 minutes.</strong></p>
-                    <p>If you didn't request this verification code, please ignore this email.</p>
-                    <div class="footer">
-                        <p>This is an automated message. Please do not reply to this email.</p>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        '''
-        
-        print(f"📧 Sending email via Resend API to {email}...")
-        
-        # Resend API endpoint
-        resend_url = "https://api.resend.com/emails"
-        
-        # Prepare email payload
-        payload = {
-            "from": resend_from_email,
-            "to": [email],
-            "subject": "Verify Your Email - Electricity Supply Logger",
-            "html": email_html
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {resend_api_key}",
-            "Content-Type": "application/json"
-        }
+            # Set RESEND_API_KEY in the deployment platform's environment to enable email
+            logger.warning('RESEND_API_KEY not configured, using on-screen verification code',
+                           extra=log_fields)
+            return False, None  # Return False so fallback code is shown
+        
+        status = get_email_queue().enqueue(
+            to=email,
+            subject="Verify Your Email - Electricity Supply Logger",
+            html=render_verification_email(code),
+            sender=resend_from_email,
+            context={'code': code}
+        )
+        log_fields['email_id'] = status['id']
+        logger.debug('Verification email queued', extra=log_fields)
         
-        # Send email via Resend API (with timeout)
-        try:
-            response = requests.post(
-                resend_url,
-                json=payload,
-                headers=headers,
-                timeout=10  # 10 second timeout
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✅ Verification email sent successfully to {email}")
-                print(f"   Resend email ID: {result.get('id', 'N/A')}")
-                return True
-            elif response.status_code == 403:
-                error_data = response.json() if response.content else {}
-                error_msg = error_data.get('message', f'HTTP {response.status_code}')
-                print(f"❌ Resend API 403 Forbidden: {error_msg}")
-                print(f"   Status code: {response.status_code}")
-                print(f"   Response: {error_data}")
-                print(f"   📧 Verification code for {email}: {code}")
-                print(f"   💡 Resend account is in testing mode. You can only send to your verified email.")
-                print(f"   💡 To send to any email, verify a domain at: https://resend.com/domains")
-                print(f"   💡 Or upgrade your Resend plan for production use.")
-                return False
-            else:
-                error_data = response.json() if response.content else {}
-                error_msg = error_data.get('message', f'HTTP {response.status_code}')
-                error_details = error_data.get('errors', [])
-                print(f"❌ Resend API error: {error_msg}")
-                print(f"   Status code: {response.status_code}")
-                print(f"   Response: {error_data}")
-                if error_details:
-                    print(f"   Error details: {error_details}")
-                print(f"   📧 Verification code for {email}: {code}")
-                print(f"   💡 Check RESEND_API_KEY is correct and has proper permissions")
-                return False
-                
-        except requests.exceptions.Timeout:
-            print(f"⚠️  Resend API timeout after 10 seconds")
-            print(f"   📧 Verification code for {email}: {code}")
-            return False
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Resend API request failed: {str(e)}")
-            print(f"   📧 Verification code for {email}: {code}")
-            return False
+        wait_seconds = float(os.environ.get('EMAIL_SEND_WAIT_SECONDS', 2))
+        if wait_seconds > 0:
+            status = get_email_queue().wait(status['id'], wait_seconds) or status
         
-    except Exception as e:
-        error_msg = str(e)
-        error_type = type(e).__name__
-        print(f"❌ Error sending email to {email}")
-        print(f"   Error type: {error_type}")
-        print(f"   Error message: {error_msg}")
+        # A failed first attempt keeps retrying in the background, but the
+        # on-screen code lets the user continue right away
+        email_sent = not (status['status'] == STATUS_FAILED or
+                          (status['status'] == STATUS_QUEUED and status['attempts'] > 0))
+        if not email_sent:
+            logger.warning('Verification email not delivered yet, using on-screen code',
+                           extra={**log_fields, 'status': status['status']})
+        return email_sent, status['id']
         
-        # In development, print the code so registration can continue
-        print(f"   📧 Verification code for {email}: {code}")
-        print(f"   ⚠️  Email sending failed, but code is displayed above for development")
+    except Exception:
+        logger.exception('Error queueing verification email', extra=log_fields)
         
         # Return False to indicate email sending failed
         # But still allow the code to be used (code is saved in database)
-        return False
+        return False, None
 
 def generate_token(user_id):
-    token = jwt.encode({'user_id': user_id}, app.config['SECRET_KEY'], algorithm='HS256')
-    # PyJWT 2.0+ returns string directly, but handle both cases
-    if isinstance(token, bytes):
-        return token.decode('utf-8')
-    return token
+    return token_service.issue_access_token(user_id)
+
+def generate_refresh_token(user_id):
+    return token_service.issue_refresh_token(user_id)
+
+def authenticate_token(auth_header):
+    """
+    Resolve an Authorization header to a username.
+    Returns (current_user, None) on success or (None, error_message).
+    """
+    if not auth_header:
+        return None, 'Token is missing'
+    
+    try:
+        token = auth_header[7:] if auth_header.startswith('Bearer ') else auth_header
+        data = token_service.verify_access_token(token)
+        return data['user_id'], None
+    except jwt.ExpiredSignatureError:
+        return None, 'Token has expired'
+    except TokenRevokedError:
+        return None, 'Token has been revoked'
+    except jwt.InvalidTokenError as e:
+        return None, f'Token is invalid: {str(e)}'
+    except Exception as e:
+        return None, f'Authentication error: {str(e)}'
 
 def token_required(f):
     @wraps(f)
@@ -321,32 +374,243 @@ def token_required(f):
         if request.method == 'OPTIONS':
             return jsonify({}), 200
         
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
+        current_user, error = authenticate_token(request.headers.get('Authorization'))
+        if error:
+            return jsonify({'error': error}), 401
+        
+        return f(current_user, *args, **kwargs)
+    return decorated
+
+# Token-bucket limits per endpoint: (key type, capacity, period in seconds).
+# A request must have a token left in every bucket that applies to it.
+RATE_LIMITS = {
+    'register': [('ip', 10, 3600), ('email', 3, 600), ('username', 3, 600)],
+    'resend_verification': [('ip', 10, 600), ('email', 3, 600)],
+    'login': [('ip', 30, 300), ('username', 10, 300)],
+    'log_power': [('ip', 120, 60), ('user', 30, 60)],
+    'log_power_batch': [('ip', 30, 60), ('user', 10, 60)],
+    'export': [('user', 10, 3600)],
+}
+
+rate_limiter = create_rate_limiter()
+
+def client_ip():
+    """Client address, taking the reverse proxy's X-Forwarded-For entry into account"""
+    trusted_proxies = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 1))
+    forwarded = [ip.strip() for ip in request.headers.get('X-Forwarded-For', '').split(',') if ip.strip()]
+    if trusted_proxies > 0 and forwarded:
+        return forwarded[-min(trusted_proxies, len(forwarded))]
+    return request.remote_addr or 'unknown'
+
+def rate_limited(endpoint):
+    """Reject requests over the RATE_LIMITS budget for `endpoint` with 429 + Retry-After"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if request.method == 'OPTIONS':
+                return f(*args, **kwargs)
+            
+            data = request.get_json(silent=True) or {}
+            keys = {
+                'ip': client_ip(),
+                'user': args[0] if args else None,  # current_user from token_required
+                'username': data.get('username') if isinstance(data, dict) else None,
+                'email': data.get('email') if isinstance(data, dict) else None,
+            }
+            if endpoint == 'login' and not keys['username']:
+                keys['username'] = keys['email']
+            
+            buckets = [
+                (f"{endpoint}:{key_type}:{str(keys[key_type]).strip().lower()}", capacity, period)
+                for key_type, capacity, period in RATE_LIMITS[endpoint]
+                if keys.get(key_type)
+            ]
+            retry_after = rate_limiter.hit(buckets)
+            if retry_after:
+                response = jsonify({
+                    'error': 'Too many requests. Please try again later.',
+                    'retry_after': retry_after
+                })
+                response.headers['Retry-After'] = str(retry_after)
+                return response, 429
+            
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+idempotency_store = create_idempotency_store()
+
+def idempotent(f):
+    """
+    Honour an Idempotency-Key header: the first 2xx response for a key is
+    replayed for repeats of the same request (see idempotency.py).
+    Goes below token_required, which supplies current_user.
+    """
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if request.method == 'OPTIONS' or not key:
+            return f(current_user, *args, **kwargs)
+        if len(key) > 128:
+            return jsonify({'error': 'Idempotency-Key must be at most 128 characters'}), 400
+        
+        scoped_key = f'{current_user}:{request.endpoint}:{key}'
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        outcome, stored = idempotency_store.begin(scoped_key, fingerprint)
+        if outcome == REPLAY:
+            response = app.response_class(stored.body, status=stored.status, mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        if outcome == IN_PROGRESS:
+            return jsonify({'error': 'A request with this Idempotency-Key is still being processed'}), 409
+        if outcome != PROCEED:
+            return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
         
         try:
-            if token.startswith('Bearer '):
-                token = token[7:]
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = data['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError as e:
-            return jsonify({'error': f'Token is invalid: {str(e)}'}), 401
-        except Exception as e:
-            return jsonify({'error': f'Authentication error: {str(e)}'}), 401
+            response = app.make_response(f(current_user, *args, **kwargs))
+        except Exception:
+            idempotency_store.abort(scoped_key)
+            raise
+        # Only successes are remembered; errors (including 429s) can be retried
+        if 200 <= response.status_code < 300:
+            idempotency_store.complete(scoped_key, response.status_code, response.get_data(as_text=True))
+        else:
+            idempotency_store.abort(scoped_key)
+        return response
+    return decorated
+
+def admin_required(f):
+    """Require 'Authorization: Bearer <ADMIN_TOKEN>'; admin routes are disabled when ADMIN_TOKEN is unset"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if request.method == 'OPTIONS':
+            return jsonify({}), 200
         
-        return f(current_user, *args, **kwargs)
+        admin_token = os.environ.get('ADMIN_TOKEN', '')
+        if not admin_token:
+            return jsonify({'error': 'Admin API is disabled'}), 404
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {admin_token}'):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
     return decorated
 
+# Requests are profiled when they carry a signed X-Profile header or are
+# sampled (PROFILE_SAMPLE_RATE); see request_profiler.py
+request_profiler = create_request_profiler()
+
+# Request metrics (exposed at /metrics) and profiling
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if request_profiler.enabled:
+        g.profiler = request_profiler.start(request.headers.get(PROFILE_HEADER))
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        duration = time.perf_counter() - started
+        # Label by route template (e.g. /api/email-status/<email_id>) to keep cardinality bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(request.method, route, response.status_code, duration)
+        
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            request_profiler.stop(profiler)
+            try:
+                profile_id = request_profiler.save(profiler, request.method, route, request.path,
+                                                   response.status_code, duration * 1000)
+                response.headers['X-Profile-Id'] = profile_id
+            except Exception as e:
+                logger.warning('Could not save request profile', extra={'error': str(e)})
+    return response
+
+@app.after_request
+def compress_response(response):
+    # Registered after the metrics hook, so it runs first and its cost is included in request latency
+    return compressor.compress_response(response, request.headers.get('Accept-Encoding'))
+
+@app.teardown_request
+def stop_request_profiler(exc):
+    # Only still set if after_request didn't run
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        request_profiler.stop(profiler)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint; requires 'Bearer <METRICS_TOKEN>' when METRICS_TOKEN is set"""
+    metrics_token = os.environ.get('METRICS_TOKEN', '')
+    if metrics_token and not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {metrics_token}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/admin/profiles', methods=['GET', 'OPTIONS'])
+@admin_required
+def list_profiles():
+    """Recent request profiles, newest first"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'profiles': request_profiler.list_profiles(limit)}), 200
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET', 'OPTIONS'])
+@admin_required
+def download_profile(profile_id):
+    """Raw .pstats file for one profile"""
+    path = request_profiler.profile_path(profile_id)
+    if not path:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f'{profile_id}.pstats')
+
+CHANGE_FEED_MAX_LIMIT = 1000
+CHANGE_FEED_MAX_WAIT = float(os.environ.get('CHANGE_FEED_MAX_WAIT', 30))
+
+@app.route('/api/admin/changes', methods=['GET', 'OPTIONS'])
+@admin_required
+def list_changes():
+    """
+    Power log changes after seq `after`, oldest first (see change_feed.py).
+    With `wait` (seconds) a caught-up consumer is held until a change arrives,
+    except on a sync WSGI worker, where it is answered at once and should poll.
+    """
+    feed = get_change_feed()
+    if feed is None:
+        return jsonify({'error': 'Change feed is disabled'}), 404
+    after = request.args.get('after', 0, type=int)
+    limit = request.args.get('limit', 100, type=int)
+    wait = request.args.get('wait', 0, type=float)
+    if after < 0 or limit < 1 or wait < 0:
+        return jsonify({'error': 'after, limit and wait must be non-negative numbers'}), 400
+    latest_seq = feed.latest_seq
+    if after > latest_seq:
+        # The consumer is ahead of the journal, so it was reset; start over from 0
+        return jsonify({'error': 'after is beyond the latest change', 'latest_seq': latest_seq}), 409
+    try:
+        # Holding the request would block every other request on a sync worker
+        max_wait = CHANGE_FEED_MAX_WAIT if can_hold_request() else 0
+        changes = feed.read(after, min(limit, CHANGE_FEED_MAX_LIMIT), min(wait, max_wait))
+    except Exception:
+        logger.exception('Error in list_changes')
+        return jsonify({'error': 'Failed to read changes'}), 500
+    next_after = changes[-1]['seq'] if changes else after
+    latest_seq = feed.latest_seq
+    return jsonify({
+        'changes': changes,
+        'next_after': next_after,
+        'latest_seq': latest_seq,
+        'has_more': next_after < latest_seq,
+    }), 200
+
 @app.route('/', methods=['GET'])
 def health_check():
     try:
-        # Test file storage
-        from file_storage import get_file_storage
-        storage = get_file_storage()
-        storage_status = 'connected (file storage)'
+        # Test file storage without waiting for a background warm-up
+        from file_storage import get_file_storage, is_file_storage_ready
+        if FAST_STARTUP and not is_file_storage_ready():
+            storage_status = 'warming up (file storage)'
+        else:
+            storage = get_file_storage()
+            storage_status = 'connected (file storage)'
     except Exception as e:
         storage_status = f'error: {str(e)}'
     
@@ -354,16 +618,30 @@ def health_check():
         'status': 'ok',
         'message': 'Electricity Supply Logger API is running',
         'storage': storage_status,
+        'startup': startup_timer.summary(),
         'endpoints': {
             'register': '/api/register',
             'login': '/api/login',
+            'token-refresh': '/api/token/refresh',
+            'logout': '/api/logout',
             'verify-email': '/api/verify-email',
             'verify-device': '/api/verify-device',
             'resend-verification': '/api/resend-verification',
+            'email-status': '/api/email-status/<email_id>',
             'log-power': '/api/log-power',
+            'log-power-batch': '/api/log-power/batch',
             'stats': '/api/stats',
             'recent-events': '/api/recent-events',
-            'report': '/api/report'
+            'report': '/api/report',
+            'dashboard': '/api/dashboard',
+            'status': '/api/status',
+            'region-status': '/api/status/regions',
+            'heatmap': '/api/heatmap',
+            'region-percentile': '/api/region-stats/percentile',
+            'history': '/api/history',
+            'export': '/api/export',
+            'events-stream': '/api/events/stream',
+            'metrics': '/metrics'
         }
     }), 200
 
@@ -377,17 +655,19 @@ def api_info():
     }), 200
 
 @app.route('/api/register', methods=['POST', 'OPTIONS'])
+@rate_limited('register')
 def register():
     if request.method == 'OPTIONS':
-        print("📨 Received OPTIONS request for /api/register")
         return jsonify({}), 200
     
-    print(f"📨 Received POST request to /api/register from origin: {request.headers.get('Origin', 'unknown')}")
     try:
         data = request.get_json() or request.json
-        print(f"📨 Request data received: username={data.get('username') if data else 'None'}, email={data.get('email') if data else 'None'}")
+        logger.debug('Register request', extra={
+            'origin': request.headers.get('Origin'),
+            'username': data.get('username') if data else None,
+            'email': data.get('email') if data else None
+        })
         if not data:
-            print("❌ No JSON data in request")
             return jsonify({'error': 'Invalid JSON data'}), 400
         
         username = data.get('username', '').strip() if data.get('username') else ''
@@ -406,29 +686,27 @@ def register():
             return jsonify({'error': 'Username can only contain letters, numbers, underscores, and hyphens'}), 400
         
         # Check if username already exists in User table
-        print(f"🔍 Checking if username '{username}' exists...")
         existing_user = get_user_by_username(username)
         if existing_user:
-            print(f"⚠️  Username '{username}' already exists (Email: {existing_user.email})")
+            logger.info('Register rejected: username exists', extra={'username': username})
             return jsonify({'error': 'Username already exists'}), 400
-        print(f"✅ Username '{username}' is available")
         
         # Also check if username is in pending verification codes (to prevent duplicate registrations)
         existing_verif_username = get_verification_code_by_username(username)
         if existing_verif_username:
             # Check if it's expired - if expired, allow new registration
             if existing_verif_username.is_expired():
-                print(f"ℹ️  Found expired verification code for username '{username}', allowing new registration")
+                logger.debug('Replacing expired pending registration', extra={'username': username})
                 # Delete expired verification code
                 delete_verification_code(existing_verif_username.email)
             else:
-                print(f"⚠️  Username '{username}' is pending verification (not expired yet)")
+                logger.info('Register rejected: username pending verification', extra={'username': username})
                 return jsonify({'error': 'Username is already being registered. Please complete verification or wait for the code to expire.'}), 400
         
         # Check if email is already registered (and verified) in User table
         existing_email = get_user_by_email(email)
         if existing_email:
-            print(f"⚠️  Email '{email}' already exists")
+            logger.info('Register rejected: email exists', extra={'email': email})
             return jsonify({'error': 'Email already registered'}), 400
         
         # Email verification flow
@@ -448,10 +726,11 @@ def register():
         }
         create_or_update_verification_code(verif_code_data)
         
-        # Attempt to send email (non-blocking - don't wait for it)
-        print(f"📧 Attempting to send verification email to {email}...")
-        email_sent = send_verification_email(email, verification_code)
-        print(f"📧 Email sending result: {email_sent}")
+        # Queue the email (delivery continues in the background)
+        email_sent, email_id = send_verification_email(email, verification_code)
+        logger.info('Registration pending verification', extra={
+            'username': username, 'email': email, 'email_sent': email_sent, 'email_id': email_id
+        })
         
         # Return response immediately (don't wait for email)
         response_data = {
@@ -459,19 +738,19 @@ def register():
             'requires_verification': True,
             'email': email
         }
+        if email_id:
+            response_data['email_id'] = email_id
         
         # If email sending failed, include code in response (on-screen verification)
         if not email_sent:
             response_data['fallback_code'] = verification_code
             response_data['message'] = 'Please use the verification code displayed on screen to verify your email address.'
-            print(f"📱 On-screen verification code displayed for {email}: {verification_code}")
-            print(f"   This is a valid verification method - no email delivery needed.")
         
         return jsonify(response_data), 200
             
     except ValueError as e:
         error_msg = str(e)
-        print(f"❌ Validation error in register: {error_msg}")
+        logger.warning('Validation error in register', extra={'error': error_msg})
         # Check what specific constraint was violated
         if 'username' in error_msg.lower() or 'users_username_key' in error_msg:
             return jsonify({'error': 'Username already exists'}), 400
@@ -484,13 +763,11 @@ def register():
             return jsonify({'error': 'Database constraint violation. Username or email may already exist.'}), 400
     except Exception as e:
         error_msg = str(e)
-        error_type = type(e).__name__
-        print(f"❌ Unexpected error in register: {error_type}: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Unexpected error in register')
         return jsonify({'error': f'An error occurred during registration: {error_msg}'}), 500
 
 @app.route('/api/login', methods=['POST', 'OPTIONS'])
+@rate_limited('login')
 def login():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
@@ -515,12 +792,20 @@ def login():
         if not user:
             return jsonify({'error': 'Invalid credentials'}), 401
         
-        if user.password != hash_password(password):
+        if not verify_password(password, user.password):
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        # Transparently upgrade legacy SHA-256 hashes (or old KDF cost settings)
+        if needs_rehash(user.password):
+            try:
+                update_user_password(user.username, hash_password(password))
+            except Exception as e:
+                logger.warning('Could not upgrade password hash', extra={'username': user.username, 'error': str(e)})
+        
         # TEMPORARILY DISABLED: Device verification removed for now
         # Allow login directly without device verification
         token = generate_token(user.username)
+        refresh_token = generate_refresh_token(user.username)
         
         # Store device ID if provided
         if device_id:
@@ -537,18 +822,81 @@ def login():
         return jsonify({
             'message': 'Login successful',
             'token': token,
+            'refresh_token': refresh_token,
             'username': user.username
         }), 200
                 
     except Exception as e:
         error_msg = str(e)
-        print(f"❌ Error in login: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error in login')
         return jsonify({'error': f'An error occurred during login: {error_msg}'}), 500
 
+@app.route('/api/token/refresh', methods=['POST', 'OPTIONS'])
+def refresh_access_token():
+    """Exchange a refresh token for a new access token (the refresh token is rotated)"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        refresh_token = data.get('refresh_token')
+        if not refresh_token:
+            return jsonify({'error': 'Refresh token is required'}), 400
+        
+        try:
+            claims = token_service.decode(refresh_token, 'refresh')
+        except jwt.ExpiredSignatureError:
+            return jsonify({'error': 'Refresh token has expired'}), 401
+        except TokenRevokedError:
+            return jsonify({'error': 'Refresh token has been revoked'}), 401
+        except jwt.InvalidTokenError as e:
+            return jsonify({'error': f'Refresh token is invalid: {str(e)}'}), 401
+        
+        # Rotate: a refresh token can only be used once
+        token_service.revoke(claims)
+        username = claims['user_id']
+        return jsonify({
+            'token': generate_token(username),
+            'refresh_token': generate_refresh_token(username),
+            'username': username
+        }), 200
+        
+    except Exception as e:
+        logger.exception('Error in refresh_access_token')
+        return jsonify({'error': 'An error occurred while refreshing the token'}), 500
+
+@app.route('/api/logout', methods=['POST', 'OPTIONS'])
+def logout():
+    """Revoke the caller's access token and, if supplied, their refresh token"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        tokens = [(data.get('refresh_token'), 'refresh')]
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            tokens.append((auth_header[7:], 'access'))
+        
+        for token, token_type in tokens:
+            if not token:
+                continue
+            try:
+                token_service.revoke(token_service.decode(token, token_type))
+            except jwt.InvalidTokenError:
+                # Already expired, revoked or malformed - nothing to revoke
+                pass
+        
+        return jsonify({'message': 'Logged out'}), 200
+        
+    except Exception as e:
+        logger.exception('Error in logout')
+        return jsonify({'error': 'An error occurred during logout'}), 500
+
 @app.route('/api/log-power', methods=['POST', 'OPTIONS'])
 @token_required
+@idempotent
+@rate_limited('log_power')
 def log_power(current_user):
     try:
         data = request.get_json() or request.json
@@ -561,6 +909,14 @@ def log_power(current_user):
         if event_type not in ['on', 'off']:
             return jsonify({'error': 'event_type must be "on" or "off"'}), 400
         
+        # A second "on" while power is already on would skew supply hours
+        state = get_power_state(current_user)
+        if state and state['event_type'] == event_type:
+            return jsonify({
+                'error': f'Power is already {event_type}',
+                'since': state['timestamp']
+            }), 409
+        
         # Get user
         user = get_user_by_username(current_user)
         if not user:
@@ -586,6 +942,7 @@ def log_power(current_user):
             'auto_generated': False
         }
         create_power_log(log_data)
+        publish_power_logs(current_user, [log_data])
         
         return jsonify({
             'message': f'Power {event_type} logged successfully',
@@ -596,11 +953,116 @@ def log_power(current_user):
         
     except Exception as e:
         error_msg = str(e)
-        print(f"❌ Error in log_power: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error in log_power')
         return jsonify({'error': f'An error occurred while logging power event: {error_msg}'}), 500
 
+# Offline clients replay queued events through /api/log-power/batch
+LOG_POWER_BATCH_MAX = int(os.environ.get('LOG_POWER_BATCH_MAX', 500))
+LOG_POWER_BATCH_MAX_AGE = timedelta(days=int(os.environ.get('LOG_POWER_BATCH_MAX_AGE_DAYS', 30)))
+CLIENT_CLOCK_SKEW = timedelta(minutes=5)
+# Region notices are only sent for events at most this old
+REGION_NOTICE_MAX_AGE = timedelta(minutes=15)
+
+def parse_client_timestamp(value):
+    """ISO 8601 timestamp from a client as naive UTC (the storage convention), or None"""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+@app.route('/api/log-power/batch', methods=['POST', 'OPTIONS'])
+@token_required
+@rate_limited('log_power_batch')
+def log_power_batch(current_user):
+    """
+    Log events recorded while offline, in one storage write.
+    Body: {"events": [{"event_type", "timestamp", "idempotency_key"?, "location"?}, ...]}
+    Events must be in chronological order. Each gets a result with status
+    created, duplicate (its idempotency_key was already logged) or rejected.
+    """
+    try:
+        data = request.get_json(silent=True)
+        events = data.get('events') if isinstance(data, dict) else None
+        if not isinstance(events, list) or not events:
+            return jsonify({'error': 'events must be a non-empty list'}), 400
+        if len(events) > LOG_POWER_BATCH_MAX:
+            return jsonify({'error': f'At most {LOG_POWER_BATCH_MAX} events per batch'}), 400
+        
+        user = get_user_by_username(current_user)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        now = datetime.utcnow()
+        regions = {}
+        results = [None] * len(events)
+        accepted = []
+        previous = None
+        for index, item in enumerate(events):
+            if not isinstance(item, dict):
+                results[index] = {'index': index, 'status': 'rejected', 'error': 'Event must be an object'}
+                continue
+            event_type = item.get('event_type')
+            timestamp = parse_client_timestamp(item.get('timestamp'))
+            key = item.get('idempotency_key')
+            error = None
+            if event_type not in ['on', 'off']:
+                error = 'event_type must be "on" or "off"'
+            elif timestamp is None:
+                error = 'timestamp must be an ISO 8601 string'
+            elif timestamp > now + CLIENT_CLOCK_SKEW:
+                error = 'timestamp is in the future'
+            elif timestamp < now - LOG_POWER_BATCH_MAX_AGE:
+                error = 'timestamp is too old'
+            elif previous is not None and timestamp < previous:
+                error = 'events must be in chronological order'
+            elif key is not None and (not isinstance(key, str) or not 0 < len(key) <= 128):
+                error = 'idempotency_key must be a string of 1-128 characters'
+            if error:
+                results[index] = {'index': index, 'status': 'rejected', 'error': error}
+                continue
+            previous = timestamp
+            
+            location = item.get('location') or user.location or ''
+            if location not in regions:
+                regions[location] = resolve_region_id(location) or user.region_id
+            accepted.append((index, {
+                'user_id': current_user,
+                'event_type': event_type,
+                'timestamp': timestamp,
+                'date': timestamp.date(),
+                'location': location,
+                'region_id': regions[location],
+                'auto_generated': False,
+                'idempotency_key': key
+            }))
+        
+        stored = create_power_logs([log_data for _, log_data in accepted]) if accepted else []
+        created = []
+        for (index, _), (log, was_created) in zip(accepted, stored):
+            results[index] = {
+                'index': index,
+                'status': 'created' if was_created else 'duplicate',
+                'id': log.get('id'),
+                'timestamp': log.get('timestamp')
+            }
+            if was_created:
+                created.append(log)
+        if created:
+            publish_power_logs(current_user, created)
+        
+        counts = {status: sum(1 for result in results if result['status'] == status)
+                  for status in ('created', 'duplicate', 'rejected')}
+        return jsonify({'results': results, **counts}), 200
+        
+    except Exception as e:
+        logger.exception('Error in log_power_batch')
+        return jsonify({'error': 'An error occurred while logging power events'}), 500
+
 @app.route('/api/stats', methods=['GET', 'OPTIONS'])
 @token_required
 def get_stats(current_user):
@@ -612,94 +1074,15 @@ def get_stats(current_user):
         
         # Calculate date range
         now = datetime.utcnow()
-        if period == 'day':
-            start_date = now.date()
-        elif period == 'week':
-            start_date = (now - timedelta(days=7)).date()
-        elif period == 'month':
-            start_date = (now - timedelta(days=30)).date()
-        else:
-            start_date = (now - timedelta(days=7)).date()
+        start_date = stats_start_date(period, now)
         
         # Get power logs for user
-        logs = get_power_logs_by_user(current_user, start_date=start_date, end_date=end_date)
+        logs = get_power_logs_by_user(current_user, start_date=start_date)
         
-        # Convert to dictionaries
-        log_dicts = [log.to_dict() if hasattr(log, 'to_dict') else log for log in logs]
-        
-        # Calculate hours per day
-        daily_stats = {}
-        current_on_time = None
-        
-        for log in logs:
-            log_time = log.timestamp
-            log_date = log_time.date().isoformat()
-            
-            if log_date not in daily_stats:
-                daily_stats[log_date] = {'hours': 0, 'events': []}
-            
-            daily_stats[log_date]['events'].append({
-                'type': log.event_type,
-                'timestamp': log.timestamp.isoformat()
-            })
-            
-            if log.event_type == 'on':
-                current_on_time = log_time
-            elif log.event_type == 'off' and current_on_time:
-                duration = (log_time - current_on_time).total_seconds() / 3600
-                daily_stats[log_date]['hours'] += duration
-                current_on_time = None
-        
-        # If power is still on, calculate until now
-        if current_on_time:
-            last_date = logs[-1].date.isoformat() if logs else now.date().isoformat()
-            if last_date in daily_stats:
-                duration = (now - current_on_time).total_seconds() / 3600
-                daily_stats[last_date]['hours'] += duration
-        
-        # Calculate total hours
-        total_hours = sum(day['hours'] for day in daily_stats.values())
-        
-        # Format for chart
-        chart_data = []
-        for date, stats in sorted(daily_stats.items()):
-            chart_data.append({
-                'date': date,
-                'hours': round(stats['hours'], 2)
-            })
-
-        # Determine region info
-        region_info = None
-        if user and hasattr(user, 'region_id') and user.region_id:
-            all_regions = get_all_region_profiles()
-            region_profile = next((r for r in all_regions if (r.get('id') if isinstance(r, dict) else getattr(r, 'id', None)) == user.region_id), None)
-            if region_profile:
-                if isinstance(region_profile, dict):
-                    region_info = {
-                        'id': region_profile.get('id'),
-                        'name': region_profile.get('disco_name'),
-                        'states': region_profile.get('states', []),
-                        'source': region_profile.get('source', 'NERC Q2 2025')
-                    }
-                else:
-                    region_info = {
-                        'id': region_profile.id,
-                        'name': region_profile.disco_name,
-                        'states': region_profile.states,
-                        'source': region_profile.source
-                    }
-        
-        return jsonify({
-            'period': period,
-            'total_hours': round(total_hours, 2),
-            'daily_stats': chart_data,
-            'events': [log.to_dict() for log in logs[-20:]],  # Last 20 events
-            'region': region_info,
-            'location': user.location if user else None
-        }), 200
+        return jsonify(build_stats(logs, period, now, user, get_all_region_profiles())), 200
         
     except Exception as e:
-        print(f"Error in get_stats: {str(e)}")
+        logger.exception('Error in get_stats')
         return jsonify({'error': 'An error occurred while fetching statistics'}), 500
 
 @app.route('/api/recent-events', methods=['GET', 'OPTIONS'])
@@ -718,85 +1101,430 @@ def get_recent_events(current_user):
         
     except Exception as e:
         error_msg = str(e)
-        print(f"❌ Error in get_recent_events: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error in get_recent_events')
         return jsonify({'error': f'An error occurred while fetching recent events: {error_msg}'}), 500
 
+def recent_window_logs(user_id, now, min_count=1):
+    """
+    The user's logs since report_start_date, topped up with older ones to at
+    least min_count so the latest event still shows after a quiet month.
+    The dashboard only needs this window, so archived months aren't read for it.
+    """
+    logs = get_power_logs_by_user(user_id, start_date=report_start_date(now))
+    if len(logs) < min_count:
+        # Newest first under PostgreSQL
+        logs = sorted(get_recent_power_logs(user_id, limit=min_count), key=lambda log: log.timestamp)
+    return logs
+
 @app.route('/api/report', methods=['GET', 'OPTIONS'])
 @token_required
 def get_report(current_user):
     try:
-        # Get all power logs for user
-        logs = get_power_logs_by_user(current_user)
-        
         now = datetime.utcnow()
+        return jsonify(build_report(get_event_series(current_user, report_start_date(now)), now)), 200
         
-        # Calculate stats for different periods
-        def calculate_period_stats(days):
-            start_date = (now - timedelta(days=days)).date()
-            filtered = [log for log in logs if log.date >= start_date]
-            
-            current_on_time = None
-            total_hours = 0
-            
-            for log in filtered:
-                log_time = log.timestamp
-                if log.event_type == 'on':
-                    current_on_time = log_time
-                elif log.event_type == 'off' and current_on_time:
-                    duration = (log_time - current_on_time).total_seconds() / 3600
-                    total_hours += duration
-                    current_on_time = None
-            
-            # If power is still on, calculate until now
-            if current_on_time and filtered:
-                duration = (now - current_on_time).total_seconds() / 3600
-                total_hours += duration
-            
-            return round(total_hours, 2), len(filtered)
-        
-        today_hours, today_events = calculate_period_stats(1)
-        week_hours, week_events = calculate_period_stats(7)
-        month_hours, month_events = calculate_period_stats(30)
-        
-        # Get last event
-        if logs:
-            last_log = logs[-1]
-            last_event_time = last_log.timestamp
-            last_event_type = last_log.event_type
-            time_ago = now - last_event_time
-            hours_ago = round(time_ago.total_seconds() / 3600, 1)
+    except Exception as e:
+        logger.exception('Error in get_report')
+        return jsonify({'error': 'An error occurred while fetching report'}), 500
+
+# Regional "currently on" figures only count users who reported within this
+# window, and are recomputed at most every REGION_STATUS_CACHE_SECONDS
+REGION_STATUS_MAX_AGE = timedelta(hours=float(os.environ.get('REGION_STATUS_MAX_AGE_HOURS', 24)))
+REGION_STATUS_CACHE_SECONDS = float(os.environ.get('REGION_STATUS_CACHE_SECONDS', 10))
+_region_status_cache = (0.0, {})
+
+def current_region_power():
+    """region_power_summary over all users' current states, cached briefly"""
+    global _region_status_cache
+    computed_at, summary = _region_status_cache
+    if time.monotonic() - computed_at > REGION_STATUS_CACHE_SECONDS:
+        summary = region_power_summary(get_power_states(), datetime.utcnow(), REGION_STATUS_MAX_AGE)
+        _region_status_cache = (time.monotonic(), summary)
+    return summary
+
+@app.route('/api/status', methods=['GET', 'OPTIONS'])
+@token_required
+def get_status(current_user):
+    """Whether the user's power is on now, and how much of their region has power"""
+    try:
+        state = get_power_state(current_user)
+        region_id = state.get('region_id') if state else None
+        if not region_id:
+            user = get_user_by_username(current_user)
+            region_id = user.region_id if user else None
+        
+        hours = None
+        if state:
+            since = datetime.fromisoformat(state['timestamp'])
+            hours = round((datetime.utcnow() - since).total_seconds() / 3600, 2)
+        
+        region = None
+        if region_id:
+            region = current_region_power().get(region_id) or \
+                {'region_id': region_id, 'users_reporting': 0, 'users_on': 0, 'on_percent': None}
+        
+        return jsonify({
+            'power': state['event_type'] if state else None,
+            'since': state['timestamp'] if state else None,
+            'hours_in_state': hours,
+            'region': region
+        }), 200
+        
+    except Exception as e:
+        logger.exception('Error in get_status')
+        return jsonify({'error': 'An error occurred while fetching power status'}), 500
+
+@app.route('/api/status/regions', methods=['GET', 'OPTIONS'])
+@token_required
+def get_region_status(current_user):
+    """Share of recently reporting users with power on, for every region"""
+    try:
+        regions = sorted(current_region_power().values(), key=lambda region: region['region_id'])
+        return jsonify({
+            'regions': regions,
+            'window_hours': REGION_STATUS_MAX_AGE.total_seconds() / 3600
+        }), 200
+        
+    except Exception as e:
+        logger.exception('Error in get_region_status')
+        return jsonify({'error': 'An error occurred while fetching region status'}), 500
+
+# Region heatmaps add up every user in the region, so they are cached for
+# HEATMAP_CACHE_SECONDS; a user's own grid is cheap and always fresh
+HEATMAP_CACHE_SECONDS = float(os.environ.get('HEATMAP_CACHE_SECONDS', 60))
+_region_heatmap_cache = {}
+
+def region_heatmap(bitmaps, region_id, now_us):
+    """Heatmap of a region, recomputed at most every HEATMAP_CACHE_SECONDS"""
+    computed_at, heatmap = _region_heatmap_cache.get(region_id, (0.0, None))
+    if heatmap is None or time.monotonic() - computed_at > HEATMAP_CACHE_SECONDS:
+        heatmap = {'region_id': region_id, **grid_response(bitmaps.region_grid(region_id, now_us))}
+        _region_heatmap_cache[region_id] = (time.monotonic(), heatmap)
+    return heatmap
+
+@app.route('/api/heatmap', methods=['GET', 'OPTIONS'])
+@token_required
+def get_heatmap(current_user):
+    """Probability of having power by weekday and local hour, for the user and their region"""
+    try:
+        bitmaps = get_supply_bitmaps()
+        now_us = to_us(datetime.utcnow())
+        state = get_power_state(current_user)
+        region_id = state.get('region_id') if state else None
+        if not region_id:
+            user = get_user_by_username(current_user)
+            region_id = user.region_id if user else None
+        
+        return jsonify({
+            'weekdays': WEEKDAYS,
+            'weeks': bitmaps.window_days // 7,
+            'utc_offset_minutes': bitmaps.offset_us // 60000000,
+            'user': grid_response(bitmaps.user_grid(current_user, now_us)),
+            'region': region_heatmap(bitmaps, region_id, now_us) if region_id else None
+        }), 200
+        
+    except Exception as e:
+        logger.exception('Error in get_heatmap')
+        return jsonify({'error': 'An error occurred while building the heatmap'}), 500
+
+@app.route('/api/region-stats/percentile', methods=['GET', 'OPTIONS'])
+@token_required
+def get_region_percentile(current_user):
+    """How the user's supply over the past 7 days ranks among recent weekly totals in their region"""
+    try:
+        bitmaps = get_supply_bitmaps()
+        now_us = to_us(datetime.utcnow())
+        state = get_power_state(current_user)
+        region_id = state.get('region_id') if state else None
+        if not region_id:
+            user = get_user_by_username(current_user)
+            region_id = user.region_id if user else None
+        if not region_id:
+            return jsonify({'error': 'No region is known for this user'}), 404
+        
+        sketches = bitmaps.sketches
+        current_week = sketches.week_of((now_us + bitmaps.offset_us) // DAY_US)
+        sketches.close_weeks(current_week)
+        sketch = sketches.region_sketch(region_id, current_week)
+        hours, known_hours = bitmaps.recent_hours(current_user, now_us)
+        percentile = None
+        # Ranked only on as much known time as each week in the sketch had, or a
+        # user who just started reporting would rank near 0% against full weeks
+        if sketch.count and known_hours >= sketches.min_known_hours:
+            percentile = round(sketch.rank(hours) * 100, 1)
+        median = sketch.quantile(0.5)
+        
+        return jsonify({
+            'region_id': region_id,
+            'hours': round(hours, 2),
+            'known_hours': round(known_hours, 2),
+            'percentile': percentile,
+            'region_median_hours': round(median, 2) if median is not None else None,
+            'min_known_hours': sketches.min_known_hours,
+            # Each user contributes one value per week, so this is user-weeks, not users
+            'user_weeks': sketch.count,
+            'weeks': sketches.weeks,
+            'rank_error_percent': round(sketch.rank_error * 100, 2)
+        }), 200
+        
+    except Exception as e:
+        logger.exception('Error in get_region_percentile')
+        return jsonify({'error': 'An error occurred while ranking regional supply'}), 500
+
+# Default range per granularity, and the span up to which `auto` picks each one
+HISTORY_DEFAULT_DAYS = {'hour': 2, 'day': 30, 'week': 365, 'month': 730}
+HISTORY_AUTO_MAX_DAYS = [('hour', 2), ('day', 92), ('week', 730), ('month', None)]
+
+@app.route('/api/history', methods=['GET', 'OPTIONS'])
+@token_required
+def get_history(current_user):
+    """
+    Supply hours per hour, day, week or month over any range, read from the
+    coarsest history tier that covers it.
+    Query: granularity=auto|hour|day|week|month, from and to (ISO dates or times; to is exclusive)
+    """
+    try:
+        granularity = request.args.get('granularity', 'auto')
+        if granularity != 'auto' and granularity not in HISTORY_DEFAULT_DAYS:
+            return jsonify({'error': 'granularity must be auto, hour, day, week or month'}), 400
+        
+        now = datetime.utcnow()
+        until = parse_client_timestamp(request.args['to']) if request.args.get('to') else now
+        default_days = HISTORY_DEFAULT_DAYS.get(granularity, 30)
+        since = parse_client_timestamp(request.args['from']) if request.args.get('from') else \
+            until - timedelta(days=default_days)
+        if since is None or until is None:
+            return jsonify({'error': 'from and to must be ISO 8601 dates or timestamps'}), 400
+        if since >= until:
+            return jsonify({'error': 'from must be before to'}), 400
+        
+        tiers = get_history_tiers()
+        now_us, from_us = to_us(now), to_us(since)
+        if granularity == 'auto':
+            # The finest granularity for the span, falling back to coarser ones
+            # when its tier doesn't reach back to `from`
+            span_days = (until - since).total_seconds() / 86400
+            first = next(index for index, (_, max_days) in enumerate(HISTORY_AUTO_MAX_DAYS)
+                         if max_days is None or span_days <= max_days)
+            candidates = [name for name, _ in HISTORY_AUTO_MAX_DAYS[first:]]
         else:
-            last_event_type = None
-            hours_ago = None
-        
-        # Calculate average hours per day for week
-        avg_daily_hours = round(week_hours / 7, 2) if week_hours > 0 else 0
-        
-        report = {
-            'summary': {
-                'today_hours': today_hours,
-                'week_hours': week_hours,
-                'month_hours': month_hours,
-                'avg_daily_hours': avg_daily_hours,
-                'last_event': {
-                    'type': last_event_type,
-                    'hours_ago': hours_ago
-                }
-            },
-            'totals': {
-                'today_events': today_events,
-                'week_events': week_events,
-                'month_events': month_events
-            }
+            candidates = [granularity]
+        tier = None
+        for granularity in candidates:
+            tier = tiers.choose_tier(granularity, from_us, now_us)
+            if tier:
+                break
+        if tier is None:
+            return jsonify({'error': f'{granularity} history is not kept that far back; use a coarser granularity'}), 400
+        
+        series = tiers.series(current_user, tier, granularity, from_us, to_us(until), now_us)
+        return jsonify({
+            'granularity': granularity,
+            'tier': tier,
+            'from': since.isoformat(),
+            'to': until.isoformat(),
+            'total_hours': round(sum(on_us for _, on_us in series) / HOUR_US, 2),
+            'series': [{'start': bucket_label(granularity, bucket), 'hours': round(on_us / HOUR_US, 2)}
+                       for bucket, on_us in series]
+        }), 200
+        
+    except Exception as e:
+        logger.exception('Error in get_history')
+        return jsonify({'error': 'An error occurred while fetching history'}), 500
+
+EXPORT_FIELDS = ('id', 'timestamp', 'date', 'event_type', 'location', 'region_id', 'auto_generated')
+EXPORT_FORMATS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+def export_chunks(logs, export_format):
+    """Encode logs as CSV or NDJSON rows, yielded in chunks of about EXPORT_CHUNK_BYTES"""
+    if export_format == 'csv':
+        line = io.StringIO()
+        writer = csv.writer(line)
+        
+        def encode(row):
+            line.seek(0)
+            line.truncate()
+            writer.writerow(row)
+            return line.getvalue().encode('utf-8')
+        
+        pending, size = [encode(EXPORT_FIELDS)], 0
+        rows = (encode([log.get(field) for field in EXPORT_FIELDS]) for log in logs)
+    else:
+        pending, size = [], 0
+        rows = (app.json.dumps_bytes({field: log.get(field) for field in EXPORT_FIELDS}) + b'\n' for log in logs)
+    for row in rows:
+        pending.append(row)
+        size += len(row)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield b''.join(pending)
+            pending, size = [], 0
+    yield b''.join(pending)
+
+@app.route('/api/export', methods=['GET', 'OPTIONS'])
+@token_required
+@rate_limited('export')
+def export_power_logs(current_user):
+    """
+    Download the user's power logs, streamed as they are read from storage.
+    Query: format=csv|ndjson, from and to (inclusive ISO dates). Gzipped when
+    the client accepts it.
+    """
+    try:
+        export_format = request.args.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': 'format must be csv or ndjson'}), 400
+        try:
+            start_date = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+            end_date = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+        except ValueError:
+            return jsonify({'error': 'from and to must be ISO dates (YYYY-MM-DD)'}), 400
+        
+        body = export_chunks(iter_power_logs_by_user(current_user, start_date, end_date), export_format)
+        headers = {
+            'Content-Disposition': f'attachment; filename="power_logs.{export_format}"',
+            'Cache-Control': 'private, no-store',
+            'Vary': 'Accept-Encoding'
         }
+        if 'gzip' in accepted_encodings(request.headers.get('Accept-Encoding')):
+            body = gzip_stream(body, compressor.gzip_level)
+            headers['Content-Encoding'] = 'gzip'
+        return Response(body, content_type=EXPORT_FORMATS[export_format], headers=headers)
         
-        return jsonify(report), 200
+    except Exception as e:
+        logger.exception('Error in export_power_logs')
+        return jsonify({'error': 'An error occurred while exporting power logs'}), 500
+
+# Dashboard ETags also roll over every DASHBOARD_ETAG_WINDOW seconds, since
+# durations such as "on for 2.5 hours" and hours_ago are relative to now
+DASHBOARD_ETAG_WINDOW = max(1, int(os.environ.get('DASHBOARD_ETAG_WINDOW', 300)))
+
+@app.route('/api/dashboard', methods=['GET', 'OPTIONS'])
+@token_required
+def get_dashboard(current_user):
+    """Stats, recent events, report and region in one response, with conditional GET support"""
+    try:
+        period = request.args.get('period', 'week')
+        limit = request.args.get('limit', 20, type=int)
+        
+        # Unchanged polls are answered from the ETag alone, without reading storage.
+        # The version identifies the user, so another user's ETag never matches.
+        etag = None
+        version = get_user_data_version(current_user)
+        if version is not None:
+            window = int(time.time() // DASHBOARD_ETAG_WINDOW)
+            etag = f'{version}.{window}.{period}.{limit}'
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+                response.set_etag(etag, weak=True)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                response.vary.add('Authorization')
+                return response
+        
+        user = get_user_by_username(current_user)
+        now = datetime.utcnow()
+        # One read serves stats (the period's slice of it) and recent events; the report uses the cached series
+        logs = recent_window_logs(current_user, now, max(limit, 1))
+        start_date = stats_start_date(period, now)
+        stats = build_stats([log for log in logs if log.date >= start_date], period, now, user,
+                            get_all_region_profiles())
+        
+        response = jsonify({
+            'stats': stats,
+            'recent_events': [log.to_dict() for log in logs[-limit:]] if limit > 0 else [],
+            'report': build_report(get_event_series(current_user, report_start_date(now)), now),
+            'region': stats['region'],
+            'location': stats['location']
+        })
+        if etag:
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+        # The body (and ETag) depend on who is asking
+        response.vary.add('Authorization')
+        return response, 200
         
     except Exception as e:
-        print(f"Error in get_report: {str(e)}")
-        return jsonify({'error': 'An error occurred while fetching report'}), 500
+        logger.exception('Error in get_dashboard')
+        return jsonify({'error': 'An error occurred while fetching the dashboard'}), 500
+
+
+def publish_power_logs(user_id, logs):
+    """Push new power logs, the user's refreshed report and a regional notice to live streams"""
+    try:
+        for log_data in logs:
+            event_bus.publish(f'user:{user_id}', 'power_log', {
+                key: log_data.get(key) for key in ('event_type', 'timestamp', 'date', 'location', 'region_id')
+            })
+        now = datetime.utcnow()
+        # The report costs a history read, so it is only built while one of the user's streams is open;
+        # a stream opened later fetches the report itself
+        if event_bus.has_subscribers(f'user:{user_id}'):
+            event_bus.publish(f'user:{user_id}', 'stats',
+                              build_report(get_event_series(user_id, report_start_date(now)), now))
+        # Anonymous: other users in the region only learn that power went off or came back.
+        # Replayed offline events are history, not news, so only a recent latest event is announced.
+        latest = max(logs, key=lambda log: str(log['timestamp']))
+        timestamp = latest['timestamp']
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        if latest.get('region_id') and now - timestamp <= REGION_NOTICE_MAX_AGE:
+            event_bus.publish(f"region:{latest['region_id']}", 'region_notice', {
+                'region_id': latest['region_id'],
+                'notice': 'outage_reported' if latest['event_type'] == 'off' else 'power_restored',
+                'timestamp': timestamp
+            })
+    except Exception:
+        # The logs are already saved; streams that miss this will resync on the next event
+        logger.exception('Error publishing live events')
+
+def event_stream_topics(current_user):
+    user = get_user_by_username(current_user)
+    topics = [f'user:{current_user}']
+    if user and user.region_id:
+        topics.append(f'region:{user.region_id}')
+    return topics
+
+def can_hold_request():
+    """
+    Whether this worker keeps serving other requests while one is held open.
+    Not so under gunicorn's default sync worker (wsgi.multithread is false),
+    where a stream or long-poll would block every other request.
+    """
+    return bool(request.environ.get('wsgi.multithread'))
+
+# Under a threaded WSGI server a stream holds a worker thread, so it is closed after
+# EVENT_STREAM_MAX_SECONDS and the browser reconnects with Last-Event-ID
+EVENT_STREAM_MAX_SECONDS = float(os.environ.get('EVENT_STREAM_MAX_SECONDS', 30))
+EVENT_STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+@app.route('/api/events/stream', methods=['GET', 'OPTIONS'])
+def event_stream():
+    """
+    Server-sent events: power_log, stats and region_notice (see event_bus.py).
+    EventSource can't set headers, so the access token may also be passed as
+    ?access_token= and the resume point as ?last_event_id=.
+    Served by the ASGI app (SERVER_MODE=asgi) or a threaded WSGI server; a
+    sync gunicorn worker answers 503, which EventSource doesn't retry.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    if not can_hold_request():
+        return jsonify({'error': 'Live updates are not available on this server; poll /api/dashboard instead'}), 503
+    
+    current_user, error = authenticate_token(
+        request.headers.get('Authorization') or request.args.get('access_token'))
+    if error:
+        return jsonify({'error': error}), 401
+    
+    try:
+        topics = event_stream_topics(current_user)
+    except Exception:
+        logger.exception('Error in event_stream')
+        return jsonify({'error': 'An error occurred while opening the event stream'}), 500
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return Response(event_bus.stream(topics, last_event_id, EVENT_STREAM_MAX_SECONDS),
+                    content_type='text/event-stream', headers=EVENT_STREAM_HEADERS)
 
 
 @app.route('/api/region-profiles', methods=['GET', 'OPTIONS'])
@@ -822,7 +1550,7 @@ def list_region_profiles():
             'regions': regions
         }), 200
     except Exception as e:
-        print(f"Error fetching region profiles: {str(e)}")
+        logger.exception('Error fetching region profiles')
         return jsonify({'error': 'Failed to load region profiles'}), 500
 
 @app.route('/api/verify-email', methods=['POST', 'OPTIONS'])
@@ -851,6 +1579,9 @@ def verify_email():
             return jsonify({'error': 'Verification code has expired'}), 400
         
         if verif_code.code != code:
+            # Wrong guesses are counted per code; the last allowed one clears it until resent
+            if record_failed_verification(email) == 0:
+                return jsonify({'error': 'Too many incorrect codes. Please request a new verification code.'}), 429
             return jsonify({'error': 'Invalid verification code'}), 400
         
         # Create user account
@@ -876,22 +1607,23 @@ def verify_email():
         delete_verification_code(email)
         
         token = generate_token(verif_code.username)
+        refresh_token = generate_refresh_token(verif_code.username)
         return jsonify({
             'message': 'Email verified successfully',
             'verified': True,
             'token': token,
+            'refresh_token': refresh_token,
             'username': verif_code.username,
             'deviceId': device_id
         }), 200
         
     except Exception as e:
         error_msg = str(e)
-        print(f"❌ Error in verify_email: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error in verify_email')
         return jsonify({'error': f'An error occurred during email verification: {error_msg}'}), 500
 
 @app.route('/api/resend-verification', methods=['POST', 'OPTIONS'])
+@rate_limited('resend_verification')
 def resend_verification():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
@@ -927,22 +1659,46 @@ def resend_verification():
         }
         create_or_update_verification_code(code_data)
         
-        # Attempt to send email (non-blocking)
-        email_sent = send_verification_email(email, verification_code)
+        # Queue the email (delivery continues in the background)
+        email_sent, email_id = send_verification_email(email, verification_code)
         
         if email_sent:
-            return jsonify({'message': 'Verification code resent to your email'}), 200
+            response_data = {'message': 'Verification code resent to your email'}
         else:
             # Email sending failed - return code in response as fallback
-            return jsonify({
+            response_data = {
                 'message': 'Email sending failed. Please check your email configuration.',
                 'fallback_code': verification_code
-            }), 200
+            }
+        if email_id:
+            response_data['email_id'] = email_id
+        return jsonify(response_data), 200
             
     except Exception as e:
-        print(f"Error in resend_verification: {str(e)}")
+        logger.exception('Error in resend_verification')
         return jsonify({'error': 'An error occurred while resending verification code'}), 500
 
+@app.route('/api/email-status/<email_id>', methods=['GET', 'OPTIONS'])
+def email_status(email_id):
+    """Delivery status of a queued verification email"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    
+    try:
+        message = get_email_queue().get_message(email_id)
+        if not message:
+            return jsonify({'error': 'Email not found'}), 404
+        
+        status = get_email_queue().get_status(email_id)
+        # Same on-screen fallback as /api/register when delivery gave up
+        if status['status'] == STATUS_FAILED and message['context'].get('code'):
+            status['fallback_code'] = message['context']['code']
+        return jsonify(status), 200
+        
+    except Exception as e:
+        logger.exception('Error in email_status')
+        return jsonify({'error': 'An error occurred while fetching email status'}), 500
+
 @app.route('/api/verify-device', methods=['POST', 'OPTIONS'])
 def verify_device():
     if request.method == 'OPTIONS':
@@ -971,6 +1727,9 @@ def verify_device():
             return jsonify({'error': 'Verification code has expired'}), 400
         
         if verif_code.code != code:
+            # Wrong guesses are counted per code; the last allowed one clears it until resent
+            if record_failed_verification(code_key) == 0:
+                return jsonify({'error': 'Too many incorrect codes. Please request a new verification code.'}), 429
             return jsonify({'error': 'Invalid verification code'}), 400
         
         # Verify device
@@ -995,15 +1754,17 @@ def verify_device():
         delete_verification_code(code_key)
         
         token = generate_token(username)
+        refresh_token = generate_refresh_token(username)
         return jsonify({
             'message': 'Device verified successfully',
             'token': token,
+            'refresh_token': refresh_token,
             'username': username,
             'deviceId': device_id
         }), 200
         
     except Exception as e:
-        print(f"Error in verify_device: {str(e)}")
+        logger.exception('Error in verify_device')
         return jsonify({'error': 'An error occurred during device verification'}), 500
 
 @app.route('/api/auth/google', methods=['POST', 'OPTIONS'])
@@ -1027,21 +1788,22 @@ def google_auth():
         # Get Google Client ID from environment
         google_client_id = os.environ.get('GOOGLE_CLIENT_ID', '')
         if not google_client_id:
-            print("⚠️  GOOGLE_CLIENT_ID not set. Google OAuth will not work.")
+            logger.warning('GOOGLE_CLIENT_ID not set, Google OAuth will not work')
             return jsonify({'error': 'Google OAuth is not configured'}), 500
         
         # Verify the Google ID token
         try:
-            print(f"🔍 Verifying Google token with Client ID: {preview_value(google_client_id, 20)}...")
-            print(f"🔍 Token length: {len(id_token_string) if id_token_string else 0} characters")
+            logger.debug('Verifying Google token', extra={
+                'client_id': preview_value(google_client_id, 20), 'token_length': len(id_token_string)
+            })
             
-            idinfo = id_token.verify_oauth2_token(
+            # Local signature check against cached Google certificates
+            idinfo = get_google_cert_cache().verify_oauth2_token(
                 id_token_string,
-                google_requests.Request(),
                 google_client_id
             )
             
-            print(f"✅ Token verified successfully. Email: {idinfo.get('email', 'N/A')}")
+            logger.debug('Google token verified', extra={'email': idinfo.get('email')})
             
             # Extract user information
             google_id = idinfo.get('sub')
@@ -1067,9 +1829,11 @@ def google_auth():
             if existing_user:
                 # User exists, log them in
                 token = generate_token(existing_user.username)
+                refresh_token = generate_refresh_token(existing_user.username)
                 return jsonify({
                     'message': 'Login successful',
                     'token': token,
+                    'refresh_token': refresh_token,
                     'username': existing_user.username,
                     'isNewUser': False
                 }), 200
@@ -1089,9 +1853,9 @@ def google_auth():
         except ValueError as e:
             # Invalid token - provide more detailed error
             error_msg = str(e)
-            print(f"❌ Google token verification failed: {error_msg}")
-            print(f"   Client ID used: {preview_value(google_client_id, 30)}")
-            print(f"   Token preview: {preview_value(id_token_string, 50)}")
+            logger.warning('Google token verification failed', extra={
+                'error': error_msg, 'client_id': preview_value(google_client_id, 30)
+            })
             
             # Check for common error patterns
             if 'Token expired' in error_msg or 'expired' in error_msg.lower():
@@ -1104,7 +1868,7 @@ def google_auth():
                 return jsonify({'error': f'Google token verification failed: {error_msg}'}), 401
         
     except Exception as e:
-        print(f"Error in google_auth: {str(e)}")
+        logger.exception('Error in google_auth')
         return jsonify({'error': f'An error occurred during Google authentication: {str(e)}'}), 500
 
 @app.route('/api/auth/google/complete', methods=['POST', 'OPTIONS'])
@@ -1138,15 +1902,17 @@ def google_auth_complete():
         
         # Verify the Google ID token again
         try:
-            print(f"🔍 Verifying Google token (complete registration) with Client ID: {preview_value(google_client_id, 20)}...")
+            logger.debug('Verifying Google token (complete registration)', extra={
+                'client_id': preview_value(google_client_id, 20)
+            })
             
-            idinfo = id_token.verify_oauth2_token(
+            # Local signature check against cached Google certificates
+            idinfo = get_google_cert_cache().verify_oauth2_token(
                 id_token_string,
-                google_requests.Request(),
                 google_client_id
             )
             
-            print(f"✅ Token verified successfully. Email: {idinfo.get('email', 'N/A')}")
+            logger.debug('Google token verified', extra={'email': idinfo.get('email')})
             
             # Extract user information
             verified_email = idinfo.get('email')
@@ -1162,9 +1928,11 @@ def google_auth_complete():
             if existing_user:
                 # User was created between calls, just log them in
                 token = generate_token(existing_user.username)
+                refresh_token = generate_refresh_token(existing_user.username)
                 return jsonify({
                     'message': 'Login successful',
                     'token': token,
+                    'refresh_token': refresh_token,
                     'username': existing_user.username,
                     'isNewUser': False
                 }), 200
@@ -1203,9 +1971,11 @@ def google_auth_complete():
             create_device_id(device_data)
             
             token = generate_token(username)
+            refresh_token = generate_refresh_token(username)
             return jsonify({
                 'message': 'Account created and logged in successfully',
                 'token': token,
+                'refresh_token': refresh_token,
                 'username': username,
                 'isNewUser': True
             }), 200
@@ -1213,8 +1983,9 @@ def google_auth_complete():
         except ValueError as e:
             # Invalid token - provide more detailed error
             error_msg = str(e)
-            print(f"❌ Google token verification failed (complete): {error_msg}")
-            print(f"   Client ID used: {preview_value(google_client_id, 30)}")
+            logger.warning('Google token verification failed (complete)', extra={
+                'error': error_msg, 'client_id': preview_value(google_client_id, 30)
+            })
             
             # Check for common error patterns
             if 'Token expired' in error_msg or 'expired' in error_msg.lower():
@@ -1228,9 +1999,7 @@ def google_auth_complete():
         
     except Exception as e:
         error_msg = str(e)
-        print(f"❌ Error in google_auth_complete: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error in google_auth_complete')
         return jsonify({'error': f'An error occurred during Google registration: {error_msg}'}), 500
 
 
@@ -1269,9 +2038,7 @@ def generate_random_data():
         }), 200
         
     except Exception as e:
-        print(f"Error in generate_random_data: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error in generate_random_data')
         return jsonify({'error': f'An error occurred: {str(e)}'}), 500
 
 
@@ -1280,6 +2047,9 @@ port = int(os.environ.get("PORT", 5000))
 
 # Final check - confirm module loaded completely
 print("✅ All routes and functions defined - app module is ready")
+startup_timer.record('routes', time.perf_counter() - routes_started)
+startup_timer.finish()
+startup_timer.print_report()
 
 if __name__ == '__main__':
     debug = os.environ.get('FLASK_ENV') == 'development'
@@ -1289,17 +2059,32 @@ if __name__ == '__main__':
     print("Available endpoints:")
     print("  - GET  /                      - Health check")
     print("  - GET  /api                   - API info")
+    print("  - GET  /metrics               - Prometheus metrics")
+    print("  - GET  /api/admin/profiles    - Recent request profiles (admin)")
+    print("  - GET  /api/admin/changes     - Power log change feed since a sequence number (admin)")
     print("  - POST /api/register          - Register user")
     print("  - POST /api/login             - Login user")
+    print("  - POST /api/token/refresh     - Exchange refresh token for a new access token")
+    print("  - POST /api/logout            - Revoke access and refresh tokens")
     print("  - POST /api/verify-email      - Verify email")
     print("  - POST /api/verify-device     - Verify device")
     print("  - POST /api/resend-verification - Resend verification code")
+    print("  - GET  /api/email-status/<id> - Verification email delivery status")
     print("  - POST /api/auth/google      - Google OAuth login")
     print("  - POST /api/auth/google/complete - Complete Google OAuth with location")
     print("  - POST /api/log-power         - Log power event")
+    print("  - POST /api/log-power/batch   - Log events recorded offline (one write)")
     print("  - GET  /api/stats             - Get statistics")
     print("  - GET  /api/recent-events     - Get recent events")
     print("  - GET  /api/report            - Get brief report summary")
+    print("  - GET  /api/dashboard         - Stats, recent events, report and region (ETag/304)")
+    print("  - GET  /api/status            - Current power state and regional on-percentage")
+    print("  - GET  /api/status/regions    - Share of users with power on, per region")
+    print("  - GET  /api/heatmap           - Chance of power by weekday and hour, user and region")
+    print("  - GET  /api/region-stats/percentile - Rank of the user's weekly supply in their region")
+    print("  - GET  /api/history           - Hourly to monthly supply hours over any range")
+    print("  - GET  /api/export            - Download power logs as CSV or NDJSON (streamed)")
+    print("  - GET  /api/events/stream     - Live power logs, stats and regional notices (SSE)")
     print("  - POST /api/generate-random-data - Generate random power logs for all users")
     
     # Make migrate available as Flask CLI command
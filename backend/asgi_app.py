@@ -0,0 +1,209 @@
+"""
+ASGI entry point for the API.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+    hypercorn asgi_app:app --bind 0.0.0.0:$PORT
+
+The dashboard polling routes (GET /api/stats, /api/recent-events and
+/api/report) are served natively on the event loop, reading through
+AsyncStorage, so thousands of idle or slow dashboard connections cost a
+coroutine each rather than a worker. GET /api/events/stream is also served
+here, from the same event bus the Flask routes publish to, keeping each
+stream open for up to EVENT_STREAM_ASGI_MAX_SECONDS (default 900, the access
+token lifetime); a sync gunicorn worker refuses streams with a 503.
+Every other route (and CORS preflight)
+is forwarded to the Flask app in app.py on a thread pool, so both serving
+modes share one implementation and return identical JSON.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+import app as flask_module
+from app import app as flask_app, authenticate_token
+from async_storage import create_async_storage
+from metrics import observe_request
+from power_stats import stats_start_date, report_start_date, build_stats, build_report
+
+logger = logging.getLogger(__name__)
+
+storage = create_async_storage()
+wsgi_app = WSGIMiddleware(flask_app, workers=int(os.environ.get('ASGI_WSGI_THREADS', 10)))
+
+
+async def stats_route(current_user, query):
+    try:
+        user = await storage.get_user_by_username(current_user)
+        period = query.get('period', 'week')
+        now = datetime.utcnow()
+        logs = await storage.get_power_logs_by_user(current_user, start_date=stats_start_date(period, now))
+        return build_stats(logs, period, now, user, await storage.get_all_region_profiles()), 200
+    except Exception as e:
+        logger.exception('Error in get_stats')
+        return {'error': 'An error occurred while fetching statistics'}, 500
+
+
+async def recent_events_route(current_user, query):
+    try:
+        limit = int(query.get('limit', 10))
+        logs = await storage.get_recent_power_logs(current_user, limit=limit)
+        events = [log.to_dict() if hasattr(log, 'to_dict') else log for log in logs]
+        return {'events': events}, 200
+    except Exception as e:
+        error_msg = str(e)
+        logger.exception('Error in get_recent_events')
+        return {'error': f'An error occurred while fetching recent events: {error_msg}'}, 500
+
+
+async def report_route(current_user, query):
+    try:
+        now = datetime.utcnow()
+        return build_report(await storage.get_event_series(current_user, report_start_date(now)), now), 200
+    except Exception as e:
+        logger.exception('Error in get_report')
+        return {'error': 'An error occurred while fetching report'}, 500
+
+
+EVENT_STREAM_ASGI_MAX_SECONDS = float(os.environ.get('EVENT_STREAM_ASGI_MAX_SECONDS', 900))
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def event_stream_route(send, receive, headers, query, extra_headers, started):
+    """Native counterpart of app.event_stream: one coroutine per open stream"""
+    current_user, error = authenticate_token(headers.get('authorization') or query.get('access_token'))
+    user = None
+    if error:
+        payload, status = {'error': error}, 401
+    else:
+        try:
+            user = await storage.get_user_by_username(current_user)
+            payload, status = None, 200
+        except Exception:
+            logger.exception('Error in event_stream')
+            payload, status = {'error': 'An error occurred while opening the event stream'}, 500
+    if payload is not None:
+        await send_json(send, payload, status, extra_headers)
+    else:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream')] +
+                       [(name.lower().encode('latin1'), value.encode('latin1'))
+                        for name, value in flask_module.EVENT_STREAM_HEADERS.items()] + extra_headers,
+        })
+    # Like the Flask hook, this measures the time to the start of the response, not the stream's lifetime
+    observe_request('GET', '/api/events/stream', status, time.perf_counter() - started)
+    if payload is not None:
+        return
+
+    topics = [f'user:{current_user}']
+    if user and user.region_id:
+        topics.append(f'region:{user.region_id}')
+    stream = flask_module.event_bus.astream(
+        topics, headers.get('last-event-id') or query.get('last_event_id'), EVENT_STREAM_ASGI_MAX_SECONDS)
+
+    async def pump():
+        async for chunk in stream:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    # Stop as soon as the client goes away instead of at the next heartbeat
+    pump_task = asyncio.ensure_future(pump())
+    disconnect_task = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({pump_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (pump_task, disconnect_task):
+            task.cancel()
+        await asyncio.gather(pump_task, disconnect_task, return_exceptions=True)
+        await stream.aclose()
+
+
+# Authenticated GET routes served without the WSGI bridge
+NATIVE_ROUTES = {
+    '/api/stats': stats_route,
+    '/api/recent-events': recent_events_route,
+    '/api/report': report_route,
+}
+
+
+def cors_headers(origin):
+    """Same CORS response headers flask-cors adds to the Flask routes"""
+    allowed = flask_module.cors_origins
+    if not origin or (allowed != '*' and origin not in allowed):
+        return []
+    return [
+        (b'access-control-allow-origin', origin.encode('latin1')),
+        (b'access-control-allow-credentials', b'true'),
+        (b'access-control-expose-headers', b'Retry-After, X-Profile-Id, Idempotent-Replayed'),
+        (b'vary', b'Origin'),
+    ]
+
+
+async def send_json(send, payload, status, extra_headers=(), accept_encoding=None):
+    # Same encoder and compression as the Flask routes (see json_response.py)
+    body, coding = flask_module.compressor.compress_body(flask_app.json.dumps_bytes(payload) + b'\n', accept_encoding)
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode('latin1')),
+        (b'vary', b'Accept-Encoding'),
+    ]
+    if coding:
+        headers.append((b'content-encoding', coding.encode('latin1')))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': headers + list(extra_headers),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            storage.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    path = scope.get('path')
+    handler = NATIVE_ROUTES.get(path) if scope['type'] == 'http' else None
+    is_stream = scope['type'] == 'http' and path == '/api/events/stream'
+    if (handler is None and not is_stream) or scope['method'] != 'GET':
+        await wsgi_app(scope, receive, send)
+        return
+
+    started = time.perf_counter()
+    headers = {key.decode('latin1').lower(): value.decode('latin1') for key, value in scope['headers']}
+    query = {key: values[0] for key, values in parse_qs(scope.get('query_string', b'').decode('latin1')).items()}
+    extra_headers = cors_headers(headers.get('origin'))
+
+    if is_stream:
+        await event_stream_route(send, receive, headers, query, extra_headers, started)
+        return
+
+    current_user, error = authenticate_token(headers.get('authorization'))
+    if error:
+        payload, status = {'error': error}, 401
+    else:
+        payload, status = await handler(current_user, query)
+    await send_json(send, payload, status, extra_headers, headers.get('accept-encoding'))
+    # Same series the Flask after_request hook records for these routes
+    observe_request('GET', scope['path'], status, time.perf_counter() - started)
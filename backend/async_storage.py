@@ -0,0 +1,52 @@
+"""
+Awaitable wrapper around storage_adapter for the ASGI app.
+
+File storage reads scan in-memory lists and writes rewrite whole JSON files,
+so every call runs on a small dedicated thread pool instead of the event loop.
+Method names and return values match the storage_adapter functions.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import storage_adapter
+
+
+class AsyncStorage:
+    """Async storage interface backed by a bounded thread pool"""
+
+    def __init__(self, max_workers: int = 4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='async-storage')
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def get_user_by_username(self, username: str):
+        return await self._run(storage_adapter.get_user_by_username, username)
+
+    async def get_user_by_email(self, email: str):
+        return await self._run(storage_adapter.get_user_by_email, email)
+
+    async def get_power_logs_by_user(self, user_id: str, start_date=None, end_date=None):
+        return await self._run(storage_adapter.get_power_logs_by_user, user_id, start_date, end_date)
+
+    async def get_recent_power_logs(self, user_id: str, limit: int = 20):
+        return await self._run(storage_adapter.get_recent_power_logs, user_id, limit)
+
+    async def get_event_series(self, user_id: str, start_date, min_count: int = 1):
+        return await self._run(storage_adapter.get_event_series, user_id, start_date, min_count)
+
+    async def create_power_log(self, log_data):
+        return await self._run(storage_adapter.create_power_log, log_data)
+
+    async def get_all_region_profiles(self):
+        return await self._run(storage_adapter.get_all_region_profiles)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def create_async_storage() -> AsyncStorage:
+    return AsyncStorage(max_workers=int(os.environ.get('ASGI_STORAGE_THREADS', 4)))
@@ -0,0 +1,171 @@
+"""
+JWT issuing and verification for the API.
+
+Access tokens are short-lived (ACCESS_TOKEN_TTL seconds) and refresh tokens
+long-lived (REFRESH_TOKEN_TTL seconds); both carry an `exp` and a `jti`.
+Verified access tokens are kept in a bounded TTL cache so hot tokens skip the
+HMAC check in token_required. Revoked token IDs go into a compact denylist
+(data/revoked_tokens.json) that is pruned as entries pass their expiry and
+re-read when another worker process changes it.
+"""
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import jwt
+
+from file_storage import DATA_DIR, _load_json, _save_json
+
+REVOKED_TOKENS_FILE = os.path.join(DATA_DIR, 'revoked_tokens.json')
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+
+class TokenRevokedError(jwt.InvalidTokenError):
+    """Raised for a token whose jti is on the denylist"""
+
+
+class TokenCache:
+    """Bounded LRU of verified token -> (claims, cache expiry)"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[Dict, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= now:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return claims
+
+    def put(self, token: str, claims: Dict):
+        # Never cache a token past its own exp
+        expires_at = min(time.time() + self.ttl, claims.get('exp', 0))
+        with self._lock:
+            self._entries[token] = (claims, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TokenDenylist:
+    """Revoked jti -> exp, persisted to disk and shared between workers"""
+
+    def __init__(self, filepath: str = REVOKED_TOKENS_FILE, reload_interval: float = 1.0):
+        self.filepath = filepath
+        self.reload_interval = reload_interval
+        self._revoked: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self._reload()
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.filepath).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        now = time.time()
+        self._revoked = {
+            entry['jti']: entry['exp'] for entry in _load_json(self.filepath, [])
+            if entry.get('exp', 0) > now
+        }
+
+    def _maybe_reload(self):
+        now = time.time()
+        if now >= self._next_check:
+            self._next_check = now + self.reload_interval
+            self._reload()
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti:
+            return False
+        with self._lock:
+            self._maybe_reload()
+            return jti in self._revoked
+
+    def revoke(self, jti: str, exp: int):
+        now = time.time()
+        with self._lock:
+            self._reload()
+            # Entries past their exp can't be replayed anyway, so drop them
+            self._revoked = {k: v for k, v in self._revoked.items() if v > now}
+            self._revoked[jti] = exp
+            _save_json(self.filepath, [{'jti': k, 'exp': v} for k, v in self._revoked.items()])
+            self._mtime = os.stat(self.filepath).st_mtime
+
+
+class TokenService:
+    """Issues and verifies access/refresh tokens"""
+
+    def __init__(self, secret: str, access_ttl: int = 900, refresh_ttl: int = 30 * 86400,
+                 cache: Optional[TokenCache] = None, denylist: Optional[TokenDenylist] = None):
+        self.secret = secret
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.cache = cache if cache is not None else TokenCache()
+        self.denylist = denylist if denylist is not None else TokenDenylist()
+
+    def _encode(self, user_id: str, token_type: str, ttl: int) -> str:
+        now = int(time.time())
+        token = jwt.encode({
+            'user_id': user_id,
+            'type': token_type,
+            'jti': secrets.token_urlsafe(12),
+            'iat': now,
+            'exp': now + ttl
+        }, self.secret, algorithm='HS256')
+        # PyJWT 2.0+ returns string directly, but handle both cases
+        if isinstance(token, bytes):
+            return token.decode('utf-8')
+        return token
+
+    def issue_access_token(self, user_id: str) -> str:
+        return self._encode(user_id, ACCESS, self.access_ttl)
+
+    def issue_refresh_token(self, user_id: str) -> str:
+        return self._encode(user_id, REFRESH, self.refresh_ttl)
+
+    def decode(self, token: str, token_type: str = ACCESS) -> Dict:
+        """Full signature check; raises jwt.InvalidTokenError subclasses"""
+        claims = jwt.decode(token, self.secret, algorithms=['HS256'],
+                            options={'require': ['exp', 'jti']})
+        if claims.get('type') != token_type:
+            raise jwt.InvalidTokenError(f'Expected a {token_type} token')
+        if self.denylist.is_revoked(claims['jti']):
+            raise TokenRevokedError('Token has been revoked')
+        return claims
+
+    def verify_access_token(self, token: str) -> Dict:
+        """Verify an access token, skipping the HMAC check for cached tokens"""
+        claims = self.cache.get(token)
+        if claims is not None:
+            if self.denylist.is_revoked(claims['jti']):
+                raise TokenRevokedError('Token has been revoked')
+            return claims
+        claims = self.decode(token, ACCESS)
+        self.cache.put(token, claims)
+        return claims
+
+    def revoke(self, claims: Dict):
+        self.denylist.revoke(claims['jti'], claims['exp'])
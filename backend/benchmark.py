@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+"""
+Load benchmarks for the Electricity Supply Logger API.
+
+Usage:
+    python benchmark.py login --username alice --password secret [--concurrency 16] [--requests 200]
+    python benchmark.py auth [--iterations 20000]
+    python benchmark.py dashboard --token <access token> [--levels 50,200,500] [--duration 20] [--poll-interval 5]
+    python benchmark.py storage-stress [--writers 4] [--readers 4] [--writes 50]
+    python benchmark.py startup [--runs 5] [--server dev|gunicorn|uvicorn]
+    python benchmark.py encoding [--iterations 500] [--days 30]
+    python benchmark.py analytics [--sizes 10000,100000,1000000,10000000]
+
+`login` and `dashboard` run against a live backend (see test_backend.py);
+`auth`, `storage-stress`, `encoding` and `analytics` run in-process. `startup` spawns its own backend
+processes and times them from launch to the first successful GET /, once with
+FAST_STARTUP=false and once with FAST_STARTUP=true. For `dashboard`, compare the default gunicorn
+server with SERVER_MODE=asgi (uvicorn asgi_app:app). To compare configurations,
+restart the backend with different environment variables between runs, e.g.
+PASSWORD_HASH_WORKERS=0 (inline hashing) versus the default process pool.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+import requests
+
+BASE_URL = "http://localhost:5000"
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_load(call: Callable[[requests.Session], int], concurrency: int, total: int) -> dict:
+    """Run `call` `total` times across `concurrency` threads and collect latencies"""
+    latencies: List[float] = []
+    errors = 0
+
+    def worker(count: int):
+        nonlocal errors
+        session = requests.Session()
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                status = call(session)
+            except requests.exceptions.RequestException:
+                status = 0
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status >= 400 or status == 0:
+                errors += 1
+
+    per_thread = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, per_thread))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p90_ms': round(percentile(latencies, 90), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'max_ms': round(max(latencies), 1) if latencies else 0,
+    }
+
+
+def run_polling(call: Callable[[requests.Session], int], clients: int, duration: float, interval: float) -> dict:
+    """
+    `clients` threads each call `call` every `interval` seconds for `duration`
+    seconds, as polling browsers do. Start times are spread over the first
+    interval; a call that outlasts the interval delays that client's next one.
+    """
+    started = time.perf_counter()
+    deadline = started + duration
+    stop = threading.Event()
+
+    def client(index: int):
+        session = requests.Session()
+        latencies: List[float] = []
+        errors = late = 0
+        next_at = started + interval * index / clients
+        while not stop.wait(max(0.0, next_at - time.perf_counter())) and next_at < deadline:
+            start = time.perf_counter()
+            try:
+                status = call(session)
+            except requests.exceptions.RequestException:
+                status = 0
+            elapsed = time.perf_counter() - start
+            latencies.append(elapsed * 1000)
+            if status >= 400 or status == 0:
+                errors += 1
+            if elapsed > interval:
+                late += 1
+            next_at = max(next_at + interval, time.perf_counter())
+        return latencies, errors, late
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        futures = [pool.submit(client, index) for index in range(clients)]
+        time.sleep(max(0.0, deadline - time.perf_counter()))
+        stop.set()
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for client_latencies, _, _ in results for latency in client_latencies]
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors, _ in results),
+        'late': sum(late for _, _, late in results),
+        'offered_rps': round(clients / interval, 1),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p90_ms': round(percentile(latencies, 90), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'max_ms': round(max(latencies), 1) if latencies else 0,
+    }
+
+
+def print_result(name: str, result: dict):
+    print(f"{name}:")
+    for key, value in result.items():
+        print(f"  {key:>15}: {value}")
+
+
+def bench_login(args):
+    def call(session: requests.Session) -> int:
+        response = session.post(
+            f"{args.url}/api/login",
+            json={'username': args.username, 'password': args.password},
+            timeout=30
+        )
+        return response.status_code
+
+    print(f"🔄 POST /api/login x{args.requests} with concurrency {args.concurrency}...")
+    print_result('login', run_load(call, args.concurrency, args.requests))
+
+
+def bench_auth(args):
+    """Per-request token verification cost: full jwt.decode vs the verified-token cache"""
+    import jwt
+    from auth_tokens import TokenService, TokenDenylist
+
+    secret = 'benchmark-secret-' + 'x' * 32
+    with tempfile.TemporaryDirectory() as tmp:
+        service = TokenService(secret, denylist=TokenDenylist(os.path.join(tmp, 'revoked.json')))
+        token = service.issue_access_token('benchmark_user')
+        legacy_token = jwt.encode({'user_id': 'benchmark_user'}, secret, algorithm='HS256')
+
+        def measure(fn) -> float:
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                fn()
+            return (time.perf_counter() - start) / args.iterations * 1e6
+
+        before = measure(lambda: jwt.decode(legacy_token, secret, algorithms=['HS256']))
+        uncached = measure(lambda: service.decode(token))
+        service.verify_access_token(token)
+        cached = measure(lambda: service.verify_access_token(token))
+
+    print(f"🔄 Token verification, {args.iterations} iterations each:")
+    print(f"  {'jwt.decode (before)':>28}: {before:.2f} µs/request")
+    print(f"  {'TokenService.decode':>28}: {uncached:.2f} µs/request")
+    print(f"  {'verify_access_token (cached)':>28}: {cached:.2f} µs/request")
+
+
+def encoding_payloads(days: int) -> dict:
+    """Response bodies of the main dashboard endpoints for a user with `days` of history"""
+    from datetime import datetime, timedelta
+    from analytics import series_from_logs
+    from power_stats import build_stats, build_report
+    from region_profiles_data import REGION_PROFILE_SEED_DATA
+
+    class Log:
+        def __init__(self, event_type, timestamp):
+            self.event_type = event_type
+            self.timestamp = timestamp
+            self.date = timestamp.date()
+
+        def to_dict(self):
+            return {'user_id': 'benchmark_user', 'event_type': self.event_type,
+                    'timestamp': self.timestamp.isoformat(), 'date': self.date.isoformat(),
+                    'location': 'Ikeja, Lagos', 'region_id': 'ikeja', 'auto_generated': False}
+
+    now = datetime.utcnow()
+    logs = []
+    for day in range(days, 0, -1):
+        start = now - timedelta(days=day)
+        for hour in (2, 7, 13, 19):  # Two on/off cycles a day
+            logs.append(Log('on' if hour in (2, 13) else 'off', start.replace(hour=hour, minute=17)))
+    return {
+        'stats?period=month': build_stats(logs, 'month', now),
+        'report': build_report(series_from_logs(logs), now),
+        'recent-events': {'events': [log.to_dict() for log in logs[-10:]]},
+        'region-profiles': {'regions': REGION_PROFILE_SEED_DATA},
+    }
+
+
+def bench_encoding(args):
+    """Bytes and CPU per response for each JSON encoder and content coding"""
+    from flask import Flask
+    from json_response import FastJSONProvider, Compressor, orjson, brotli
+
+    app = Flask(__name__)
+    encoders = {'stdlib': FastJSONProvider(app, use_orjson=False)}
+    if orjson is not None:
+        encoders['orjson'] = FastJSONProvider(app, use_orjson=True)
+    compressor = Compressor(min_size=1)
+    codings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+
+    def measure(fn) -> float:
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            fn()
+        return (time.perf_counter() - start) / args.iterations * 1e6
+
+    print(f"🔄 {args.iterations} iterations per cell, {args.days} days of history"
+          f"{'' if orjson else ' (orjson not installed)'}{'' if brotli else ' (Brotli not installed)'}")
+    print(f"  {'endpoint':<20} {'step':<16} {'bytes':>8} {'µs/response':>12}")
+    for name, payload in encoding_payloads(args.days).items():
+        for encoder_name, provider in encoders.items():
+            encode_us = measure(lambda: provider.dumps_bytes(payload))
+            print(f"  {name:<20} {encoder_name + ' encode':<16} {len(provider.dumps_bytes(payload)):>8} {encode_us:>12.1f}")
+        body = encoders['stdlib'].dumps_bytes(payload)
+        for coding in codings[1:]:
+            compress_us = measure(lambda: compressor.compress(body, coding))
+            print(f"  {name:<20} {coding:<16} {len(compressor.compress(body, coding)):>8} {compress_us:>12.1f}")
+
+
+def bench_analytics(args):
+    """Supply-hour computations per backend over synthetic histories of increasing size"""
+    import random
+    import analytics
+
+    backends = [analytics.PythonBackend()]
+    if analytics.NUMPY_AVAILABLE:
+        backends.append(analytics.NumpyBackend())
+    else:
+        print("⚠️  numpy is not installed; timing the pure-Python backend only")
+
+    def timed(fn):
+        start = time.perf_counter()
+        result = fn()
+        return result, (time.perf_counter() - start) * 1000
+
+    print(f"  {'events':>10} {'operation':<12} " + ' '.join(f"{b.name + ' ms':>12}" for b in backends) +
+          (f" {'speedup':>8}" if len(backends) > 1 else ''))
+    for size in (int(value) for value in args.sizes.split(',')):
+        # Events every 5-120 minutes, mostly alternating, with some repeated states
+        rng = random.Random(size)
+        times, states = [], []
+        moment, state = 1_700_000_000 * 1_000_000, 1
+        for _ in range(size):
+            moment += rng.randint(300, 7200) * 1_000_000
+            state = state if rng.random() < 0.1 else 1 - state
+            times.append(moment)
+            states.append(state)
+        now_us = moment + 3600 * 1_000_000
+        month_start = now_us - 30 * analytics.DAY_US
+
+        operations = {
+            'series': lambda b: b.series(times, states),
+            'on_time': lambda b: b.on_time(series[b.name], 0, now_us),
+            'month': lambda b: b.on_time(series[b.name], month_start, now_us),
+            'daily': lambda b: b.daily_on_time(series[b.name], now_us),
+            'outages': lambda b: b.outages(series[b.name], 0, now_us),
+        }
+        series = {}
+        for name, operation in operations.items():
+            results, timings = [], []
+            for backend in backends:
+                result, ms = timed(lambda: operation(backend))
+                if name == 'series':
+                    series[backend.name] = result
+                results.append(result)
+                timings.append(ms)
+            if name != 'series' and any(result != results[0] for result in results[1:]):
+                raise SystemExit(f"❌ Backends disagree on {name} for {size} events")
+            line = f"  {size:>10} {name:<12} " + ' '.join(f"{ms:>12.2f}" for ms in timings)
+            if len(timings) > 1:
+                line += f" {timings[0] / timings[1]:>7.1f}x"
+            print(line)
+        del series
+    print("✅ Backends agree on every result")
+
+
+def bench_report(args):
+    """/api/report's storage and analytics path: building from logs vs the cached per-user series"""
+    import random
+    from datetime import datetime, timedelta
+    import analytics
+    import file_storage
+    import storage_adapter
+    from power_stats import build_report, report_start_date
+
+    backends = ['python'] + (['numpy'] if analytics.NUMPY_AVAILABLE else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        file_storage.POWER_LOG_HOT_DAYS = 0  # Keep every log hot, so 'before' scans them all
+        storage = file_storage.file_storage = file_storage.FileStorage(data_dir=tmp)
+        rng = random.Random(args.logs)
+        now = datetime.utcnow()
+        moment, logs = now - timedelta(minutes=45 * args.logs), []
+        for i in range(args.logs):
+            moment += timedelta(minutes=rng.randint(5, 85))
+            logs.append({'user_id': 'benchmark_user' if i % args.users == 0 else f'user_{i % args.users}',
+                         'event_type': 'on' if i % 2 == 0 else 'off', 'timestamp': min(moment, now),
+                         'date': min(moment, now).date(), 'location': 'Ikeja, Lagos'})
+        storage.create_power_logs(logs)
+        user_logs = sum(1 for log in logs if log['user_id'] == 'benchmark_user')
+        print(f"🔄 {args.logs} logs ({user_logs} for the reported user), {args.iterations} reports per row")
+        print(f"  {'backend':<8} {'path':<28} {'ms/report':>10}")
+
+        def timed(fn) -> float:
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                fn()
+            return (time.perf_counter() - start) / args.iterations * 1000
+
+        start_date = report_start_date(now)
+        for name in backends:
+            analytics._backend = analytics.create_backend(name)
+            storage._event_series.clear()
+
+            def from_logs():
+                return build_report(analytics.series_from_logs(
+                    storage_adapter.get_power_logs_by_user('benchmark_user', start_date=start_date)), now)
+
+            def cached():
+                return build_report(storage_adapter.get_event_series('benchmark_user', start_date), now)
+
+            first = timed(lambda: (storage._event_series.clear(), cached()))
+            warm = timed(cached)
+            before = timed(from_logs)
+            if from_logs() != cached():
+                raise SystemExit(f"❌ Cached series and logs disagree ({name})")
+            print(f"  {name:<8} {'from logs (before)':<28} {before:>10.2f}")
+            print(f"  {name:<8} {'cached series, first report':<28} {first:>10.2f}")
+            print(f"  {name:<8} {'cached series':<28} {warm:>10.2f}")
+        file_storage.file_storage = None
+    print("✅ Cached reports match reports built from logs")
+
+
+def bench_dashboard(args):
+    """How many concurrent polling dashboards one server process keeps responsive"""
+    headers = {'Authorization': f'Bearer {args.token}'}
+
+    def call(session: requests.Session) -> int:
+        # One dashboard refresh: Dashboard.js stats poll plus ChatInterface.js events poll
+        status = session.get(f"{args.url}/api/stats?period=week", headers=headers, timeout=30).status_code
+        if status < 400:
+            status = session.get(f"{args.url}/api/recent-events?limit=20", headers=headers, timeout=30).status_code
+        return status
+
+    results = []
+    for level in [int(level) for level in args.levels.split(',')]:
+        print(f"🔄 {level} dashboards refreshing every {args.poll_interval:g}s for {args.duration:g}s...")
+        result = run_polling(call, level, args.duration, args.poll_interval)
+        print_result(f'dashboard x{level}', result)
+        results.append((level, result))
+
+    # Latency and errors as the number of clients grows; 'late' counts refreshes slower than the poll interval
+    print(f"\n  {'clients':>8} {'requests':>9} {'errors':>7} {'late':>6} {'rps':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for level, result in results:
+        print(f"  {level:>8} {result['requests']:>9} {result['errors']:>7} {result['late']:>6} "
+              f"{result['throughput_rps']:>7} {result['p50_ms']:>8} {result['p99_ms']:>8}")
+
+
+def bench_storage_stress(args):
+    """Hammer FileStorage with concurrent writers and readers, then check consistency"""
+    import threading
+    from file_storage import FileStorage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = FileStorage(data_dir=tmp)
+        users = [f'stress_user_{i}' for i in range(args.writers)]
+        writers_done = threading.Event()
+        read_latencies: List[float] = []
+        errors: List[str] = []
+
+        def writer(username: str):
+            for i in range(args.writes):
+                storage.create_power_log({
+                    'user_id': username,
+                    'event_type': 'on' if i % 2 == 0 else 'off',
+                    'location': 'stress',
+                    'auto_generated': True
+                })
+            # Unexpired, so the background sweeper can't evict it before the check below
+            storage.create_or_update_verification_code({'email': f'{username}@example.com', 'code': '000000',
+                                                        'expires_at': datetime.utcnow() + timedelta(minutes=10)})
+
+        def reader(index: int):
+            username = users[index % len(users)]
+            while not writers_done.is_set():
+                start = time.perf_counter()
+                logs = storage.get_power_logs_by_user(username)
+                storage.get_recent_power_logs(username, 20)
+                read_latencies.append((time.perf_counter() - start) * 1000)
+                ids = [log['id'] for log in logs]
+                if len(ids) != len(set(ids)):
+                    errors.append('reader saw duplicate IDs')
+
+        started = time.perf_counter()
+        readers = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+        for thread in readers:
+            thread.start()
+        with ThreadPoolExecutor(max_workers=args.writers) as pool:
+            list(pool.map(writer, users))
+        writers_done.set()
+        for thread in readers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        expected = args.writers * args.writes
+        ids = [log['id'] for log in storage.power_logs]
+        reloaded = FileStorage(data_dir=tmp)
+        checks = {
+            'all writes kept': len(storage.power_logs) == expected,
+            'unique IDs': len(set(ids)) == len(ids),
+            'IDs are 1..N': sorted(ids) == list(range(1, expected + 1)),
+            'file matches memory': len(reloaded.power_logs) == expected,
+            'no lost code updates': len(reloaded.verification_codes) == args.writers,
+            'readers consistent': not errors,
+        }
+
+    print(f"🔄 {args.writers} writers x {args.writes} logs, {args.readers} concurrent readers ({elapsed:.1f}s)")
+    print(f"  {'reads':>20}: {len(read_latencies)}")
+    print(f"  {'read p50_ms':>20}: {percentile(read_latencies, 50):.2f}")
+    print(f"  {'read p99_ms':>20}: {percentile(read_latencies, 99):.2f}")
+    for name, ok in checks.items():
+        print(f"  {name:>20}: {'✅' if ok else '❌'}")
+    if not all(checks.values()):
+        raise SystemExit(1)
+
+
+SERVER_COMMANDS = {
+    "dev": lambda port: [sys.executable, "app.py"],
+    "gunicorn": lambda port: [sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}"],
+    "uvicorn": lambda port: [sys.executable, "-m", "uvicorn", "asgi_app:app", "--port", str(port)],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_response(server: str, fast_startup: bool, timeout: float) -> tuple:
+    """Launch a backend process and return (seconds until GET / succeeds, STARTUP_TIMING dict or None)"""
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), FAST_STARTUP="true" if fast_startup else "false",
+               PYTHONUNBUFFERED="1")
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryFile("w+") as log:
+        started = time.perf_counter()
+        proc = subprocess.Popen(SERVER_COMMANDS[server](port), cwd=backend_dir, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+        try:
+            elapsed = None
+            while time.perf_counter() - started < timeout and proc.poll() is None:
+                try:
+                    if requests.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                        elapsed = time.perf_counter() - started
+                        break
+                except requests.exceptions.ConnectionError:
+                    pass
+                time.sleep(0.005)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+        log.seek(0)
+        output = log.read()
+    if elapsed is None:
+        raise SystemExit(f"❌ {server} server did not answer within {timeout}s:\n{output[-2000:]}")
+    timing = None
+    for line in output.splitlines():
+        if line.startswith("STARTUP_TIMING "):
+            timing = json.loads(line.split(" ", 1)[1])
+    return elapsed, timing
+
+
+def bench_startup(args):
+    for fast_startup in (False, True):
+        samples, phases = [], {}
+        for _ in range(args.runs):
+            elapsed, timing = time_to_first_response(args.server, fast_startup, args.timeout)
+            samples.append(elapsed * 1000)
+            for name, ms in (timing or {}).get("phases_ms", {}).items():
+                phases.setdefault(name, []).append(ms)
+        print(f"🚀 {args.server} server, FAST_STARTUP={'true' if fast_startup else 'false'} ({args.runs} runs)")
+        print(f"  {'first_response_ms p50':>24}: {percentile(samples, 50):.1f}")
+        print(f"  {'first_response_ms max':>24}: {max(samples):.1f}")
+        for name, values in phases.items():
+            print(f"  {name + ' p50_ms':>24}: {percentile(values, 50):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load benchmarks for the backend API")
+    parser.add_argument("--url", default=BASE_URL, help=f"Backend base URL (default: {BASE_URL})")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients (default: 16)")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests (default: 200)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    login_parser = subparsers.add_parser("login", help="Login latency under concurrent load")
+    login_parser.add_argument("--username", required=True, help="Existing account username or email")
+    login_parser.add_argument("--password", required=True, help="Password for the account")
+    login_parser.set_defaults(func=bench_login)
+
+    auth_parser = subparsers.add_parser("auth", help="Per-request auth overhead, before and after the token cache")
+    auth_parser.add_argument("--iterations", type=int, default=20000, help="Verifications per variant (default: 20000)")
+    auth_parser.set_defaults(func=bench_auth)
+
+    dashboard_parser = subparsers.add_parser("dashboard", help="Concurrent dashboard clients polling stats and events")
+    dashboard_parser.add_argument("--token", required=True, help="Access token for an existing account")
+    dashboard_parser.add_argument("--levels", default="50,200,500", help="Comma-separated client counts (default: 50,200,500)")
+    dashboard_parser.add_argument("--duration", type=float, default=20, help="Seconds of polling per level (default: 20)")
+    dashboard_parser.add_argument("--poll-interval", type=float, default=5, help="Seconds between refreshes per client (default: 5)")
+    dashboard_parser.set_defaults(func=bench_dashboard)
+
+    stress_parser = subparsers.add_parser("storage-stress", help="Concurrent FileStorage reads/writes with consistency checks")
+    stress_parser.add_argument("--writers", type=int, default=4, help="Writer threads (default: 4)")
+    stress_parser.add_argument("--readers", type=int, default=4, help="Reader threads (default: 4)")
+    stress_parser.add_argument("--writes", type=int, default=50, help="Power logs per writer (default: 50)")
+    stress_parser.set_defaults(func=bench_storage_stress)
+
+    encoding_parser = subparsers.add_parser("encoding", help="Bytes and CPU per response for JSON encoders and compression")
+    encoding_parser.add_argument("--iterations", type=int, default=500, help="Repetitions per measurement (default: 500)")
+    encoding_parser.add_argument("--days", type=int, default=30, help="Days of power log history in the payloads (default: 30)")
+    encoding_parser.set_defaults(func=bench_encoding)
+
+    analytics_parser = subparsers.add_parser("analytics", help="Pure-Python vs NumPy supply-hour analytics")
+    analytics_parser.add_argument("--sizes", default="10000,100000,1000000,10000000",
+                                  help="Comma-separated event counts (default: 10000,100000,1000000,10000000)")
+    analytics_parser.set_defaults(func=bench_analytics)
+
+    report_parser = subparsers.add_parser("report", help="/api/report from logs vs from the cached event series")
+    report_parser.add_argument("--logs", type=int, default=200000, help="Power logs in storage (default: 200000)")
+    report_parser.add_argument("--users", type=int, default=1, help="Users the logs are spread over (default: 1)")
+    report_parser.add_argument("--iterations", type=int, default=20, help="Reports per measurement (default: 20)")
+    report_parser.set_defaults(func=bench_report)
+
+    startup_parser = subparsers.add_parser("startup", help="Time from process launch to the first GET / response")
+    startup_parser.add_argument("--runs", type=int, default=5, help="Launches per mode (default: 5)")
+    startup_parser.add_argument("--server", choices=sorted(SERVER_COMMANDS), default="dev",
+                                help="Server to launch (default: dev, i.e. python app.py)")
+    startup_parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for each launch (default: 60)")
+    startup_parser.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
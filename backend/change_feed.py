@@ -0,0 +1,133 @@
+"""
+Append-only change feed over power logs, behind GET /api/admin/changes.
+
+Every power log write is appended to data/changes.jsonl as
+
+    {"seq": 42, "op": "insert", "collection": "power_logs", "at": "...", "record": {...}}
+
+with seq increasing by one per change, in commit order. A consumer keeps the
+last seq it has processed and asks for the changes after it, so syncing
+costs the changes since the last sync rather than a copy of the whole
+dataset. Moving logs to the cold archive isn't a change and isn't recorded.
+
+Reads don't scan the journal from the start: every CHANGE_FEED_CHECKPOINT
+entries the byte offset of the entry is kept in memory, so a read seeks to
+the checkpoint before `after` and reads at most that many entries too many.
+A reader that is caught up can wait for the next append (long-poll).
+"""
+import bisect
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CHECKPOINT_EVERY = 256
+
+
+class ChangeFeed:
+    def __init__(self, path: str, checkpoint_every: int = CHECKPOINT_EVERY):
+        self.path = path
+        self.checkpoint_every = max(1, checkpoint_every)
+        self._checkpoints: List[Tuple[int, int]] = []   # (seq, byte offset), ascending
+        self._latest_seq = 0
+        self._end = 0   # Offset just past the last complete entry
+        self._changed = threading.Condition()
+        self._load()
+        self._journal = open(self.path, 'ab')
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        seq = json.loads(line)['seq']
+                    except (ValueError, KeyError, TypeError):
+                        break  # Torn last line from a crash; truncated below
+                    self._index(seq, offset)
+                    offset += len(line)
+                    self._end = offset
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            return
+        if os.path.getsize(self.path) > self._end:
+            with open(self.path, 'r+b') as f:
+                f.truncate(self._end)
+
+    def _index(self, seq: int, offset: int):
+        if (seq - 1) % self.checkpoint_every == 0:
+            self._checkpoints.append((seq, offset))
+        self._latest_seq = seq
+
+    @property
+    def latest_seq(self) -> int:
+        return self._latest_seq
+
+    def append(self, collection: str, op: str, records: Iterable[Dict]):
+        """Record committed changes; callers hold their storage write lock, so seqs follow commit order"""
+        with self._changed:
+            at = datetime.utcnow().isoformat()
+            lines = []
+            seq, offset = self._latest_seq, self._end
+            for record in records:
+                seq += 1
+                line = (json.dumps({'seq': seq, 'op': op, 'collection': collection, 'at': at,
+                                    'record': record}, default=str) + '\n').encode('utf-8')
+                lines.append((seq, offset, line))
+                offset += len(line)
+            if not lines:
+                return
+            try:
+                self._journal.write(b''.join(line for _, _, line in lines))
+                self._journal.flush()
+            except OSError as e:
+                # The write itself is already committed, so it isn't failed; drop any
+                # partial line so later entries stay readable
+                print(f"❌ Could not append {len(lines)} change(s) to {self.path}: {e}")
+                try:
+                    self._journal.truncate(self._end)
+                except OSError:
+                    pass
+                return
+            for seq, line_offset, _ in lines:
+                self._index(seq, line_offset)
+            self._end = offset
+            self._changed.notify_all()
+
+    def read(self, after: int, limit: int = 100, wait: float = 0) -> List[Dict]:
+        """
+        Up to `limit` changes with seq > after, in order. If there are none yet,
+        waits up to `wait` seconds for one to be appended.
+        """
+        with self._changed:
+            if wait > 0 and self._latest_seq <= after:
+                self._changed.wait_for(lambda: self._latest_seq > after, timeout=wait)
+            end = self._end
+            checkpoints = self._checkpoints
+            if self._latest_seq <= after:
+                return []
+        # Last checkpoint at or before the first wanted entry
+        position = bisect.bisect_right(checkpoints, (after + 1, float('inf'))) - 1
+        offset = checkpoints[position][1] if position >= 0 else 0
+        changes = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            while offset < end and len(changes) < limit:
+                line = f.readline()
+                offset += len(line)
+                change = json.loads(line)
+                if change['seq'] > after:
+                    changes.append(change)
+        return changes
+
+    def close(self):
+        self._journal.close()
+
+
+def create_change_feed(data_dir: str) -> Optional[ChangeFeed]:
+    """The power log change feed, or None when CHANGE_FEED=0"""
+    if os.environ.get('CHANGE_FEED', '1') == '0':
+        return None
+    return ChangeFeed(os.path.join(data_dir, 'changes.jsonl'),
+                      checkpoint_every=int(os.environ.get('CHANGE_FEED_CHECKPOINT', CHECKPOINT_EVERY)))
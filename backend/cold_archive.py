@@ -0,0 +1,151 @@
+"""
+Cold archive for power logs older than the hot window.
+
+FileStorage keeps only the last POWER_LOG_HOT_DAYS days of power logs in
+power_logs.json (and so in memory). Whole months older than that are moved
+to data/archive/, one gzip file per month:
+
+    power_logs-2025-01-<generation>.gz   one gzip member per user, each
+                                         holding that user's logs of the
+                                         month as NDJSON, by timestamp
+    power_logs-2025-01.json              index: per user the byte offset,
+                                         length and count of their member
+                                         and their last event of the month
+
+A read for one user and month seeks to the user's member and decompresses
+only that, so old ranges cost the months they cover, not the archive size.
+The indexes (a few numbers per user per month) stay in memory.
+
+Rewriting a month (when late logs for it are archived) writes a new data
+file under a new generation and then atomically replaces the index, so a
+crash at any point leaves either the old or the new month readable. Logs
+are copied to the archive before being dropped from power_logs.json; after
+a crash in between, the same log can be in both, so readers skip archived
+logs whose id is still hot and the next archive run merges them by id.
+"""
+import glob
+import gzip
+import json
+import os
+import time
+import uuid
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from metrics import observe_storage
+
+INDEX_PATTERN = 'power_logs-*.json'
+
+
+class ColdArchive:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._indexes: Dict[str, Dict] = {}   # 'YYYY-MM' -> index
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, INDEX_PATTERN)):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                self._indexes[index['month']] = index
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️  Skipping unreadable archive index {path}: {e}")
+        self._remove_orphans()
+
+    def _remove_orphans(self):
+        """Delete data files no index points to (left by a crash mid-rewrite)"""
+        referenced = {index['data'] for index in self._indexes.values()}
+        for path in glob.glob(os.path.join(self.directory, 'power_logs-*.gz*')):
+            if os.path.basename(path) not in referenced:
+                os.remove(path)
+
+    def months(self) -> List[str]:
+        return sorted(self._indexes)
+
+    def max_id(self) -> int:
+        return max((index.get('max_id', 0) for index in self._indexes.values()), default=0)
+
+    def last_events(self) -> Dict[str, Dict]:
+        """Each archived user's latest event {'event_type', 'timestamp', 'region_id'}"""
+        indexes = self._indexes
+        latest = {}
+        for month in sorted(indexes):
+            for user_id, entry in indexes[month]['users'].items():
+                latest[user_id] = entry['last']
+        return latest
+
+    def user_months(self, user_id: str) -> List[str]:
+        indexes = self._indexes
+        return [month for month in sorted(indexes) if user_id in indexes[month]['users']]
+
+    def read(self, month: str, user_id: str) -> List[Dict]:
+        """One user's archived logs of a month, decompressing only their member"""
+        started = time.perf_counter()
+        for attempt in range(2):
+            index = self._indexes.get(month)
+            entry = index['users'].get(user_id) if index else None
+            if entry is None:
+                return []
+            try:
+                with open(os.path.join(self.directory, index['data']), 'rb') as f:
+                    f.seek(entry['offset'])
+                    member = f.read(entry['length'])
+                break
+            except FileNotFoundError:
+                if attempt:
+                    raise  # Otherwise the month was rewritten meanwhile; retry with the new index
+        logs = [json.loads(line) for line in gzip.decompress(member).splitlines() if line]
+        observe_storage('archive_read', 'power_logs', started, len(logs))
+        return logs
+
+    def iter_month(self, month: str) -> Iterator[Dict]:
+        """Every archived log of a month, user by user, each user's by timestamp"""
+        index = self._indexes.get(month)
+        if index is None:
+            return
+        with open(os.path.join(self.directory, index['data']), 'rb') as f:
+            for entry in sorted(index['users'].values(), key=lambda entry: entry['offset']):
+                f.seek(entry['offset'])
+                for line in gzip.decompress(f.read(entry['length'])).splitlines():
+                    if line:
+                        yield json.loads(line)
+
+    def write_month(self, month: str, logs: Iterable[Dict]):
+        """Add logs to a month, merging by id with what is already archived"""
+        started = time.perf_counter()
+        by_id = {log.get('id'): log for log in self.iter_month(month)}
+        by_id.update((log.get('id'), log) for log in logs)
+        by_user: Dict[str, List[Dict]] = {}
+        for log in by_id.values():
+            by_user.setdefault(log.get('user_id'), []).append(log)
+
+        data_name = f'power_logs-{month}-{uuid.uuid4().hex[:8]}.gz'
+        users = {}
+        with open(os.path.join(self.directory, data_name), 'wb') as f:
+            for user_id, user_logs in by_user.items():
+                user_logs.sort(key=lambda log: log.get('timestamp', ''))
+                body = ''.join(json.dumps(log, default=str) + '\n' for log in user_logs)
+                member = gzip.compress(body.encode('utf-8'))
+                last = user_logs[-1]
+                users[user_id] = {
+                    'offset': f.tell(),
+                    'length': len(member),
+                    'count': len(user_logs),
+                    'last': {'event_type': last.get('event_type'), 'timestamp': last.get('timestamp'),
+                             'region_id': last.get('region_id')},
+                }
+                f.write(member)
+            f.flush()
+            os.fsync(f.fileno())
+
+        index = {'month': month, 'data': data_name,
+                 'max_id': max((log_id or 0 for log_id in by_id), default=0), 'users': users}
+        index_path = os.path.join(self.directory, f'power_logs-{month}.json')
+        with open(f'{index_path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(f'{index_path}.tmp', index_path)
+
+        previous: Optional[Dict] = self._indexes.get(month)
+        # Replaced rather than mutated, so readers iterating the old dict aren't disturbed
+        self._indexes = {**self._indexes, month: index}
+        if previous is not None:
+            os.remove(os.path.join(self.directory, previous['data']))
+        observe_storage('archive_write', 'power_logs', started, len(by_id))
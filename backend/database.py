@@ -4,6 +4,8 @@ All data is stored in backend/data/ directory
 """
 from datetime import datetime
 import os
+import threading
+import time
 
 # Storage mode is always 'file' now
 STORAGE_MODE = 'file'
@@ -33,14 +35,41 @@ class DeviceId:
     """Dummy class for compatibility"""
     pass
 
-def init_db(app):
-    """Initialize file-based storage"""
+def init_db(app, background=False, on_ready=None):
+    """
+    Initialize file-based storage.
+    With background=True the JSON files are loaded on a daemon thread so the
+    app can start answering requests (e.g. the / health check) immediately;
+    storage calls made before loading finishes wait for it. on_ready, if
+    given, is called with the load time in seconds.
+    """
     global STORAGE_MODE
     STORAGE_MODE = 'file'
     
-    try:
+    def load():
         from file_storage import get_file_storage
-        file_storage = get_file_storage()
+        started = time.perf_counter()
+        get_file_storage()
+        elapsed = time.perf_counter() - started
+        if on_ready:
+            on_ready(elapsed)
+        return elapsed
+    
+    if background:
+        def warm():
+            try:
+                elapsed = load()
+                print(f"✅ File-based storage warmed in background ({elapsed * 1000:.1f} ms)")
+            except Exception as file_error:
+                # Requests will retry loading on first storage access
+                print(f"❌ Background storage warm-up failed: {file_error}")
+        
+        threading.Thread(target=warm, name='storage-warmup', daemon=True).start()
+        print("⏳ File-based storage warming up in background")
+        return
+    
+    try:
+        load()
         print("✅ File-based storage initialized")
         print("   Data will be stored in backend/data/ directory")
         print("   Files: users.json, power_logs.json, verification_codes.json, device_ids.json")
@@ -48,4 +77,3 @@ def init_db(app):
         print(f"❌ File storage initialization failed: {file_error}")
         print("   Application cannot start without storage")
         raise
-
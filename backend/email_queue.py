@@ -0,0 +1,434 @@
+"""
+Background outbound email dispatch.
+
+Messages are spooled to backend/data/email_spool/ (one JSON file per message)
+and delivered by a small pool of worker threads that share a single keep-alive
+requests.Session. Transient failures (timeouts, connection errors, 429 and 5xx
+responses) are retried with exponential backoff; every message keeps a status
+that the API can look up by message ID.
+
+Several gunicorn workers share the spool. Each undelivered message is owned
+by the process holding an flock on its "<id>.lock" file, so a restart
+doesn't have every worker send the whole spool again, and a dead worker's
+locks are released with it so its messages are claimed on the next scan
+(when a worker's queue starts, then with the first message queued after
+every RESCAN_SECONDS). Status is written to the message's file on every
+change, so any worker can look it up.
+"""
+import heapq
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process owns the spool
+    fcntl = None
+
+from file_storage import DATA_DIR
+from metrics import EMAIL_SEND_ATTEMPTS, EMAIL_SEND_DURATION
+
+SPOOL_DIR = os.path.join(DATA_DIR, 'email_spool')
+
+STATUS_QUEUED = 'queued'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+FINAL_STATUSES = (STATUS_SENT, STATUS_FAILED)
+
+# Fields of a spooled message that are safe to return from the API
+PUBLIC_FIELDS = ('id', 'status', 'attempts', 'created_at', 'updated_at', 'last_error', 'provider_id')
+MESSAGE_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+# How often the spool is rescanned for messages of workers that died
+RESCAN_SECONDS = 600
+
+logger = logging.getLogger(__name__)
+
+
+def _write_message_file(spool_dir: str, message: Dict):
+    """Atomically write one spooled message to disk"""
+    path = os.path.join(spool_dir, f"{message['id']}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(message, f)
+    os.replace(tmp_path, path)
+
+
+def _read_message_file(spool_dir: str, message_id: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(spool_dir, f"{message_id}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _remove_message_file(spool_dir: str, message_id: str):
+    try:
+        os.remove(os.path.join(spool_dir, f"{message_id}.json"))
+    except FileNotFoundError:
+        pass
+
+
+def _remove_lock_file(spool_dir: str, message_id: str):
+    try:
+        os.remove(os.path.join(spool_dir, f"{message_id}.lock"))
+    except FileNotFoundError:
+        pass
+
+
+class EmailQueue:
+    """Persistent email spool with a worker thread pool and retry/backoff"""
+
+    def __init__(self, api_url: str, api_key: str, spool_dir: str = SPOOL_DIR,
+                 workers: int = 2, max_attempts: int = 4, backoff_base: float = 2.0,
+                 timeout: float = 10.0, retention_seconds: float = 86400.0):
+        self.api_url = api_url
+        self.spool_dir = spool_dir
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.retention_seconds = retention_seconds
+
+        # Imported here so app startup doesn't pay for requests/urllib3
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+
+        # Messages this process owns; others' are read from the spool
+        self._messages: Dict[str, Dict] = {}
+        self._claims: Dict[str, Optional[int]] = {}  # message_id -> locked fd
+        self._schedule: List = []  # min-heap of (due_time, message_id)
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._last_prune = time.time()
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with self._cond:
+            self._load_spool()
+
+    def _claim(self, message_id: str) -> bool:
+        """Take ownership of a message unless another process holds it (caller holds the lock)"""
+        if message_id in self._claims:
+            return True
+        fd = None
+        if fcntl is not None:
+            fd = os.open(os.path.join(self.spool_dir, f"{message_id}.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+        self._claims[message_id] = fd
+        return True
+
+    def _release(self, message_id: str):
+        """Give up ownership once the message's file is final or the queue stops (caller holds the lock)"""
+        if message_id not in self._claims:
+            return
+        fd = self._claims.pop(message_id)
+        if fd is None:
+            return
+        message = self._messages.get(message_id)
+        if message and message['status'] in FINAL_STATUSES:
+            # Only a finished message's lock file goes: a process still waiting on the old
+            # file would otherwise hold a claim alongside one on a new file
+            _remove_lock_file(self.spool_dir, message_id)
+        os.close(fd)
+
+    def _load_spool(self):
+        """
+        Claim and re-queue undelivered spooled messages nobody else owns, and
+        delete finished ones past retention (caller holds the lock)
+        """
+        now = time.time()
+        requeued = 0
+        for filename in os.listdir(self.spool_dir):
+            message_id = filename[:-len('.json')]
+            if not filename.endswith('.json') or message_id in self._messages:
+                continue
+            try:
+                message = _read_message_file(self.spool_dir, message_id)
+            except Exception as e:
+                logger.warning('Skipping unreadable spooled email', extra={'file': filename, 'error': str(e)})
+                continue
+            if message is None:
+                continue
+
+            if message.get('status') in FINAL_STATUSES:
+                if now - message.get('updated_at', 0) > self.retention_seconds:
+                    _remove_message_file(self.spool_dir, message_id)
+                    _remove_lock_file(self.spool_dir, message_id)
+                continue
+            if not self._claim(message_id):
+                continue
+            # Re-read now that it is ours: its owner may have finished it since
+            message = _read_message_file(self.spool_dir, message_id)
+            if message is None or message.get('status') in FINAL_STATUSES:
+                self._release(message_id)
+                continue
+
+            # A message left in 'sending' was interrupted by a restart
+            message['status'] = STATUS_QUEUED
+            self._messages[message_id] = message
+            heapq.heappush(self._schedule, (message.get('next_attempt_at', now), message_id))
+            requeued += 1
+
+        if requeued:
+            logger.info('Email queue re-queued spooled messages', extra={'count': requeued})
+            self._cond.notify_all()
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'email-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the worker threads; undelivered messages stay in the spool"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._cond:
+            # Left for whichever process scans the spool next
+            for message_id in list(self._claims):
+                self._release(message_id)
+        self.session.close()
+
+    def enqueue(self, to: str, subject: str, html: str, sender: str,
+                context: Optional[Dict] = None) -> Dict:
+        """Spool a message for delivery and return its status record"""
+        now = time.time()
+        message = {
+            'id': uuid.uuid4().hex,
+            'status': STATUS_QUEUED,
+            'attempts': 0,
+            'created_at': now,
+            'updated_at': now,
+            'next_attempt_at': now,
+            'last_error': None,
+            'provider_id': None,
+            'payload': {
+                'from': sender,
+                'to': [to],
+                'subject': subject,
+                'html': html
+            },
+            'context': context or {}
+        }
+        self.start()
+        with self._cond:
+            # Claimed before it is written, so no other process's scan picks it up
+            self._claim(message['id'])
+            _write_message_file(self.spool_dir, message)
+            self._messages[message['id']] = message
+            heapq.heappush(self._schedule, (now, message['id']))
+            self._cond.notify()
+            if now - self._last_prune > RESCAN_SECONDS:
+                self._prune(now)
+                self._load_spool()
+        return self.get_status(message['id'])
+
+    def get_message(self, message_id: str) -> Optional[Dict]:
+        """A message's record, from memory if this process owns it, else from the spool"""
+        with self._cond:
+            message = self._messages.get(message_id)
+            if message:
+                return dict(message)
+        if not MESSAGE_ID_PATTERN.fullmatch(message_id):
+            return None
+        try:
+            return _read_message_file(self.spool_dir, message_id)
+        except ValueError:
+            return None  # Being replaced; os.replace makes this unlikely
+
+    def get_status(self, message_id: str) -> Optional[Dict]:
+        """Public status view of a message (no recipient or body)"""
+        message = self.get_message(message_id)
+        if not message:
+            return None
+        return {field: message.get(field) for field in PUBLIC_FIELDS}
+
+    def wait(self, message_id: str, timeout: float) -> Optional[Dict]:
+        """
+        Wait up to `timeout` seconds for the first delivery attempt to finish.
+        Returns the status record at that point (possibly still 'queued').
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                message = self._messages.get(message_id)
+                if not message:
+                    return None
+                if message['status'] in FINAL_STATUSES or (
+                        message['attempts'] > 0 and message['status'] != STATUS_SENDING):
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return self.get_status(message_id)
+
+    def _prune(self, now: float):
+        """Forget finished messages older than the retention window (caller holds the lock)"""
+        self._last_prune = now
+        expired = [
+            message_id for message_id, message in self._messages.items()
+            if message['status'] in FINAL_STATUSES
+            and now - message['updated_at'] > self.retention_seconds
+        ]
+        for message_id in expired:
+            del self._messages[message_id]
+            _remove_message_file(self.spool_dir, message_id)
+
+    def _next_due(self) -> Optional[str]:
+        """Block until a message is due; returns its ID, or None when stopping"""
+        with self._cond:
+            while not self._stopping:
+                now = time.time()
+                if self._schedule and self._schedule[0][0] <= now:
+                    _, message_id = heapq.heappop(self._schedule)
+                    message = self._messages.get(message_id)
+                    if not message or message['status'] != STATUS_QUEUED:
+                        continue
+                    message['status'] = STATUS_SENDING
+                    message['attempts'] += 1
+                    message['updated_at'] = now
+                    return message_id
+                self._cond.wait(self._schedule[0][0] - now if self._schedule else None)
+        return None
+
+    def _worker(self):
+        while True:
+            message_id = self._next_due()
+            if message_id is None:
+                return
+            try:
+                self._deliver(message_id)
+            except Exception as e:
+                logger.exception('Email worker error', extra={'email_id': message_id})
+                self._finish(message_id, retry=False, error=str(e))
+
+    def _deliver(self, message_id: str):
+        with self._cond:
+            message = self._messages[message_id]
+            payload = message['payload']
+            attempt = message['attempts']
+
+        import requests
+        started = time.perf_counter()
+        try:
+            try:
+                response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            finally:
+                EMAIL_SEND_DURATION.observe(time.perf_counter() - started)
+        except requests.exceptions.Timeout:
+            self._finish(message_id, retry=True, error=f'Timeout after {self.timeout} seconds')
+            return
+        except requests.exceptions.RequestException as e:
+            self._finish(message_id, retry=True, error=f'Request failed: {e}')
+            return
+
+        if response.status_code in (200, 201, 202):
+            try:
+                provider_id = response.json().get('id')
+            except ValueError:
+                provider_id = None
+            logger.info('Email sent', extra={'email_id': message_id, 'attempt': attempt, 'provider_id': provider_id})
+            self._finish(message_id, sent=True, provider_id=provider_id)
+            return
+
+        try:
+            error_data = response.json() if response.content else {}
+        except ValueError:
+            error_data = {}
+        error_msg = f"HTTP {response.status_code}: {error_data.get('message', response.reason)}"
+        retryable = response.status_code == 429 or response.status_code >= 500
+        if response.status_code == 403:
+            logger.warning('Resend rejected the email; the account may be in testing mode '
+                           '(verify a domain at https://resend.com/domains)', extra={'email_id': message_id})
+        self._finish(message_id, retry=retryable, error=error_msg)
+
+    def _finish(self, message_id: str, sent: bool = False, retry: bool = False,
+                error: Optional[str] = None, provider_id: Optional[str] = None):
+        """Record the outcome of a delivery attempt and persist it"""
+        now = time.time()
+        with self._cond:
+            message = self._messages[message_id]
+            message['updated_at'] = now
+            if sent:
+                outcome = 'sent'
+                message['status'] = STATUS_SENT
+                message['provider_id'] = provider_id
+                message['last_error'] = None
+            elif retry and message['attempts'] < self.max_attempts:
+                outcome = 'retry'
+                delay = self.backoff_base * (2 ** (message['attempts'] - 1))
+                delay *= 1 + random.random() * 0.25
+                message['status'] = STATUS_QUEUED
+                message['last_error'] = error
+                message['next_attempt_at'] = now + delay
+                heapq.heappush(self._schedule, (message['next_attempt_at'], message_id))
+                logger.warning('Email attempt failed, retrying', extra={
+                    'email_id': message_id, 'attempt': message['attempts'], 'error': error,
+                    'retry_in_seconds': round(delay, 1)})
+            else:
+                outcome = 'failed'
+                message['status'] = STATUS_FAILED
+                message['last_error'] = error
+                logger.error('Email failed', extra={
+                    'email_id': message_id, 'attempts': message['attempts'], 'error': error})
+            self._cond.notify_all()
+            # Written before the claim is released, so a process that claims it next sees the outcome
+            try:
+                _write_message_file(self.spool_dir, message)
+            except Exception:
+                logger.exception('Error persisting email status', extra={'email_id': message_id})
+            if message['status'] in FINAL_STATUSES:
+                self._release(message_id)
+        EMAIL_SEND_ATTEMPTS.labels(outcome).inc()
+
+
+# Global email queue instance
+email_queue = None
+_email_queue_lock = threading.Lock()
+
+
+def get_email_queue() -> EmailQueue:
+    """Get or create the email queue, configured from environment variables"""
+    global email_queue
+    if email_queue is None:
+        with _email_queue_lock:
+            if email_queue is None:
+                email_queue = EmailQueue(
+                    api_url=os.environ.get('RESEND_API_URL', 'https://api.resend.com/emails'),
+                    api_key=os.environ.get('RESEND_API_KEY', ''),
+                    workers=int(os.environ.get('EMAIL_WORKERS', 2)),
+                    max_attempts=int(os.environ.get('EMAIL_MAX_ATTEMPTS', 4)),
+                    backoff_base=float(os.environ.get('EMAIL_RETRY_BACKOFF_SECONDS', 2.0)),
+                    timeout=float(os.environ.get('EMAIL_SEND_TIMEOUT', 10))
+                )
+    return email_queue
@@ -0,0 +1,248 @@
+"""
+In-process publish/subscribe behind the live event stream (GET /api/events/stream).
+
+Events are published to topics such as "user:<username>" and
+"region:<region_id>". Every event gets an ID "<instance>-<seq>", where seq
+increases across all topics, and is encoded into its text/event-stream frame
+once, so fanning it out to many streams shares the same bytes. The last
+EVENT_REPLAY_SIZE events are kept in a ring buffer: a client reconnecting
+with Last-Event-ID is sent the events it missed. If that ID is older than the
+buffer or came from another process (a restart, or another gunicorn worker),
+the client is sent a "resync" event instead and should refetch its state.
+
+Each stream has a bounded inbox that publishers append to; a stream that
+falls EVENT_MAX_PENDING events behind is sent a resync and closed rather than
+slowing publishers down. An idle stream costs its inbox and a wait on an
+Event, so served by the ASGI app (asgi_app.py) thousands of open streams cost
+a coroutine each. Under gunicorn each open stream holds a worker thread for
+up to EVENT_STREAM_MAX_SECONDS, after which the browser reconnects and
+resumes.
+"""
+import asyncio
+import itertools
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+HEARTBEAT_FRAME = b': heartbeat\n\n'
+
+
+class Event(NamedTuple):
+    seq: int
+    topic: str
+    frame: bytes
+
+
+class Subscriber(ABC):
+    """Bounded inbox for one open stream; publishers append, the stream drains"""
+
+    def __init__(self, topics: Iterable[str], max_pending: int = 100):
+        self.topics = frozenset(topics)
+        self.max_pending = max_pending
+        self.overflowed = False
+        self._pending = deque()
+
+    def deliver(self, event: Event):
+        # Called from the publishing thread; deque appends are thread-safe
+        if len(self._pending) >= self.max_pending:
+            self.overflowed = True
+        else:
+            self._pending.append(event)
+        self._wake()
+
+    def drain(self) -> List[Event]:
+        events = []
+        while self._pending:
+            events.append(self._pending.popleft())
+        return events
+
+    @abstractmethod
+    def _wake(self):
+        """Wake the stream waiting on this inbox; called from publishing threads"""
+
+
+class ThreadSubscriber(Subscriber):
+    """Subscriber consumed by a blocking generator (the Flask route)"""
+
+    def __init__(self, topics: Iterable[str], max_pending: int = 100):
+        super().__init__(topics, max_pending)
+        self._ready = threading.Event()
+
+    def _wake(self):
+        self._ready.set()
+
+    def wait(self, timeout: float) -> List[Event]:
+        """Events delivered since the last call, waiting up to timeout seconds for one"""
+        self._ready.wait(timeout)
+        self._ready.clear()
+        return self.drain()
+
+
+class AsyncSubscriber(Subscriber):
+    """Subscriber consumed by a coroutine on an event loop (the ASGI route)"""
+
+    def __init__(self, topics: Iterable[str], loop: asyncio.AbstractEventLoop, max_pending: int = 100):
+        super().__init__(topics, max_pending)
+        self._loop = loop
+        self._ready = asyncio.Event()
+
+    def _wake(self):
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # Loop already closed; the stream is gone
+
+    async def wait(self, timeout: float) -> List[Event]:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._ready.clear()
+        return self.drain()
+
+
+class EventBus:
+    def __init__(self, dumps: Callable[[object], bytes], replay_size: int = 1000,
+                 max_pending: int = 100, heartbeat_seconds: float = 15.0, retry_ms: int = 3000):
+        self.instance = uuid.uuid4().hex[:8]
+        self.max_pending = max_pending
+        self.heartbeat_seconds = heartbeat_seconds
+        self.retry_ms = retry_ms
+        self._dumps = dumps
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history: deque = deque(maxlen=max(1, replay_size))
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+
+    def _event_id(self, seq: int) -> str:
+        return f'{self.instance}-{seq}'
+
+    def _parse_event_id(self, event_id: str) -> Optional[int]:
+        """Sequence number of an ID issued by this process, else None"""
+        instance, _, seq = event_id.rpartition('-')
+        if instance != self.instance or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(set().union(*self._subscribers.values())) if self._subscribers else 0
+
+    def has_subscribers(self, topic: str) -> bool:
+        """Whether any open stream listens to topic, so publishers can skip building unused events"""
+        with self._lock:
+            return bool(self._subscribers.get(topic))
+
+    def publish(self, topic: str, event_type: str, data) -> str:
+        """Send an event to every stream subscribed to topic; returns its ID"""
+        payload = self._dumps(data).decode('utf-8')
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            frame = f'id: {self._event_id(seq)}\nevent: {event_type}\ndata: {payload}\n\n'.encode('utf-8')
+            event = Event(seq, topic, frame)
+            self._history.append(event)
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscriber in subscribers:
+            subscriber.deliver(event)
+        return self._event_id(seq)
+
+    def subscribe(self, subscriber: Subscriber, last_event_id: Optional[str] = None) -> Tuple[List[Event], Optional[bytes]]:
+        """
+        Register a subscriber. Returns (missed events to replay, resync frame),
+        where the resync frame is set when the missed events can't be replayed.
+        Registration and the replay snapshot happen under the publish lock, so
+        no event is both replayed and delivered, or neither.
+        """
+        with self._lock:
+            for topic in subscriber.topics:
+                self._subscribers.setdefault(topic, set()).add(subscriber)
+            if not last_event_id:
+                return [], None
+            after = self._parse_event_id(last_event_id)
+            oldest = self._history[0].seq if self._history else self._seq + 1
+            if after is None or after > self._seq or after + 1 < oldest:
+                return [], self._resync_frame()
+            missed = [event for event in itertools.islice(self._history, after + 1 - oldest, None)
+                      if event.topic in subscriber.topics]
+            return missed, None
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            for topic in subscriber.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def _resync_frame(self) -> bytes:
+        # Carries the current ID so the client resumes from here after refetching.
+        # Callers hold self._lock.
+        return f'id: {self._event_id(self._seq)}\nevent: resync\ndata: {{}}\n\n'.encode('utf-8')
+
+    def resync_frame(self) -> bytes:
+        with self._lock:
+            return self._resync_frame()
+
+    def _open(self, subscriber: Subscriber, last_event_id: Optional[str]) -> bytes:
+        """Subscribe and build the first chunk of the stream: retry hint plus replay or resync"""
+        missed, resync = self.subscribe(subscriber, last_event_id)
+        frames = [f'retry: {self.retry_ms}\n\n'.encode('utf-8')]
+        if resync:
+            frames.append(resync)
+        else:
+            frames.extend(event.frame for event in missed)
+        return b''.join(frames)
+
+    def _timeout(self, deadline: Optional[float]) -> float:
+        if deadline is None:
+            return self.heartbeat_seconds
+        return min(self.heartbeat_seconds, deadline - time.monotonic())
+
+    def stream(self, topics: Iterable[str], last_event_id: Optional[str] = None,
+               max_seconds: float = 0) -> Iterator[bytes]:
+        """Blocking text/event-stream body; ends after max_seconds (0 = never)"""
+        subscriber = ThreadSubscriber(topics, self.max_pending)
+        try:
+            yield self._open(subscriber, last_event_id)
+            deadline = time.monotonic() + max_seconds if max_seconds > 0 else None
+            while (timeout := self._timeout(deadline)) > 0:
+                events = subscriber.wait(timeout)
+                if subscriber.overflowed:
+                    yield self.resync_frame()
+                    return
+                yield b''.join(event.frame for event in events) if events else HEARTBEAT_FRAME
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def astream(self, topics: Iterable[str], last_event_id: Optional[str] = None,
+                      max_seconds: float = 0) -> AsyncIterator[bytes]:
+        """Async variant of stream() for the ASGI app"""
+        subscriber = AsyncSubscriber(topics, asyncio.get_running_loop(), self.max_pending)
+        try:
+            yield self._open(subscriber, last_event_id)
+            deadline = time.monotonic() + max_seconds if max_seconds > 0 else None
+            while (timeout := self._timeout(deadline)) > 0:
+                events = await subscriber.wait(timeout)
+                if subscriber.overflowed:
+                    yield self.resync_frame()
+                    return
+                yield b''.join(event.frame for event in events) if events else HEARTBEAT_FRAME
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def create_event_bus(dumps: Callable[[object], bytes]) -> EventBus:
+    """Build the event bus from environment variables"""
+    return EventBus(
+        dumps,
+        replay_size=int(os.environ.get('EVENT_REPLAY_SIZE', 1000)),
+        max_pending=int(os.environ.get('EVENT_MAX_PENDING', 100)),
+        heartbeat_seconds=float(os.environ.get('EVENT_HEARTBEAT_SECONDS', 15)),
+        retry_ms=int(os.environ.get('EVENT_RETRY_MS', 3000)),
+    )
@@ -1,13 +1,31 @@
 """
 File-based storage fallback when PostgreSQL is unavailable.
 Stores data in JSON files in backend/data/ directory.
+
+Concurrency model (safe for gunicorn --threads): each collection is an
+immutable-by-convention list snapshot. Writers serialize on a single lock,
+build a new list, persist it and then swap the attribute reference, so readers
+never take a lock and always see a complete snapshot. Stored dicts are never
+mutated in place; updates replace them with copies.
 """
 import json
 import os
-from datetime import datetime, date
-from typing import List, Dict, Optional
+import threading
+import time
+import uuid
+from datetime import datetime, date, timedelta
+from typing import Callable, Iterator, List, Dict, Optional, Set, Tuple
 import hashlib
 
+from metrics import REGISTRY, CallbackGauge, observe_storage
+from supply_bitmaps import SupplyBitmaps, create_supply_bitmaps
+from history_tiers import HistoryTiers, create_history_tiers
+from user_event_index import UserEventIndex
+from cold_archive import ColdArchive
+from change_feed import ChangeFeed, create_change_feed
+from verification_store import VerificationStore, create_verification_store
+from analytics import EventSeries, SeriesBuffer, day_start_us, log_event
+
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 
 # Ensure data directory exists
@@ -19,11 +37,23 @@ VERIFICATION_CODES_FILE = os.path.join(DATA_DIR, 'verification_codes.json')
 DEVICE_IDS_FILE = os.path.join(DATA_DIR, 'device_ids.json')
 REGION_PROFILES_FILE = os.path.join(DATA_DIR, 'region_profiles.json')
 
+# Power logs from months entirely older than this many days are moved to the
+# cold archive (see cold_archive.py); 0 keeps everything in power_logs.json
+POWER_LOG_HOT_DAYS = int(os.environ.get('POWER_LOG_HOT_DAYS', 180))
+# How often the background archiver checks for a new day to archive
+POWER_LOG_ARCHIVE_CHECK_SECONDS = float(os.environ.get('POWER_LOG_ARCHIVE_CHECK_SECONDS', 3600))
+
+
+def _collection_name(filepath: str) -> str:
+    """Metrics label for a data file, e.g. data/users.json -> users"""
+    return os.path.splitext(os.path.basename(filepath))[0]
+
 
 def _load_json(filepath: str, default: list = None) -> list:
     """Load JSON file, return default if file doesn't exist"""
     if default is None:
         default = []
+    started = time.perf_counter()
     try:
         if os.path.exists(filepath):
             with open(filepath, 'r', encoding='utf-8') as f:
@@ -32,16 +62,23 @@ def _load_json(filepath: str, default: list = None) -> list:
     except Exception as e:
         print(f"⚠️  Error loading {filepath}: {e}")
         return default
+    finally:
+        observe_storage('load', _collection_name(filepath), started)
 
 
 def _save_json(filepath: str, data: list):
-    """Save data to JSON file"""
+    """Save data to JSON file (atomically, via a temp file and rename)"""
+    started = time.perf_counter()
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=2, default=str)
+        os.replace(tmp_path, filepath)
     except Exception as e:
         print(f"❌ Error saving {filepath}: {e}")
         raise
+    finally:
+        observe_storage('save', _collection_name(filepath), started)
 
 
 def _serialize_datetime(obj):
@@ -51,114 +88,463 @@ def _serialize_datetime(obj):
     raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
 
 
+class AtomicSequence:
+    """Thread-safe monotonically increasing ID sequence"""
+    
+    def __init__(self, start: int = 1):
+        self._next = start
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def after(cls, records: List[Dict], floor: int = 0) -> 'AtomicSequence':
+        """Sequence continuing after the highest 'id' in records (and floor)"""
+        return cls(max(floor, max((r.get('id') or 0 for r in records), default=0)) + 1)
+    
+    def next(self) -> int:
+        with self._lock:
+            value = self._next
+            self._next += 1
+            return value
+
+
 class FileStorage:
     """File-based storage implementation"""
     
-    def __init__(self):
-        self.users = _load_json(USERS_FILE, [])
-        self.power_logs = _load_json(POWER_LOGS_FILE, [])
-        self.verification_codes = _load_json(VERIFICATION_CODES_FILE, [])
-        self.device_ids = _load_json(DEVICE_IDS_FILE, [])
-        self.region_profiles = _load_json(REGION_PROFILES_FILE, [])
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.users_file = os.path.join(data_dir, 'users.json')
+        self.power_logs_file = os.path.join(data_dir, 'power_logs.json')
+        self.verification_codes_file = os.path.join(data_dir, 'verification_codes.json')
+        self.device_ids_file = os.path.join(data_dir, 'device_ids.json')
+        self.region_profiles_file = os.path.join(data_dir, 'region_profiles.json')
+        
+        self.users = _load_json(self.users_file, [])
+        self.power_logs = _load_json(self.power_logs_file, [])
+        self.verification_codes = _load_json(self.verification_codes_file, [])
+        self.device_ids = _load_json(self.device_ids_file, [])
+        self.region_profiles = _load_json(self.region_profiles_file, [])
+        
+        self._write_lock = threading.RLock()
+        # Pending verifications by email and username; expired ones are swept in the background
+        self.verifications: VerificationStore = create_verification_store(
+            self.verification_codes, self._persist_verification_codes, lock=self._write_lock)
+        self.verifications.start_sweeper()
+        self.archive = ColdArchive(os.path.join(data_dir, 'archive'))
+        self._archive_checked: Optional[date] = None
+        self._archive_lock = threading.Lock()   # One archive run at a time
+        self._archiver: Optional[threading.Thread] = None
+        self._stop_archiver = threading.Event()
+        # Power log writes in commit order, for GET /api/admin/changes; None when disabled
+        self.changes: Optional[ChangeFeed] = create_change_feed(data_dir)
+        self._power_log_ids = AtomicSequence.after(self.power_logs, floor=self.archive.max_id())
+        self._device_ids_seq = AtomicSequence.after(self.device_ids)
+        # Per-user change counters for conditional GETs. The instance token
+        # keeps versions from a previous process (or another worker) from
+        # ever matching this one's.
+        self._instance_token = uuid.uuid4().hex[:8]
+        self._user_versions: Dict[str, int] = {}
+        # (user_id, idempotency_key) -> log, for deduplicating client retries
+        self._log_keys: Dict[Tuple[str, str], Dict] = self._index_log_keys(self.power_logs)
+        # user_id -> latest event {'event_type', 'timestamp', 'region_id'}, so the
+        # current power state is a dict lookup instead of a history scan
+        self._power_states: Dict[str, Dict] = self.archive.last_events()
+        for log in self.power_logs:
+            self._track_power_state(log)
+        # Heatmap bitmaps and history tiers, each built on first use rather than at startup
+        self._supply_bitmaps: Optional[SupplyBitmaps] = None
+        self._history_tiers: Optional[HistoryTiers] = None
+        # Indexes being built: attribute -> (index, users not replayed into it yet)
+        self._building: Dict[str, Tuple[UserEventIndex, Set[str]]] = {}
+        self._build_lock = threading.Lock()   # One index build at a time
+        # user_id -> all their events for reports, built on the user's first report
+        self._event_series: Dict[str, SeriesBuffer] = {}
+        # Cold months are moved to the archive on a background thread, not on the write path
+        self.start_archiver()
         print("✅ File storage initialized (PostgreSQL fallback mode)")
     
+    @staticmethod
+    def _index_log_keys(logs: List[Dict]) -> Dict[Tuple[str, str], Dict]:
+        return {(log.get('user_id'), log['idempotency_key']): log for log in logs if log.get('idempotency_key')}
+    
+    def _commit(self, attr: str, filepath: str, records: List[Dict]):
+        """Persist a new snapshot, then publish it (caller holds _write_lock)"""
+        _save_json(filepath, records)
+        setattr(self, attr, records)
+    
+    def _bump_user_version(self, user_id: str):
+        """Mark a user's data as changed (caller holds _write_lock)"""
+        self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+    
+    def _track_power_state(self, log: Dict):
+        """Record a log if it is the user's latest (caller holds _write_lock)"""
+        user_id = log.get('user_id')
+        timestamp = log.get('timestamp') or ''
+        current = self._power_states.get(user_id)
+        # Timestamps are naive UTC ISO strings, so they compare chronologically
+        if current is None or timestamp >= current['timestamp']:
+            # Replaced rather than mutated, so readers never see a half-updated state
+            self._power_states[user_id] = {
+                'event_type': log.get('event_type'),
+                'timestamp': timestamp,
+                'region_id': log.get('region_id'),
+            }
+    
+    def get_power_state(self, user_id: str) -> Optional[Dict]:
+        """The user's latest event {'event_type', 'timestamp', 'region_id'}, or None"""
+        return self._power_states.get(user_id)
+    
+    def get_power_states(self) -> Dict[str, Dict]:
+        """Snapshot of every user's latest event"""
+        return self._power_states.copy()
+    
+    def get_supply_bitmaps(self) -> SupplyBitmaps:
+        """Per-user supply bitmaps, built from the whole history on first use"""
+        return self._get_index('_supply_bitmaps', create_supply_bitmaps)
+    
+    def get_history_tiers(self) -> HistoryTiers:
+        """Hourly to monthly supply totals, built from the whole history on first use"""
+        return self._get_index('_history_tiers', create_history_tiers)
+    
+    def _get_index(self, attr: str, create: Callable[[], UserEventIndex]) -> UserEventIndex:
+        """
+        A supply index, built on first use one user at a time from their
+        time-ordered logs, so only one user's history is in memory and writers
+        only wait while each user's events are replayed. Writes meanwhile are
+        tracked as usual, except for users not replayed yet, who pick them up
+        from storage when their turn comes.
+        """
+        index = getattr(self, attr)
+        if index is not None:
+            return index
+        with self._build_lock:
+            index = getattr(self, attr)
+            if index is not None:
+                return index
+            index = create()
+            with self._write_lock:
+                pending = set(self._power_states)   # Every user with a log, hot or archived
+                self._building[attr] = (index, pending)
+            try:
+                for user_id in sorted(pending):
+                    self._replay_user(index, user_id, pending)
+            finally:
+                with self._write_lock:
+                    del self._building[attr]
+                    if not pending:
+                        setattr(self, attr, index)
+        return index
+    
+    def _replay_user(self, index: UserEventIndex, user_id: str, pending: Set[str]):
+        """Replay a user's logs into an index being built, read without the write lock"""
+        while True:
+            version = self._user_versions.get(user_id, 0)
+            events = [log_event(log) for log in self.iter_power_logs_by_user(user_id)]
+            with self._write_lock:
+                # Written to meanwhile: those logs weren't tracked, so read again
+                if self._user_versions.get(user_id, 0) == version:
+                    index.rebuild(user_id, events)
+                    pending.discard(user_id)
+                    return
+    
+    def _track_supply(self, logs: List[Dict]):
+        """Extend the supply indexes and event series that are built with new logs (caller holds _write_lock)"""
+        logs = sorted(logs, key=lambda log: log.get('timestamp', ''))
+        for index in (self._supply_bitmaps, self._history_tiers):
+            if index is not None:
+                index.add_logs(logs, self.iter_power_logs_by_user)
+        for index, pending in self._building.values():
+            index.add_logs([log for log in logs if log.get('user_id') not in pending], self.iter_power_logs_by_user)
+        for log in logs:
+            buffer = self._event_series.get(log.get('user_id'))
+            if buffer is not None and not buffer.append(*log_event(log)[:2]):
+                # Older than the user's latest event; rebuilt on their next report
+                del self._event_series[log.get('user_id')]
+    
+    def get_event_series(self, user_id: str, start_date: date, min_count: int = 1) -> EventSeries:
+        """The user's events from start_date on, and at least min_count of them"""
+        buffer = self._event_series.get(user_id)
+        if buffer is None:
+            # Built without the write lock, and only kept if the user wasn't written to meanwhile
+            version = self._user_versions.get(user_id, 0)
+            events = sorted((log_event(log)[:2] for log in self.iter_power_logs_by_user(user_id)),
+                            key=lambda event: event[0])
+            buffer = SeriesBuffer(events)
+            with self._write_lock:
+                if self._user_versions.get(user_id, 0) == version:
+                    self._event_series[user_id] = buffer
+        return buffer.window(day_start_us(start_date), min_count)
+    
+    def archive_cold_logs(self, now: Optional[datetime] = None) -> int:
+        """
+        Move logs from months entirely older than POWER_LOG_HOT_DAYS to the
+        cold archive. Runs at most once a day; returns the number moved.
+        Months are compressed and written without the write lock, so writers
+        only wait for the final rewrite of power_logs.json.
+        """
+        now = now or datetime.utcnow()
+        if POWER_LOG_HOT_DAYS <= 0 or self._archive_checked == now.date():
+            return 0
+        with self._archive_lock:
+            if self._archive_checked == now.date():
+                return 0
+            self._archive_checked = now.date()
+            # First day of the month holding the hot window's start, as an ISO prefix
+            cutoff = (now - timedelta(days=POWER_LOG_HOT_DAYS)).strftime('%Y-%m')
+            cold: Dict[str, List[Dict]] = {}
+            for log in self.power_logs:
+                month = (log.get('timestamp') or '')[:7]
+                if month and month < cutoff:
+                    cold.setdefault(month, []).append(log)
+            if not cold:
+                return 0
+            started = time.perf_counter()
+            for month, logs in sorted(cold.items()):
+                self.archive.write_month(month, logs)
+            # Only dropped once they are safely in the archive. Until then readers
+            # skip the archived copies of logs that are still hot; logs written
+            # meanwhile stay hot and are archived on a later run.
+            moved_ids = {log.get('id') for logs in cold.values() for log in logs}
+            with self._write_lock:
+                hot = [log for log in self.power_logs if log.get('id') not in moved_ids]
+                self._commit('power_logs', self.power_logs_file, hot)
+                # Keys of archived logs are too old to be retried (see LOG_POWER_BATCH_MAX_AGE_DAYS)
+                self._log_keys = self._index_log_keys(hot)
+            print(f"🧊 Archived {len(moved_ids)} power logs from {len(cold)} month(s) in "
+                  f"{(time.perf_counter() - started) * 1000:.0f} ms")
+            return len(moved_ids)
+    
+    def _archive_loop(self):
+        while not self._stop_archiver.is_set():
+            try:
+                self.archive_cold_logs()
+            except Exception as e:
+                # The logs stay hot and the next day's run tries again
+                print(f"❌ Archiving cold power logs failed: {e}")
+            self._stop_archiver.wait(POWER_LOG_ARCHIVE_CHECK_SECONDS)
+    
+    def start_archiver(self):
+        """Archive now and then check every POWER_LOG_ARCHIVE_CHECK_SECONDS on a daemon thread"""
+        if POWER_LOG_HOT_DAYS <= 0 or self._archiver is not None:
+            return
+        self._archiver = threading.Thread(target=self._archive_loop, name='power-log-archiver', daemon=True)
+        self._archiver.start()
+    
+    def stop_archiver(self):
+        self._stop_archiver.set()
+    
+    def get_user_data_version(self, user_id: str) -> str:
+        """
+        Opaque token that changes whenever the user's profile or power logs
+        change. It includes a hash of user_id, so two users with the same
+        write count never share one.
+        """
+        user_hash = hashlib.sha256(str(user_id).encode('utf-8')).hexdigest()[:16]
+        return f"{self._instance_token}.{user_hash}.{self._user_versions.get(user_id, 0)}"
+    
     def save_users(self):
-        _save_json(USERS_FILE, self.users)
+        with self._write_lock:
+            _save_json(self.users_file, self.users)
     
     def save_power_logs(self):
-        _save_json(POWER_LOGS_FILE, self.power_logs)
+        with self._write_lock:
+            _save_json(self.power_logs_file, self.power_logs)
     
     def save_verification_codes(self):
-        _save_json(VERIFICATION_CODES_FILE, self.verification_codes)
+        with self._write_lock:
+            _save_json(self.verification_codes_file, self.verification_codes)
+    
+    def _persist_verification_codes(self, records: List[Dict]):
+        # Called by the verification store with _write_lock held
+        self._commit('verification_codes', self.verification_codes_file, records)
     
     def save_device_ids(self):
-        _save_json(DEVICE_IDS_FILE, self.device_ids)
+        with self._write_lock:
+            _save_json(self.device_ids_file, self.device_ids)
     
     # User operations
     def get_user_by_username(self, username: str) -> Optional[Dict]:
-        for user in self.users:
-            if user.get('username') == username:
-                return user
-        return None
+        started = time.perf_counter()
+        users = self.users
+        found = next((user for user in users if user.get('username') == username), None)
+        observe_storage('scan', 'users', started, len(users))
+        return found
     
     def get_user_by_email(self, email: str) -> Optional[Dict]:
-        for user in self.users:
-            if user.get('email') == email:
-                return user
-        return None
+        started = time.perf_counter()
+        users = self.users
+        found = next((user for user in users if user.get('email') == email), None)
+        observe_storage('scan', 'users', started, len(users))
+        return found
     
     def create_user(self, user_data: Dict):
-        # Check if user already exists
-        if self.get_user_by_username(user_data.get('username')):
-            raise ValueError(f"User {user_data.get('username')} already exists")
-        if user_data.get('email') and self.get_user_by_email(user_data.get('email')):
-            raise ValueError(f"Email {user_data.get('email')} already exists")
-        
-        user_data['created_at'] = datetime.utcnow().isoformat()
-        self.users.append(user_data)
-        self.save_users()
+        with self._write_lock:
+            # Check if user already exists
+            if self.get_user_by_username(user_data.get('username')):
+                raise ValueError(f"User {user_data.get('username')} already exists")
+            if user_data.get('email') and self.get_user_by_email(user_data.get('email')):
+                raise ValueError(f"Email {user_data.get('email')} already exists")
+            
+            user_data['created_at'] = datetime.utcnow().isoformat()
+            self._commit('users', self.users_file, self.users + [user_data])
         return user_data
     
+    def update_user(self, username: str, updates: Dict) -> Optional[Dict]:
+        with self._write_lock:
+            users = list(self.users)
+            for index, user in enumerate(users):
+                if user.get('username') == username:
+                    users[index] = {**user, **updates}
+                    self._commit('users', self.users_file, users)
+                    self._bump_user_version(username)
+                    return users[index]
+        return None
+    
     # Power log operations
     def create_power_log(self, log_data: Dict):
-        log_data['id'] = len(self.power_logs) + 1
-        log_data['timestamp'] = datetime.utcnow().isoformat()
-        if isinstance(log_data.get('date'), date):
-            log_data['date'] = log_data['date'].isoformat()
-        self.power_logs.append(log_data)
-        self.save_power_logs()
+        with self._write_lock:
+            log_data['id'] = self._power_log_ids.next()
+            log_data['timestamp'] = datetime.utcnow().isoformat()
+            if isinstance(log_data.get('date'), date):
+                log_data['date'] = log_data['date'].isoformat()
+            self._commit('power_logs', self.power_logs_file, self.power_logs + [log_data])
+            if self.changes is not None:
+                self.changes.append('power_logs', 'insert', [log_data])
+            self._track_power_state(log_data)
+            self._track_supply([log_data])
+            self._bump_user_version(log_data.get('user_id'))
         return log_data
     
+    def create_power_logs(self, logs: List[Dict]) -> List[Tuple[Dict, bool]]:
+        """
+        Insert several logs in one write, keeping their timestamps. A log whose
+        (user_id, idempotency_key) was stored before is skipped. Returns
+        (stored log, created) pairs in input order.
+        """
+        with self._write_lock:
+            results = []
+            created = []
+            new_keys = {}
+            for log_data in logs:
+                key = (log_data.get('user_id'), log_data.get('idempotency_key'))
+                existing = (self._log_keys.get(key) or new_keys.get(key)) if key[1] else None
+                if existing is not None:
+                    results.append((existing, False))
+                    continue
+                log_data['id'] = self._power_log_ids.next()
+                if isinstance(log_data.get('timestamp'), datetime):
+                    log_data['timestamp'] = log_data['timestamp'].isoformat()
+                if isinstance(log_data.get('date'), date):
+                    log_data['date'] = log_data['date'].isoformat()
+                if key[1]:
+                    new_keys[key] = log_data
+                created.append(log_data)
+                results.append((log_data, True))
+            if created:
+                self._commit('power_logs', self.power_logs_file, self.power_logs + created)
+                # Keys are indexed only once the write has succeeded
+                self._log_keys.update(new_keys)
+                if self.changes is not None:
+                    self.changes.append('power_logs', 'insert', created)
+                for log in created:
+                    self._track_power_state(log)
+                self._track_supply(created)
+                for user_id in {log.get('user_id') for log in created}:
+                    self._bump_user_version(user_id)
+        return results
+    
     def get_power_logs_by_user(self, user_id: str, start_date=None, end_date=None) -> List[Dict]:
-        logs = [log for log in self.power_logs if log.get('user_id') == user_id]
+        started = time.perf_counter()
+        power_logs = self.power_logs
+        logs = [log for log in power_logs if log.get('user_id') == user_id]
+        if isinstance(start_date, date):
+            start_date = start_date.isoformat()
+        if isinstance(end_date, date):
+            end_date = end_date.isoformat()
+        
+        # Archived months overlapping the range; only those are decompressed
+        hot_ids = {log.get('id') for log in logs}
+        for month in self.archive.user_months(user_id):
+            if (start_date and month < start_date[:7]) or (end_date and month > end_date[:7]):
+                continue
+            logs.extend(log for log in self.archive.read(month, user_id) if log.get('id') not in hot_ids)
         
         if start_date:
-            if isinstance(start_date, date):
-                start_date = start_date.isoformat()
             logs = [log for log in logs if log.get('date', '') >= start_date]
         
         if end_date:
-            if isinstance(end_date, date):
-                end_date = end_date.isoformat()
             logs = [log for log in logs if log.get('date', '') <= end_date]
         
         # Sort by timestamp
         logs.sort(key=lambda x: x.get('timestamp', ''))
+        observe_storage('scan', 'power_logs', started, len(power_logs))
         return logs
     
+    def iter_power_logs_by_user(self, user_id: str, start_date=None, end_date=None) -> Iterator[Dict]:
+        """
+        A user's logs between two dates (inclusive) by timestamp, like
+        get_power_logs_by_user but holding at most one archived month in memory
+        """
+        if isinstance(start_date, date):
+            start_date = start_date.isoformat()
+        if isinstance(end_date, date):
+            end_date = end_date.isoformat()
+        
+        def in_range(log):
+            log_date = log.get('date', '')
+            return (not start_date or log_date >= start_date) and (not end_date or log_date <= end_date)
+        
+        hot = sorted((log for log in self.power_logs if log.get('user_id') == user_id and in_range(log)),
+                     key=lambda log: log.get('timestamp', ''))
+        hot_ids = {log.get('id') for log in hot}
+        for month in self.archive.user_months(user_id):
+            if (start_date and month < start_date[:7]) or (end_date and month > end_date[:7]):
+                continue
+            for log in self.archive.read(month, user_id):
+                if in_range(log) and log.get('id') not in hot_ids:
+                    yield log
+        yield from hot
+    
     def get_recent_power_logs(self, user_id: str, limit: int = 20) -> List[Dict]:
-        logs = self.get_power_logs_by_user(user_id)
+        power_logs = self.power_logs
+        logs = sorted((log for log in power_logs if log.get('user_id') == user_id),
+                      key=lambda log: log.get('timestamp', ''))
+        # Reach into the archive, newest month first, only when the hot logs fall short
+        hot_ids = {log.get('id') for log in logs}
+        for month in reversed(self.archive.user_months(user_id)):
+            if len(logs) >= limit:
+                break
+            logs[:0] = [log for log in self.archive.read(month, user_id) if log.get('id') not in hot_ids]
         return logs[-limit:]
     
     # Verification code operations
-    def get_verification_code_by_email(self, email: str) -> Optional[Dict]:
-        for code in self.verification_codes:
-            if code.get('email') == email:
-                return code
-        return None
+    def get_verification_code_by_email(self, email: str) -> Optional[Tuple[Dict, datetime]]:
+        """(code record, naive UTC expiry), or None"""
+        return self.verifications.get(email)
+    
+    def get_verification_code_by_username(self, username: str) -> Optional[Tuple[Dict, datetime]]:
+        return self.verifications.get_by_username(username)
     
     def create_or_update_verification_code(self, code_data: Dict):
-        existing = self.get_verification_code_by_email(code_data['email'])
-        if existing:
-            # Update existing
-            existing.update(code_data)
-            existing['expires_at'] = code_data.get('expires_at', datetime.utcnow().isoformat())
-        else:
-            # Create new
-            code_data['expires_at'] = code_data.get('expires_at', datetime.utcnow().isoformat())
-            self.verification_codes.append(code_data)
-        self.save_verification_codes()
+        expires_at = code_data.get('expires_at') or datetime.utcnow()
+        if isinstance(expires_at, datetime):
+            expires_at = expires_at.isoformat()
+        code_data['expires_at'] = expires_at
+        self.verifications.put(code_data)
         return code_data
     
     def delete_verification_code(self, email: str):
-        self.verification_codes = [c for c in self.verification_codes if c.get('email') != email]
-        self.save_verification_codes()
+        self.verifications.delete(email)
+    
+    def record_failed_verification(self, email: str) -> int:
+        """Count a wrong code; returns the attempts left (0 = code cleared until resent)"""
+        return self.verifications.record_failure(email)
     
     # Device ID operations
     def create_device_id(self, device_data: Dict):
-        device_data['id'] = len(self.device_ids) + 1
-        self.device_ids.append(device_data)
-        self.save_device_ids()
+        with self._write_lock:
+            device_data['id'] = self._device_ids_seq.next()
+            self._commit('device_ids', self.device_ids_file, self.device_ids + [device_data])
         return device_data
     
     def get_device_ids_by_user(self, user_id: str) -> List[str]:
@@ -177,11 +563,54 @@ class FileStorage:
 
 # Global file storage instance
 file_storage = None
+_file_storage_lock = threading.Lock()
 
 def get_file_storage():
     """Get or create file storage instance"""
     global file_storage
     if file_storage is None:
-        file_storage = FileStorage()
+        with _file_storage_lock:
+            if file_storage is None:
+                file_storage = FileStorage()
     return file_storage
 
+
+def is_file_storage_ready() -> bool:
+    """True once the storage files have been loaded (never blocks)"""
+    return file_storage is not None
+
+
+# Collections reported by the /metrics gauges: attribute name -> file attribute
+METRIC_COLLECTIONS = {
+    'users': 'users_file',
+    'power_logs': 'power_logs_file',
+    'verification_codes': 'verification_codes_file',
+    'device_ids': 'device_ids_file',
+    'region_profiles': 'region_profiles_file',
+}
+
+
+def _record_counts() -> Dict:
+    if file_storage is None:
+        return {}
+    return {(name,): len(getattr(file_storage, name)) for name in METRIC_COLLECTIONS}
+
+
+def _file_sizes() -> Dict:
+    if file_storage is None:
+        return {}
+    sizes = {}
+    for name, file_attr in METRIC_COLLECTIONS.items():
+        filepath = getattr(file_storage, file_attr)
+        if os.path.exists(filepath):
+            sizes[(name,)] = os.path.getsize(filepath)
+    return sizes
+
+
+REGISTRY.register(CallbackGauge(
+    'storage_records', 'Records held in memory per file storage collection.',
+    ('collection',), _record_counts))
+REGISTRY.register(CallbackGauge(
+    'storage_file_size_bytes', 'Size of each file storage JSON file.',
+    ('collection',), _file_sizes))
+
@@ -13,6 +13,7 @@ from typing import List
 from app import app
 from storage_adapter import (
     get_power_logs_by_user,
+    get_power_state,
     create_power_log
 )
 
@@ -55,15 +56,11 @@ def generate_random_power_logs(
             username = user_data.get('username')
             user_generated_count = 0
             
-            # Get the last log for this user to determine starting state
             existing_logs = get_power_logs_by_user(username)
-            last_log = existing_logs[-1] if existing_logs else None
             
-            # Start with random state if no previous logs
-            current_state = "on" if not last_log else last_log.event_type
-            if not last_log:
-                # Randomly choose initial state
-                current_state = random.choice(["on", "off"])
+            # Continue from the user's current state; random if they have no logs yet
+            power_state = get_power_state(username)
+            current_state = power_state['event_type'] if power_state else random.choice(["on", "off"])
             
             # Generate logs for the past N days
             for day_offset in range(days_back, -1, -1):
@@ -0,0 +1,145 @@
+"""
+Cached verification of Google OAuth ID tokens.
+
+google.oauth2.id_token.verify_oauth2_token fetches Google's signing
+certificates over the network on every call. GoogleCertCache keeps the
+certificates in memory for the max-age Google sends in Cache-Control, shares
+them across requests, and refreshes them on a background thread shortly
+before they expire, so verifying a sign-in token is a local signature check.
+
+The fetcher is pluggable: any callable returning (certs, max_age_seconds),
+where certs maps key ID -> PEM certificate, e.g. a local stand-in key set.
+"""
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import requests
+from google.auth import jwt as google_jwt
+
+GOOGLE_OAUTH2_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+CertFetcher = Callable[[], Tuple[Dict[str, str], float]]
+
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+def parse_max_age(cache_control: Optional[str], default: float = 300.0) -> float:
+    """Extract max-age (seconds) from a Cache-Control header value"""
+    if cache_control:
+        match = _MAX_AGE_RE.search(cache_control)
+        if match:
+            return float(match.group(1))
+    return default
+
+
+def http_cert_fetcher(url: str = GOOGLE_OAUTH2_CERTS_URL, timeout: float = 10.0) -> CertFetcher:
+    """Fetcher that downloads certificates from Google over a keep-alive session"""
+    session = requests.Session()
+
+    def fetch() -> Tuple[Dict[str, str], float]:
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.json(), parse_max_age(response.headers.get('Cache-Control'))
+
+    return fetch
+
+
+class GoogleCertCache:
+    """Shared, self-refreshing cache of Google's OAuth signing certificates"""
+
+    def __init__(self, fetcher: Optional[CertFetcher] = None, refresh_margin: float = 300.0,
+                 min_ttl: float = 60.0, retry_interval: float = 30.0):
+        self.fetcher = fetcher or http_cert_fetcher()
+        self.refresh_margin = refresh_margin
+        self.min_ttl = min_ttl
+        self.retry_interval = retry_interval
+        self._certs: Optional[Dict[str, str]] = None
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._fetch_lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+
+    def _fetch(self):
+        """Fetch and store certificates (caller holds _fetch_lock)"""
+        certs, max_age = self.fetcher()
+        self._certs = certs
+        self._fetched_at = time.time()
+        self._expires_at = self._fetched_at + max(max_age, self.min_ttl)
+        print(f"🔑 Google signing certificates refreshed ({len(certs)} keys, valid {int(max_age)}s)")
+
+    def _refresh_loop(self):
+        while True:
+            delay = self._expires_at - self.refresh_margin - time.time()
+            if delay > 0:
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
+                continue
+            try:
+                with self._fetch_lock:
+                    self._fetch()
+            except Exception as e:
+                # Keep serving the current certificates until they expire
+                print(f"⚠️  Google certificate refresh failed: {e}")
+                self._wakeup.wait(self.retry_interval)
+                self._wakeup.clear()
+
+    def _ensure_refresher(self):
+        if self._refresher is None:
+            with self._fetch_lock:
+                if self._refresher is None:
+                    self._refresher = threading.Thread(
+                        target=self._refresh_loop, name='google-cert-refresher', daemon=True
+                    )
+                    self._refresher.start()
+
+    def get_certs(self, force_refresh: bool = False) -> Dict[str, str]:
+        """Current certificates; only blocks on the network when none are valid"""
+        # Unknown key IDs can come from forged tokens, so don't let them
+        # trigger more than one forced fetch per retry interval
+        if force_refresh and time.time() - self._fetched_at < self.retry_interval:
+            force_refresh = False
+        if force_refresh or self._certs is None or time.time() >= self._expires_at:
+            expires_before = self._expires_at
+            with self._fetch_lock:
+                # Skip if another thread fetched while we waited for the lock
+                if self._expires_at == expires_before or time.time() >= self._expires_at:
+                    self._fetch()
+            self._wakeup.set()
+        self._ensure_refresher()
+        return self._certs
+
+    def verify_oauth2_token(self, token: str, audience: Optional[str] = None,
+                            clock_skew_in_seconds: int = 0) -> Dict:
+        """
+        Verify a Google ID token against the cached certificates.
+        Raises ValueError if verification fails (same contract as google-auth).
+        """
+        try:
+            idinfo = google_jwt.decode(token, certs=self.get_certs(), audience=audience,
+                                       clock_skew_in_seconds=clock_skew_in_seconds)
+        except ValueError as e:
+            # Google may have rotated keys before our cached copy expired
+            if 'Certificate for key id' not in str(e):
+                raise
+            idinfo = google_jwt.decode(token, certs=self.get_certs(force_refresh=True),
+                                       audience=audience, clock_skew_in_seconds=clock_skew_in_seconds)
+
+        if idinfo.get('iss') not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer. 'iss' should be one of the following: {GOOGLE_ISSUERS}")
+        return idinfo
+
+
+# Global certificate cache instance
+google_cert_cache = None
+
+
+def get_google_cert_cache() -> GoogleCertCache:
+    """Get or create the shared Google certificate cache"""
+    global google_cert_cache
+    if google_cert_cache is None:
+        google_cert_cache = GoogleCertCache()
+    return google_cert_cache
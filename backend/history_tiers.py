@@ -0,0 +1,185 @@
+"""
+Multi-resolution supply history behind GET /api/history.
+
+Raw events stay in the power logs; on top of them each user has on-time
+totals per hour, day, week (Monday-based) and month bucket, all extended
+incrementally as events are written: an "off" credits the interval since
+the user's latest "on" to every tier, split exactly at bucket boundaries.
+On-time is counted as in analytics.py, so a repeated "on" restarts the
+interval rather than extending it, but unlike the daily report an interval
+over midnight counts towards both days. Events that arrive out of order
+rebuild that user from their logs.
+
+Finer tiers are only kept for a while: hourly buckets for HISTORY_HOURLY_DAYS
+and daily ones for HISTORY_DAILY_DAYS, after which that time only lives on in
+the weekly and monthly tiers, which are kept for good. A user therefore
+costs a few hundred buckets however long their history is, and a query reads
+at most one bucket per point it returns: it uses the coarsest tier whose
+buckets nest in the requested granularity (hours and days nest in weeks and
+months, weeks don't nest in months) and that still covers the start of the
+requested range.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from analytics import DAY_US, EPOCH, HOUR_US, to_us
+from user_event_index import UserEventIndex
+
+TIERS = ('hour', 'day', 'week', 'month')
+# Granularities each tier's buckets can be summed into
+NESTS_IN = {
+    'hour': ('hour', 'day', 'week', 'month'),
+    'day': ('day', 'week', 'month'),
+    'week': ('week',),
+    'month': ('month',),
+}
+
+
+def bucket_of(tier: str, time_us: int) -> int:
+    """Bucket number of a moment (microseconds since the epoch) in a tier"""
+    if tier == 'hour':
+        return time_us // HOUR_US
+    day = time_us // DAY_US
+    if tier == 'day':
+        return day
+    if tier == 'week':
+        return (day + 3) // 7  # Day 0 (1970-01-01) was a Thursday
+    moment = EPOCH + timedelta(microseconds=time_us)
+    return moment.year * 12 + moment.month - 1
+
+
+def bucket_start_us(tier: str, bucket: int) -> int:
+    if tier == 'hour':
+        return bucket * HOUR_US
+    if tier == 'day':
+        return bucket * DAY_US
+    if tier == 'week':
+        return (bucket * 7 - 3) * DAY_US
+    year, month = divmod(bucket, 12)
+    return to_us(datetime(year, month + 1, 1))
+
+
+def bucket_label(tier: str, bucket: int) -> str:
+    """ISO start of a bucket: date and time for hours, else a date"""
+    start = EPOCH + timedelta(microseconds=bucket_start_us(tier, bucket))
+    return start.isoformat() if tier == 'hour' else start.date().isoformat()
+
+
+def _credit(buckets: Dict[int, int], tier: str, start_us: int, end_us: int):
+    """Add [start_us, end_us) of on-time to a tier, split at bucket boundaries"""
+    bucket = bucket_of(tier, start_us)
+    while start_us < end_us:
+        boundary = min(bucket_start_us(tier, bucket + 1), end_us)
+        buckets[bucket] = buckets.get(bucket, 0) + boundary - start_us
+        start_us = boundary
+        bucket += 1
+
+
+class UserHistory:
+    __slots__ = ('tiers', 'first_us', 'last_us', 'last_on', 'pruned_day')
+
+    def __init__(self):
+        self.tiers: Dict[str, Dict[int, int]] = {tier: {} for tier in TIERS}  # bucket -> on microseconds
+        self.first_us: Optional[int] = None
+        self.last_us: Optional[int] = None
+        self.last_on = False
+        self.pruned_day: Optional[int] = None
+
+
+class HistoryTiers(UserEventIndex):
+    def __init__(self, hourly_days: int = 7, daily_days: int = 92):
+        # Microseconds each tier is kept for; None = forever
+        self.retention: Dict[str, Optional[int]] = {
+            'hour': max(1, hourly_days) * DAY_US,
+            'day': max(1, daily_days) * DAY_US,
+            'week': None,
+            'month': None,
+        }
+        super().__init__()
+
+    def _kept_from(self, tier: str, now_us: int) -> Optional[int]:
+        """Start of the oldest bucket a tier still holds at now_us, or None"""
+        retention = self.retention[tier]
+        if retention is None:
+            return None
+        return bucket_start_us(tier, bucket_of(tier, now_us - retention))
+
+    def _prune(self, user: UserHistory, now_us: int):
+        # Runs at most once per day per user; older buckets survive in coarser tiers
+        today = now_us // DAY_US
+        if user.pruned_day == today:
+            return
+        user.pruned_day = today
+        for tier in TIERS:
+            kept_from = self._kept_from(tier, now_us)
+            if kept_from is not None:
+                oldest = bucket_of(tier, kept_from)
+                buckets = user.tiers[tier]
+                for bucket in [bucket for bucket in buckets if bucket < oldest]:
+                    del buckets[bucket]
+
+    def _credit_all(self, user: UserHistory, start_us: int, end_us: int, now_us: int):
+        for tier in TIERS:
+            kept_from = self._kept_from(tier, now_us)
+            _credit(user.tiers[tier], tier, start_us if kept_from is None else max(start_us, kept_from), end_us)
+
+    def _new_user(self, previous: Optional[UserHistory]) -> UserHistory:
+        return UserHistory()
+
+    def _apply(self, user_id: str, user: UserHistory, time_us: int, on: bool,
+               region_id: Optional[str] = None) -> bool:
+        if user.last_us is not None and time_us < user.last_us:
+            return False
+        if user.last_us is not None and user.last_on and not on:
+            self._credit_all(user, user.last_us, time_us, time_us)
+        if user.first_us is None:
+            user.first_us = time_us
+        user.last_us, user.last_on = time_us, on
+        self._prune(user, time_us)
+        return True
+
+    def choose_tier(self, granularity: str, from_us: int, now_us: int) -> Optional[str]:
+        """Coarsest tier that can be summed into granularity and still covers from_us"""
+        for tier in reversed(TIERS):
+            if granularity not in NESTS_IN[tier]:
+                continue
+            kept_from = self._kept_from(tier, now_us)
+            if kept_from is None or kept_from <= from_us:
+                return tier
+        return None
+
+    def series(self, user_id: str, tier: str, granularity: str, from_us: int, until_us: int,
+               now_us: int) -> List[Tuple[int, int]]:
+        """
+        [(granularity bucket, on microseconds)] for the buckets overlapping
+        [from_us, until_us), from the user's first event on. An "on" with no
+        "off" after it runs until now, as in the reports.
+        """
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None or user.first_us is None:
+                return []
+            buckets = dict(user.tiers[tier])
+            if user.last_on:
+                kept_from = self._kept_from(tier, now_us)
+                _credit(buckets, tier, user.last_us if kept_from is None else max(user.last_us, kept_from), now_us)
+            first_us = max(from_us, user.first_us)
+        end_us = min(until_us, now_us)
+        if first_us >= end_us:
+            return []
+        first, last = bucket_of(granularity, first_us), bucket_of(granularity, end_us - 1)
+        totals = {bucket: 0 for bucket in range(first, last + 1)}
+        for bucket, on_us in buckets.items():
+            group = bucket_of(granularity, bucket_start_us(tier, bucket))
+            if group in totals:
+                totals[group] += on_us
+        return sorted(totals.items())
+
+
+def create_history_tiers() -> HistoryTiers:
+    """Build empty tiers from environment variables"""
+    return HistoryTiers(
+        hourly_days=int(os.environ.get('HISTORY_HOURLY_DAYS', 7)),
+        daily_days=int(os.environ.get('HISTORY_DAILY_DAYS', 92)),
+    )
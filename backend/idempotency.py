@@ -0,0 +1,164 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A client sends the same Idempotency-Key header on every retry of one logical
+request. The first successful (2xx) response is remembered for
+IDEMPOTENCY_TTL seconds and replayed for repeats, so a retried
+POST /api/log-power can't log the same event twice. A repeat that arrives
+while the original is still running gets 409, and reusing a key with a
+different request body gets 422.
+
+Entries are kept in an OrderedDict in least-recently-used order, capped at
+IDEMPOTENCY_MAX_KEYS, plus an expiry ring: a deque of (expires_at, key) in
+insertion order, which is also expiry order since the TTL is fixed. Lookups,
+inserts, evictions and expiry are all O(1) amortised.
+
+Completed entries are appended to a journal (data/idempotency.jsonl) that is
+replayed at startup, so deduplication survives restarts at the cost of one
+short append per write. The journal is rewritten with only the live entries
+once it has grown to twice their number.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from file_storage import DATA_DIR
+
+IDEMPOTENCY_FILE = os.path.join(DATA_DIR, 'idempotency.jsonl')
+
+# Outcomes of IdempotencyStore.begin()
+PROCEED = 'proceed'          # New key: run the request, then complete() or abort()
+REPLAY = 'replay'            # Seen before: send the stored response
+IN_PROGRESS = 'in_progress'  # The original request hasn't finished yet
+MISMATCH = 'mismatch'        # Key reused for a different request body
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status: int
+    body: str
+    expires_at: float
+
+
+def _journal_line(key: str, entry: StoredResponse) -> str:
+    return json.dumps({'k': key, 'f': entry.fingerprint, 's': entry.status,
+                       'b': entry.body, 'e': entry.expires_at}) + '\n'
+
+
+class IdempotencyStore:
+    def __init__(self, path: Optional[str] = IDEMPOTENCY_FILE, ttl: float = 86400, max_keys: int = 10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_keys = max(1, max_keys)
+        self._entries: 'OrderedDict[str, StoredResponse]' = OrderedDict()
+        self._expiry: deque = deque()
+        self._in_flight: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._journal = None
+        self._journal_lines = 0
+        if path:
+            self._load()
+
+    def _load(self):
+        now = time.time()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._journal_lines += 1
+                    try:
+                        record = json.loads(line)
+                        entry = StoredResponse(record['f'], record['s'], record['b'], record['e'])
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Torn last line from a crash
+                    if entry.expires_at > now:
+                        self._add(record['k'], entry)
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._journal = open(self.path, 'a', encoding='utf-8')
+
+    def _add(self, key: str, entry: StoredResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._expiry.append((entry.expires_at, key))
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+        if len(self._expiry) > 2 * self.max_keys:
+            # Drop ring slots of keys the LRU cap already evicted
+            self._expiry = deque(item for item in self._expiry
+                                 if (live := self._entries.get(item[1])) and live.expires_at == item[0])
+
+    def _expire(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = self._expiry.popleft()
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at == expires_at:
+                del self._entries[key]
+
+    def begin(self, key: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        """Check a key; on PROCEED the caller must later call complete() or abort()"""
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.fingerprint != fingerprint:
+                    return MISMATCH, None
+                self._entries.move_to_end(key)
+                return REPLAY, entry
+            if key in self._in_flight:
+                return IN_PROGRESS, None
+            self._in_flight[key] = fingerprint
+            return PROCEED, None
+
+    def complete(self, key: str, status: int, body: str):
+        """Remember the response of a request begun with PROCEED"""
+        with self._lock:
+            fingerprint = self._in_flight.pop(key, None)
+            if fingerprint is None:
+                return
+            entry = StoredResponse(fingerprint, status, body, time.time() + self.ttl)
+            self._add(key, entry)
+            if self._journal is not None:
+                self._write_journal(key, entry)
+
+    def abort(self, key: str):
+        """Forget a request begun with PROCEED (e.g. it failed), so a retry runs again"""
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _write_journal(self, key: str, entry: StoredResponse):
+        # Caller holds self._lock
+        try:
+            if self._journal_lines >= max(1000, 2 * len(self._entries)):
+                self._compact()
+            self._journal.write(_journal_line(key, entry))
+            self._journal.flush()
+            self._journal_lines += 1
+        except OSError as e:
+            # The in-memory entry still deduplicates until the next restart
+            print(f"⚠️  Could not write idempotency journal: {e}")
+
+    def _compact(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key, entry in self._entries.items():
+                f.write(_journal_line(key, entry))
+        self._journal.close()
+        os.replace(tmp_path, self.path)
+        self._journal = open(self.path, 'a', encoding='utf-8')
+        self._journal_lines = len(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def create_idempotency_store() -> IdempotencyStore:
+    """Build the store from environment variables (IDEMPOTENCY_FILE= keeps it in memory only)"""
+    return IdempotencyStore(
+        path=os.environ.get('IDEMPOTENCY_FILE', IDEMPOTENCY_FILE) or None,
+        ttl=float(os.environ.get('IDEMPOTENCY_TTL', 86400)),
+        max_keys=int(os.environ.get('IDEMPOTENCY_MAX_KEYS', 10000)),
+    )
@@ -0,0 +1,188 @@
+"""
+Response encoding: fast JSON and negotiated compression.
+
+FastJSONProvider replaces Flask's JSON provider, so jsonify() and the ASGI
+app's send_json both go through it. It uses orjson when installed (about an
+order of magnitude faster than the stdlib encoder) and falls back to the
+stdlib json module otherwise. Both produce the same compact, key-sorted
+output and encode datetime/date values as ISO 8601 strings.
+
+compress_body() picks brotli (if the Brotli package is installed) or gzip
+from the request's Accept-Encoding header for bodies of at least
+COMPRESS_MIN_SIZE bytes. Streamed bodies, whose size isn't known up front,
+are gzipped chunk by chunk with gzip_stream().
+
+Environment:
+    JSON_ENCODER        auto (default) | orjson | stdlib
+    COMPRESS_MIN_SIZE   smallest body worth compressing, in bytes (default 1024; 0 disables)
+    COMPRESS_LEVEL      gzip level 1-9 (default 6)
+    BROTLI_QUALITY      brotli quality 0-11 (default 4)
+"""
+import gzip
+import json
+import os
+import zlib
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator, Optional, Tuple
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/x-ndjson', 'application/javascript')
+
+
+def _default(obj: Any):
+    """Types the encoders don't handle natively"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _use_orjson() -> bool:
+    encoder = os.environ.get('JSON_ENCODER', 'auto').lower()
+    if encoder == 'stdlib':
+        return False
+    if encoder == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_ENCODER=orjson but orjson is not installed')
+    return orjson is not None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, with a stdlib fallback"""
+
+    def __init__(self, app, use_orjson: Optional[bool] = None):
+        super().__init__(app)
+        self.use_orjson = _use_orjson() if use_orjson is None else use_orjson
+
+    @property
+    def encoder_name(self) -> str:
+        return 'orjson' if self.use_orjson else 'stdlib'
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        """Compact, key-sorted UTF-8 JSON"""
+        if self.use_orjson:
+            try:
+                return orjson.dumps(obj, default=_default,
+                                    option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+            except TypeError:
+                pass  # e.g. integers beyond 64 bits; let the stdlib encoder handle it
+        return json.dumps(obj, default=_default, sort_keys=True, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            # Callers asking for specific options (e.g. indent) get the stdlib encoder
+            kwargs.setdefault('default', _default)
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> set:
+    """Content codings the client accepts (those with q > 0)"""
+    encodings = set()
+    for item in (accept_encoding or '').split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            encodings.add(coding)
+    return encodings
+
+
+class Compressor:
+    def __init__(self, min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def choose(self, accept_encoding: Optional[str], size: int, content_type: Optional[str]) -> Optional[str]:
+        """Coding to use for a body of `size` bytes, or None to send it as is"""
+        if self.min_size <= 0 or size < self.min_size:
+            return None
+        if not content_type or not content_type.startswith(COMPRESSIBLE_TYPES):
+            return None
+        encodings = accepted_encodings(accept_encoding)
+        if brotli is not None and 'br' in encodings:
+            return 'br'
+        if 'gzip' in encodings:
+            return 'gzip'
+        return None
+
+    def compress(self, body: bytes, coding: str) -> bytes:
+        if coding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def compress_body(self, body: bytes, accept_encoding: Optional[str],
+                      content_type: Optional[str] = 'application/json') -> Tuple[bytes, Optional[str]]:
+        """Returns (body, coding); coding is None when the body was left uncompressed"""
+        coding = self.choose(accept_encoding, len(body), content_type)
+        if coding is None:
+            return body, None
+        return self.compress(body, coding), coding
+
+    def compress_response(self, response, accept_encoding: Optional[str]):
+        """Compress a buffered Flask response in place (no-op for streamed or already encoded responses)"""
+        if (response.direct_passthrough or response.is_streamed or
+                'Content-Encoding' in response.headers or
+                response.status_code < 200 or response.status_code in (204, 304)):
+            return response
+        response.vary.add('Accept-Encoding')
+        coding = self.choose(accept_encoding, response.content_length or 0, response.content_type)
+        if coding is None:
+            return response
+        response.set_data(self.compress(response.get_data(), coding))
+        response.headers['Content-Encoding'] = coding
+        return response
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip a stream of chunks incrementally (one gzip member, constant memory)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 16+15: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def create_compressor() -> Compressor:
+    """Build the compressor from environment variables"""
+    return Compressor(
+        min_size=int(os.environ.get('COMPRESS_MIN_SIZE', 1024)),
+        gzip_level=int(os.environ.get('COMPRESS_LEVEL', 6)),
+        brotli_quality=int(os.environ.get('BROTLI_QUALITY', 4)),
+    )
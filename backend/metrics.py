@@ -0,0 +1,245 @@
+"""
+In-process metrics in the Prometheus text exposition format (served at /metrics).
+
+Counters and histograms keep one child per label combination. A child is
+created on first use and cached, and a histogram child's bucket counts are a
+fixed list allocated up front, so recording a sample is a dict lookup, a
+bisect and a few integer updates under the child's lock. Gauges are computed
+by callbacks when /metrics is scraped, so they cost nothing between scrapes.
+
+Counts are per process: with several gunicorn workers each worker reports
+its own series, which Prometheus sums at query time.
+"""
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Request latency buckets in seconds (5 ms .. 10 s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Storage operations are mostly in-memory, so start finer (0.1 ms .. 5 s)
+STORAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+# Number of records visited by a scan
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('upper_bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        # One slot per bucket plus +Inf; cumulated only when rendering
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Metric(ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Exposition lines for this metric, HELP and TYPE first"""
+
+    def _header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class _ChildMetric(_Metric):
+    """Metric recorded into one child per label combination"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _new_child(self):
+        """Empty child for a new label combination"""
+
+    def labels(self, *values):
+        """
+        Child for one label combination (created once, then reused).
+        Pass each label's values with a consistent type, e.g. always an int
+        status code, since the values themselves are the cache key.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}')
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self):
+        return list(self._children.items())
+
+
+class Counter(_ChildMetric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in self._items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}')
+        return lines
+
+
+class Histogram(_ChildMetric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.upper_bounds = tuple(sorted(float(b) for b in buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in self._items():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose samples are produced by a callback at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        try:
+            samples = self.callback()
+        except Exception:
+            logger.exception('Metrics callback failed', extra={'metric': self.name})
+            samples = {}
+        for values, value in samples.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(float(value))}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    'http_requests_total', 'HTTP requests by method, route and status code.',
+    ('method', 'route', 'status')))
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by method and route.',
+    ('method', 'route'), LATENCY_BUCKETS))
+
+STORAGE_OPERATION_DURATION = REGISTRY.register(Histogram(
+    'storage_operation_duration_seconds', 'File storage load, save and scan latency.',
+    ('operation', 'collection'), STORAGE_BUCKETS))
+STORAGE_SCAN_RECORDS = REGISTRY.register(Histogram(
+    'storage_scan_records', 'Size of the collection a file storage scan ran over.',
+    ('collection',), SIZE_BUCKETS))
+
+EMAIL_SEND_ATTEMPTS = REGISTRY.register(Counter(
+    'email_send_attempts_total', 'Email delivery attempts by outcome (sent, retry, failed).',
+    ('outcome',)))
+EMAIL_SEND_DURATION = REGISTRY.register(Histogram(
+    'email_send_duration_seconds', 'Email provider API call latency.',
+    (), LATENCY_BUCKETS))
+
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    HTTP_REQUESTS.labels(method, route, status).inc()
+    HTTP_REQUEST_DURATION.labels(method, route).observe(seconds)
+
+
+def observe_storage(operation: str, collection: str, started: float, scanned: Optional[int] = None):
+    """Record a storage operation that began at time.perf_counter() value `started`"""
+    STORAGE_OPERATION_DURATION.labels(operation, collection).observe(time.perf_counter() - started)
+    if scanned is not None:
+        STORAGE_SCAN_RECORDS.labels(collection).observe(scanned)
@@ -0,0 +1,182 @@
+"""
+Password hashing service.
+
+Passwords are hashed with a salted KDF from hashlib (scrypt by default, or
+PBKDF2-SHA256). The KDF work runs in a bounded ProcessPoolExecutor so request
+threads only wait on a future instead of burning CPU themselves.
+
+Stored hash formats:
+    scrypt$<n>$<r>$<p>$<salt_b64>$<hash_b64>
+    pbkdf2_sha256$<iterations>$<salt_b64>$<hash_b64>
+    <64 hex chars>   legacy unsalted SHA-256 (verified inline, upgraded on login)
+
+Configuration (environment variables):
+    PASSWORD_KDF                 scrypt | pbkdf2_sha256 (default: scrypt)
+    PASSWORD_SCRYPT_N            CPU/memory cost (default: 16384)
+    PASSWORD_SCRYPT_R            block size (default: 8)
+    PASSWORD_SCRYPT_P            parallelism (default: 1)
+    PASSWORD_PBKDF2_ITERATIONS   iterations (default: 260000)
+    PASSWORD_HASH_WORKERS        pool processes; 0 hashes inline (default: 2)
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+SCRYPT = 'scrypt'
+PBKDF2 = 'pbkdf2_sha256'
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+def _is_legacy_hash(stored: str) -> bool:
+    if len(stored) != 64:
+        return False
+    try:
+        int(stored, 16)
+        return True
+    except ValueError:
+        return False
+
+
+def _derive(password: str, stored_params: str) -> str:
+    """
+    Derive a hash string for `password` using the algorithm, cost and salt in
+    `stored_params` (a full stored hash, or one with the digest left empty).
+    Runs inside the process pool, so it must stay a picklable top-level function.
+    """
+    parts = stored_params.split('$')
+    if parts[0] == SCRYPT:
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        salt = _b64decode(parts[4])
+        key = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                             maxmem=128 * n * r * p + 1024 * 1024, dklen=KEY_BYTES)
+        return f"{SCRYPT}${n}${r}${p}${parts[4]}${_b64encode(key)}"
+    if parts[0] == PBKDF2:
+        iterations = int(parts[1])
+        salt = _b64decode(parts[2])
+        key = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, dklen=KEY_BYTES)
+        return f"{PBKDF2}${iterations}${parts[2]}${_b64encode(key)}"
+    raise ValueError(f"Unknown password hash algorithm: {parts[0]}")
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords, offloading KDF work to a process pool"""
+
+    def __init__(self, algorithm: str = SCRYPT, scrypt_n: int = 2 ** 14, scrypt_r: int = 8,
+                 scrypt_p: int = 1, pbkdf2_iterations: int = 260000, workers: int = 2,
+                 timeout: float = 30.0):
+        if algorithm not in (SCRYPT, PBKDF2):
+            raise ValueError(f"Unsupported PASSWORD_KDF: {algorithm}")
+        self.algorithm = algorithm
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+        self.pbkdf2_iterations = pbkdf2_iterations
+        self.workers = workers
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        # Bound queued work so a login burst can't pile up unbounded futures
+        self._slots = threading.BoundedSemaphore(max(1, workers) * 4)
+
+    def _params(self) -> str:
+        """Current cost parameters with a fresh salt (digest left empty)"""
+        salt = _b64encode(os.urandom(SALT_BYTES))
+        if self.algorithm == SCRYPT:
+            return f"{SCRYPT}${self.scrypt_n}${self.scrypt_r}${self.scrypt_p}${salt}$"
+        return f"{PBKDF2}${self.pbkdf2_iterations}${salt}$"
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _run(self, password: str, params: str) -> str:
+        pool = self._get_pool()
+        if pool is None:
+            return _derive(password, params)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError('Password hashing pool is saturated')
+        try:
+            return pool.submit(_derive, password, params).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+    def hash(self, password: str) -> str:
+        """Hash a password with the configured KDF and a fresh salt"""
+        return self._run(password, self._params())
+
+    def verify(self, password: str, stored: Optional[str]) -> bool:
+        """Check a password against a stored hash (KDF or legacy SHA-256)"""
+        if not stored:
+            return False
+        if _is_legacy_hash(stored):
+            candidate = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(candidate, stored.lower())
+        try:
+            candidate = self._run(password, stored)
+        except (ValueError, IndexError):
+            return False
+        return hmac.compare_digest(candidate, stored)
+
+    def needs_rehash(self, stored: Optional[str]) -> bool:
+        """True if the stored hash is legacy or uses different cost parameters"""
+        if not stored or _is_legacy_hash(stored):
+            return True
+        parts = stored.split('$')
+        if self.algorithm == SCRYPT:
+            return parts[:4] != [SCRYPT, str(self.scrypt_n), str(self.scrypt_r), str(self.scrypt_p)]
+        return parts[:2] != [PBKDF2, str(self.pbkdf2_iterations)]
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+# Global password hasher instance
+password_hasher = None
+
+
+def get_password_hasher() -> PasswordHasher:
+    """Get or create the password hasher, configured from environment variables"""
+    global password_hasher
+    if password_hasher is None:
+        password_hasher = PasswordHasher(
+            algorithm=os.environ.get('PASSWORD_KDF', SCRYPT),
+            scrypt_n=int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14)),
+            scrypt_r=int(os.environ.get('PASSWORD_SCRYPT_R', 8)),
+            scrypt_p=int(os.environ.get('PASSWORD_SCRYPT_P', 1)),
+            pbkdf2_iterations=int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 260000)),
+            workers=int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+        )
+    return password_hasher
+
+
+def hash_password(password: str) -> str:
+    return get_password_hasher().hash(password)
+
+
+def verify_password(password: str, stored: Optional[str]) -> bool:
+    return get_password_hasher().verify(password, stored)
+
+
+def needs_rehash(stored: Optional[str]) -> bool:
+    return get_password_hasher().needs_rehash(stored)
@@ -0,0 +1,156 @@
+"""
+Supply-hour calculations shared by the Flask and ASGI routes.
+
+Functions take power logs as returned by storage_adapter (objects with
+event_type, timestamp, date and to_dict()) sorted by timestamp, except
+build_report, which takes an analytics EventSeries (see
+storage_adapter.get_event_series). The supply-hour arithmetic itself runs in
+analytics.py (NumPy when available).
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from analytics import HOUR_US, EventSeries, day_from_number, day_start_us, get_backend, series_from_logs, to_us
+
+
+def stats_start_date(period: str, now: datetime):
+    """First date included in /api/stats for a 'day', 'week' or 'month' period"""
+    if period == 'day':
+        return now.date()
+    if period == 'month':
+        return (now - timedelta(days=30)).date()
+    return (now - timedelta(days=7)).date()
+
+
+def report_start_date(now: datetime):
+    """
+    First date build_report (and the longest /api/stats period) looks at, so
+    callers can read just that window instead of the whole history
+    """
+    return (now - timedelta(days=30)).date()
+
+
+def compute_daily_hours(logs: List, now: datetime) -> Tuple[float, List[Dict]]:
+    """
+    Hours of supply per day. Returns (total_hours, chart_data) where
+    chart_data is [{'date': 'YYYY-MM-DD', 'hours': float}, ...] sorted by date.
+    """
+    backend = get_backend()
+    days, on_us = backend.daily_on_time(series_from_logs(logs, backend), to_us(now))
+    chart_data = [
+        {'date': day_from_number(day).isoformat(), 'hours': round(total / HOUR_US, 2)}
+        for day, total in zip(days, on_us)
+    ]
+    return sum(on_us) / HOUR_US, chart_data
+
+
+def build_region_info(region_id: Optional[str], region_profiles: List) -> Optional[Dict]:
+    """Region summary for a user's region_id, or None"""
+    if not region_id:
+        return None
+    region_profile = next((r for r in region_profiles if (r.get('id') if isinstance(r, dict) else getattr(r, 'id', None)) == region_id), None)
+    if not region_profile:
+        return None
+    if isinstance(region_profile, dict):
+        return {
+            'id': region_profile.get('id'),
+            'name': region_profile.get('disco_name'),
+            'states': region_profile.get('states', []),
+            'source': region_profile.get('source', 'NERC Q2 2025')
+        }
+    return {
+        'id': region_profile.id,
+        'name': region_profile.disco_name,
+        'states': region_profile.states,
+        'source': region_profile.source
+    }
+
+
+def build_stats(logs: List, period: str, now: datetime, user=None, region_profiles: Optional[List] = None) -> Dict:
+    """Response body for /api/stats"""
+    total_hours, chart_data = compute_daily_hours(logs, now)
+    region_id = getattr(user, 'region_id', None) if user else None
+    return {
+        'period': period,
+        'total_hours': round(total_hours, 2),
+        'daily_stats': chart_data,
+        'events': [log.to_dict() for log in logs[-20:]],  # Last 20 events
+        'region': build_region_info(region_id, region_profiles or []),
+        'location': user.location if user else None
+    }
+
+
+def build_report(series: EventSeries, now: datetime) -> Dict:
+    """Response body for /api/report, from the user's events since report_start_date"""
+    backend = get_backend()
+    now_us = to_us(now)
+
+    def calculate_period_stats(days):
+        start_us = day_start_us((now - timedelta(days=days)).date())
+        on_us, events = backend.on_time(series, start_us, now_us)
+        outages = backend.outages(series, start_us, now_us)
+        return round(on_us / HOUR_US, 2), events, {
+            'count': outages.count,
+            'longest_hours': round(outages.longest_us / HOUR_US, 2)
+        }
+
+    today_hours, today_events, today_outages = calculate_period_stats(1)
+    week_hours, week_events, week_outages = calculate_period_stats(7)
+    month_hours, month_events, month_outages = calculate_period_stats(30)
+
+    # Get last event
+    if len(series.times):
+        last_event_type = 'on' if series.states[-1] else 'off'
+        hours_ago = round((now_us - int(series.times[-1])) / HOUR_US, 1)
+    else:
+        last_event_type = None
+        hours_ago = None
+
+    # Calculate average hours per day for week
+    avg_daily_hours = round(week_hours / 7, 2) if week_hours > 0 else 0
+
+    return {
+        'summary': {
+            'today_hours': today_hours,
+            'week_hours': week_hours,
+            'month_hours': month_hours,
+            'avg_daily_hours': avg_daily_hours,
+            'last_event': {
+                'type': last_event_type,
+                'hours_ago': hours_ago
+            }
+        },
+        'totals': {
+            'today_events': today_events,
+            'week_events': week_events,
+            'month_events': month_events
+        },
+        'outages': {
+            'today': today_outages,
+            'week': week_outages,
+            'month': month_outages
+        }
+    }
+
+
+def region_power_summary(states: Dict[str, Dict], now: datetime, max_age: timedelta) -> Dict[str, Dict]:
+    """
+    Users currently reporting power on, per region, from each user's latest
+    event (see storage_adapter.get_power_states). Users whose latest event is
+    older than max_age are left out, since an old "on" says little about now.
+    """
+    cutoff = (now - max_age).isoformat()
+    summary = {}
+    for state in states.values():
+        region_id = state.get('region_id')
+        if not region_id or (state.get('timestamp') or '') < cutoff:
+            continue
+        region = summary.setdefault(region_id, {'region_id': region_id, 'users_reporting': 0, 'users_on': 0})
+        region['users_reporting'] += 1
+        if state.get('event_type') == 'on':
+            region['users_on'] += 1
+    for region in summary.values():
+        region['on_percent'] = round(100 * region['users_on'] / region['users_reporting'], 1)
+    return summary
@@ -0,0 +1,187 @@
+"""
+Streaming quantile sketches of weekly supply hours, per region.
+
+GET /api/region-stats/percentile ranks a user's supply over the past 7 days
+against the weekly totals of other reporters in their region. Keeping every
+user-week to rank against would grow with the user base, so each region keeps
+one KLL sketch per week instead (Karnin, Lang & Liberty, "Optimal Quantile
+Approximation in Streams"): a stack of compactors where level h holds items
+of weight 2**h, and a full level is sorted and every other item (odd or even
+positions at random) promoted to the next. Capacities shrink by 2/3 per level
+down from the top, so a sketch holds about 3 * PERCENTILE_SKETCH_K items
+however many values went in, and sketches of several weeks merge into one.
+
+With the default k=200 a rank is within about +/-1.65% of the exact one with
+99% confidence (the bound Apache DataSketches publishes for KLL at k=200; it
+scales roughly as 1/k). Regions with fewer values than the sketch capacity
+are exact.
+
+Values come from the daily rollups in the supply bitmaps: as a user's day
+closes (a later event arrives), its on- and known-hours are added to the
+user's week, and when the user moves on to a new week (or the week is over
+at query time) that week's on-hours go into the region's sketch, provided
+the user's state was known for at least PERCENTILE_MIN_KNOWN_HOURS of it.
+Only the last PERCENTILE_WEEKS completed weeks are kept. Sketches can't
+remove values, so logs that arrive late for a week already counted don't
+revise it.
+"""
+import math
+import os
+import random
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+
+class KLLSketch:
+    def __init__(self, k: int = 200, c: float = 2 / 3):
+        self.k = max(8, k)
+        self.c = c
+        self.levels: List[List[float]] = [[]]
+        self.count = 0   # values added
+        self._size = 0   # items held
+        self._max_size = self._capacity(0)
+
+    @property
+    def rank_error(self) -> float:
+        """Approximate rank error bound at 99% confidence"""
+        return round(1.65 * 200 / self.k / 100, 4)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, math.ceil(self.k * self.c ** depth))
+
+    def _grow(self):
+        self.levels.append([])
+        self._max_size = sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def update(self, value: float):
+        self.levels[0].append(value)
+        self.count += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def _compress(self):
+        for level in range(len(self.levels)):
+            items = self.levels[level]
+            if len(items) < self._capacity(level):
+                continue
+            if level + 1 == len(self.levels):
+                self._grow()
+            items.sort()
+            # An odd item out stays behind at this level
+            keep = [items.pop()] if len(items) % 2 else []
+            self.levels[level + 1].extend(items[random.getrandbits(1)::2])
+            self.levels[level] = keep
+            self._size = sum(len(items) for items in self.levels)
+            if self._size < self._max_size:
+                break
+
+    def merge(self, other: 'KLLSketch'):
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._size = sum(len(items) for items in self.levels)
+        while self._size >= self._max_size:
+            self._compress()
+
+    def rank(self, value: float, inclusive: bool = False) -> float:
+        """Estimated share of values below (or, inclusive, at or below) value"""
+        if not self.count:
+            return 0.0
+        search = bisect_right if inclusive else bisect_left
+        weight = total = 0
+        for level, items in enumerate(self.levels):
+            items.sort()
+            weight += search(items, value) << level
+            total += len(items) << level
+        return weight / total
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        """Estimated value at a given rank (0..1)"""
+        weighted = sorted((item, 1 << level) for level, items in enumerate(self.levels) for item in items)
+        if not weighted:
+            return None
+        target = fraction * sum(weight for _, weight in weighted)
+        seen = 0
+        for item, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return item
+        return weighted[-1][0]
+
+
+class RegionWeekSketches:
+    """Per-region KLL sketches of completed weekly supply hours"""
+
+    def __init__(self, k: int = 200, weeks: int = 4, min_known_hours: float = 120):
+        self.k = k
+        self.weeks = max(1, weeks)
+        self.min_known_hours = min_known_hours
+        self._sketches: Dict[Tuple[str, int], KLLSketch] = {}   # (region_id, week) -> sketch
+        # user_id -> [week, region_id, on hours, known hours] of the week in progress
+        self._open: Dict[str, list] = {}
+        self._latest_week = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def week_of(day: int) -> int:
+        """Week number (Monday-based) of a day number; day 0 was a Thursday"""
+        return (day + 3) // 7
+
+    def add_day(self, user_id: str, region_id: Optional[str], day: int, on_hours: float, known_hours: float):
+        """Add a closed day of a user's daily rollup"""
+        week = self.week_of(day)
+        with self._lock:
+            current = self._open.get(user_id)
+            if current is not None and current[0] != week:
+                if week < current[0]:
+                    return  # Late day for a week already counted
+                self._close(user_id)
+                current = None
+            if current is None:
+                current = self._open[user_id] = [week, region_id, 0.0, 0.0]
+            current[1] = region_id or current[1]
+            current[2] += on_hours
+            current[3] += known_hours
+
+    def _close(self, user_id: str):
+        # Caller holds self._lock
+        week, region_id, on_hours, known_hours = self._open.pop(user_id)
+        if self._latest_week is None or week > self._latest_week:
+            self._latest_week = week
+            for key in [key for key in self._sketches if key[1] <= week - self.weeks]:
+                del self._sketches[key]
+        if region_id and known_hours >= self.min_known_hours and week > self._latest_week - self.weeks:
+            sketch = self._sketches.get((region_id, week))
+            if sketch is None:
+                sketch = self._sketches[(region_id, week)] = KLLSketch(self.k)
+            sketch.update(on_hours)
+
+    def close_weeks(self, current_week: int):
+        """Count every user week that ended before current_week"""
+        with self._lock:
+            for user_id in [user_id for user_id, (week, *_) in self._open.items() if week < current_week]:
+                self._close(user_id)
+
+    def region_sketch(self, region_id: str, current_week: int) -> KLLSketch:
+        """The region's completed weeks within the window, merged into one sketch"""
+        merged = KLLSketch(self.k)
+        with self._lock:
+            for week in range(current_week - self.weeks, current_week):
+                sketch = self._sketches.get((region_id, week))
+                if sketch is not None:
+                    merged.merge(sketch)
+        return merged
+
+
+def create_region_week_sketches() -> RegionWeekSketches:
+    """Build empty sketches from environment variables"""
+    return RegionWeekSketches(
+        k=int(os.environ.get('PERCENTILE_SKETCH_K', 200)),
+        weeks=int(os.environ.get('PERCENTILE_WEEKS', 4)),
+        min_known_hours=float(os.environ.get('PERCENTILE_MIN_KNOWN_HOURS', 120)),
+    )
@@ -0,0 +1,176 @@
+"""
+Token-bucket rate limiting.
+
+Each bucket is identified by a string key (e.g. "login:ip:203.0.113.7") and
+holds `capacity` tokens that refill continuously over `period` seconds. A
+request consumes one token from every bucket it is checked against, and is
+only admitted if all of them have a token left.
+
+Two backing stores are available:
+    MemoryBucketStore   per-process dict of immutable (tokens, timestamp, idle_ttl)
+                        tuples. Updates are single dict stores with no lock;
+                        concurrent hits on the same key may over-admit by a
+                        request, which is acceptable for throttling.
+    SQLiteBucketStore   shares buckets between gunicorn workers through a local
+                        SQLite file (data/rate_limits.sqlite3).
+
+A bucket that has been idle long enough to refill completely is identical to
+a new bucket, so both stores evict such keys in periodic sweeps.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from file_storage import DATA_DIR
+
+RATE_LIMIT_DB_FILE = os.path.join(DATA_DIR, 'rate_limits.sqlite3')
+
+# (bucket key, capacity, period in seconds)
+BucketSpec = Tuple[str, int, float]
+
+
+def _refill(state: Optional[Tuple[float, float]], capacity: int, period: float, now: float) -> float:
+    """Tokens available in a bucket at `now`"""
+    if state is None:
+        return float(capacity)
+    tokens, updated_at = state
+    return min(float(capacity), tokens + (now - updated_at) * capacity / period)
+
+
+def _apply(states: List[Optional[Tuple[float, float]]], specs: List[BucketSpec],
+           now: float) -> Tuple[float, List[Tuple[float, float]]]:
+    """
+    Decide one request against all buckets.
+    Returns (retry_after, new_states); retry_after is 0 when admitted, in
+    which case new_states has one token taken from every bucket.
+    """
+    retry_after = 0.0
+    new_states = []
+    for state, (_, capacity, period) in zip(states, specs):
+        tokens = _refill(state, capacity, period, now)
+        if tokens < 1:
+            retry_after = max(retry_after, (1 - tokens) * period / capacity)
+        new_states.append((tokens - 1, now))
+    return retry_after, new_states
+
+
+class MemoryBucketStore:
+    """Per-process bucket store"""
+
+    def __init__(self, sweep_interval: float = 60.0):
+        self.sweep_interval = sweep_interval
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._next_sweep = time.time() + sweep_interval
+
+    def consume(self, specs: List[BucketSpec], now: float) -> float:
+        states = []
+        for key, _, _ in specs:
+            bucket = self._buckets.get(key)
+            states.append(bucket[:2] if bucket else None)
+
+        retry_after, new_states = _apply(states, specs, now)
+        if not retry_after:
+            for (key, _, period), (tokens, updated_at) in zip(specs, new_states):
+                self._buckets[key] = (tokens, updated_at, period)
+
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.sweep(now)
+        return retry_after
+
+    def sweep(self, now: float):
+        """Drop buckets that have been idle long enough to refill completely"""
+        for key, (_, updated_at, idle_ttl) in list(self._buckets.items()):
+            if now - updated_at >= idle_ttl:
+                self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    """Bucket store shared across worker processes via a local SQLite file"""
+
+    def __init__(self, filepath: str = RATE_LIMIT_DB_FILE, sweep_interval: float = 60.0):
+        self.filepath = filepath
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._next_sweep = time.time() + sweep_interval
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            ' key TEXT PRIMARY KEY, tokens REAL NOT NULL,'
+            ' updated_at REAL NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.filepath, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def consume(self, specs: List[BucketSpec], now: float) -> float:
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            states = []
+            for key, _, _ in specs:
+                row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+                states.append(tuple(row) if row else None)
+
+            retry_after, new_states = _apply(states, specs, now)
+            if not retry_after:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO buckets (key, tokens, updated_at, expires_at) VALUES (?, ?, ?, ?)',
+                    [(key, tokens, updated_at, updated_at + period)
+                     for (key, _, period), (tokens, updated_at) in zip(specs, new_states)]
+                )
+            if now >= self._next_sweep:
+                self._next_sweep = now + self.sweep_interval
+                conn.execute('DELETE FROM buckets WHERE expires_at <= ?', (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return retry_after
+
+
+class RateLimiter:
+    """Checks requests against a set of named token-bucket rules"""
+
+    def __init__(self, store=None, enabled: bool = True):
+        self.store = store if store is not None else MemoryBucketStore()
+        self.enabled = enabled
+
+    def hit(self, buckets: List[BucketSpec]) -> int:
+        """
+        Consume one token from each bucket.
+        Returns 0 if the request is allowed, otherwise the Retry-After value
+        in whole seconds.
+        """
+        if not self.enabled or not buckets:
+            return 0
+        try:
+            retry_after = self.store.consume(buckets, time.time())
+        except Exception as e:
+            # Fail open: a broken limiter store must not take the API down
+            print(f"⚠️  Rate limiter error: {e}")
+            return 0
+        return int(math.ceil(retry_after)) if retry_after else 0
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the rate limiter from environment variables"""
+    enabled = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    store_name = os.environ.get('RATE_LIMIT_STORE', 'memory').lower()
+    if store_name == 'sqlite':
+        store = SQLiteBucketStore(os.environ.get('RATE_LIMIT_DB_FILE', RATE_LIMIT_DB_FILE))
+    else:
+        store = MemoryBucketStore()
+    return RateLimiter(store=store, enabled=enabled)
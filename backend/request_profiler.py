@@ -0,0 +1,190 @@
+"""
+On-demand cProfile profiling of individual API requests.
+
+A request is profiled when it carries a valid signed X-Profile header, or at
+random with probability PROFILE_SAMPLE_RATE. The header value is
+"<expires_at>.<hmac>", where hmac is the hex HMAC-SHA256 of expires_at under
+PROFILING_SECRET; generate one with
+
+    python request_profiler.py token [--ttl 3600]
+
+Each profile is written to backend/data/profiles/ as <id>.pstats (load it
+with pstats, snakeviz or flameprof for a flame graph) plus an <id>.json
+metadata file with the route, status, duration and top functions. Only the
+newest PROFILE_MAX_FILES profiles are kept. At most one request is profiled
+at a time; others proceed unprofiled.
+"""
+import cProfile
+import hashlib
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from file_storage import DATA_DIR
+
+PROFILE_DIR = os.path.join(DATA_DIR, 'profiles')
+PROFILE_HEADER = 'X-Profile'
+
+
+def sign_profile_token(secret: str, expires_at: int) -> str:
+    signature = hmac.new(secret.encode('utf-8'), str(expires_at).encode('utf-8'), hashlib.sha256).hexdigest()
+    return f'{expires_at}.{signature}'
+
+
+def make_profile_token(secret: str, ttl: int = 3600) -> str:
+    """X-Profile header value valid for ttl seconds"""
+    return sign_profile_token(secret, int(time.time()) + ttl)
+
+
+class RequestProfiler:
+    """Decides which requests to profile and stores the results"""
+
+    def __init__(self, profile_dir: str = PROFILE_DIR, secret: str = '', sample_rate: float = 0.0,
+                 max_profiles: int = 50, top_functions: int = 10):
+        self.profile_dir = profile_dir
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.max_profiles = max(1, max_profiles)
+        self.top_functions = top_functions
+        self._active = threading.Lock()
+        self._prune_lock = threading.Lock()
+        os.makedirs(self.profile_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.secret) or self.sample_rate > 0
+
+    def verify_token(self, token: Optional[str]) -> bool:
+        if not self.secret or not token or '.' not in token:
+            return False
+        expires_at, _ = token.split('.', 1)
+        try:
+            if int(expires_at) < time.time():
+                return False
+        except ValueError:
+            return False
+        return hmac.compare_digest(token, sign_profile_token(self.secret, int(expires_at)))
+
+    def start(self, token: Optional[str] = None) -> Optional[cProfile.Profile]:
+        """
+        Start profiling the current request if it was asked for or sampled.
+        Returns the running profiler, or None if this request isn't profiled.
+        """
+        if not (self.verify_token(token) or (self.sample_rate > 0 and random.random() < self.sample_rate)):
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiling tool is active in this interpreter
+            self._active.release()
+            return None
+        return profiler
+
+    def stop(self, profiler: cProfile.Profile):
+        """Stop a profiler returned by start() without saving it"""
+        try:
+            profiler.disable()
+        finally:
+            self._active.release()
+
+    def save(self, profiler: cProfile.Profile, method: str, route: str, path: str,
+             status: int, duration_ms: float) -> str:
+        """Write a stopped profile and its metadata; returns the profile ID"""
+        profile_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:6]}"
+        stats_path = os.path.join(self.profile_dir, f'{profile_id}.pstats')
+        profiler.dump_stats(stats_path)
+
+        summary = io.StringIO()
+        stats = pstats.Stats(stats_path, stream=summary)
+        stats.sort_stats('cumulative').print_stats(self.top_functions)
+        metadata = {
+            'id': profile_id,
+            'method': method,
+            'route': route,
+            'path': path,
+            'status': status,
+            'duration_ms': round(duration_ms, 2),
+            'created_at': time.time(),
+            'total_calls': stats.total_calls,
+            'top_functions': summary.getvalue(),
+        }
+        meta_path = os.path.join(self.profile_dir, f'{profile_id}.json')
+        tmp_path = f'{meta_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, meta_path)
+
+        self._prune()
+        return profile_id
+
+    def _profile_ids(self) -> List[str]:
+        """Stored profile IDs, newest first (IDs start with a timestamp)"""
+        ids = [name[:-len('.json')] for name in os.listdir(self.profile_dir) if name.endswith('.json')]
+        return sorted(ids, reverse=True)
+
+    def _prune(self):
+        with self._prune_lock:
+            for profile_id in self._profile_ids()[self.max_profiles:]:
+                for suffix in ('.json', '.pstats'):
+                    try:
+                        os.remove(os.path.join(self.profile_dir, profile_id + suffix))
+                    except FileNotFoundError:
+                        pass
+
+    def list_profiles(self, limit: int = 50) -> List[Dict]:
+        """Metadata of the most recent profiles, newest first"""
+        profiles = []
+        for profile_id in self._profile_ids()[:limit]:
+            try:
+                with open(os.path.join(self.profile_dir, f'{profile_id}.json'), 'r', encoding='utf-8') as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                continue  # Pruned or being written concurrently
+            metadata.pop('top_functions', None)
+            profiles.append(metadata)
+        return profiles
+
+    def profile_path(self, profile_id: str) -> Optional[str]:
+        """Path of a stored .pstats file, or None for unknown/invalid IDs"""
+        if os.path.basename(profile_id) != profile_id:
+            return None
+        path = os.path.join(self.profile_dir, f'{profile_id}.pstats')
+        return path if os.path.exists(path) else None
+
+
+def create_request_profiler() -> RequestProfiler:
+    """Build the profiler from environment variables"""
+    return RequestProfiler(
+        profile_dir=os.environ.get('PROFILE_DIR', PROFILE_DIR),
+        secret=os.environ.get('PROFILING_SECRET', ''),
+        sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+        max_profiles=int(os.environ.get('PROFILE_MAX_FILES', 50)),
+    )
+
+
+if __name__ == '__main__':
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Request profiling helpers')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    token_parser = subparsers.add_parser('token', help='Print a signed X-Profile header value')
+    token_parser.add_argument('--ttl', type=int, default=3600, help='Seconds the token stays valid (default: 3600)')
+    args = parser.parse_args()
+
+    secret = os.environ.get('PROFILING_SECRET', '')
+    if not secret:
+        raise SystemExit('PROFILING_SECRET is not set')
+    print(make_profile_token(secret, args.ttl))
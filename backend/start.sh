@@ -14,6 +14,12 @@ if [ "$#" -gt 0 ]; then
 	exec sh -lc "$*"
 fi
 
+# SERVER_MODE=asgi serves the ASGI variant (asgi_app.py) under uvicorn instead
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+	echo "Starting uvicorn (ASGI) on 0.0.0.0:${PORT}"
+	exec uvicorn asgi_app:app --host 0.0.0.0 --port "${PORT}"
+fi
+
 echo "Starting gunicorn on 0.0.0.0:${PORT}"
 
 exec gunicorn app:app --bind "0.0.0.0:${PORT}"
@@ -0,0 +1,55 @@
+"""
+Boot-time phase timing.
+
+app.py wraps each startup phase (imports, config, storage, CORS, ...) in
+startup_timer.phase(name) and prints the breakdown once the module is loaded.
+The report is printed twice: as an aligned table for people reading the
+deploy logs, and as a single STARTUP_TIMING JSON line for log tooling.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class StartupTimer:
+    """Records how long each named startup phase took"""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self._phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self._phases[name] = self._phases.get(name, 0.0) + seconds
+
+    def finish(self):
+        """Mark the point where the app is able to answer requests"""
+        self.finished_at = time.perf_counter()
+
+    def summary(self) -> Dict:
+        with self._lock:
+            phases = {name: round(seconds * 1000, 1) for name, seconds in self._phases.items()}
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return {
+            'phases_ms': phases,
+            'total_ms': round((end - self.started_at) * 1000, 1)
+        }
+
+    def print_report(self, title: str = 'Startup timing'):
+        summary = self.summary()
+        print(f"⏱️  {title} (ready in {summary['total_ms']} ms)")
+        for name, ms in summary['phases_ms'].items():
+            print(f"   {name:<16} {ms:>8.1f} ms")
+        print(f"STARTUP_TIMING {json.dumps(summary, separators=(',', ':'))}")
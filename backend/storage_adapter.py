@@ -4,7 +4,7 @@ based on STORAGE_MODE setting.
 """
 from database import STORAGE_MODE, db, User, PowerLog, VerificationCode, DeviceId, RegionProfile
 from datetime import datetime, date
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 
 def get_storage():
     """Get the appropriate storage backend"""
@@ -69,33 +69,43 @@ def create_user(user_data: Dict):
         return user
 
 
+def update_user_password(username: str, password_hash: str):
+    """Replace a user's stored password hash"""
+    if STORAGE_MODE == 'file':
+        storage = get_storage()
+        return storage.update_user(username, {'password': password_hash})
+    else:
+        user = User.query.filter_by(username=username).first()
+        if user:
+            user.password = password_hash
+            db.session.commit()
+        return user
+
+
 # Verification code operations
+class FileVerificationCode:
+    """VerificationCode-like view of a file storage code; its expiry is parsed once, on write"""
+    def __init__(self, data: Dict, expires_at: datetime):
+        self.email = data.get('email')
+        self.code = data.get('code')
+        self.username = data.get('username')
+        self.password = data.get('password')
+        self.location = data.get('location')
+        self.region_id = data.get('region_id')
+        self.device_id = data.get('device_id')
+        self.expires_at = expires_at
+    
+    def is_expired(self):
+        return datetime.utcnow() > self.expires_at
+
+
 def get_verification_code_by_email(email: str):
     """Get verification code by email"""
     if STORAGE_MODE == 'file':
         storage = get_storage()
-        code_data = storage.get_verification_code_by_email(email)
-        if code_data:
-            class FileVerificationCode:
-                def __init__(self, data):
-                    self.email = data.get('email')
-                    self.code = data.get('code')
-                    self.username = data.get('username')
-                    self.password = data.get('password')
-                    self.location = data.get('location')
-                    self.region_id = data.get('region_id')
-                    self.device_id = data.get('device_id')
-                    expires_at_str = data.get('expires_at')
-                    if expires_at_str:
-                        self.expires_at = datetime.fromisoformat(expires_at_str.replace('Z', '+00:00'))
-                    else:
-                        self.expires_at = None
-                
-                def is_expired(self):
-                    if not self.expires_at:
-                        return True
-                    return datetime.utcnow() > self.expires_at.replace(tzinfo=None)
-            return FileVerificationCode(code_data)
+        found = storage.get_verification_code_by_email(email)
+        if found:
+            return FileVerificationCode(*found)
     else:
         return VerificationCode.query.filter_by(email=email).first()
     return None
@@ -105,28 +115,9 @@ def get_verification_code_by_username(username: str):
     """Get verification code by username"""
     if STORAGE_MODE == 'file':
         storage = get_storage()
-        for code_data in storage.verification_codes:
-            if code_data.get('username') == username:
-                class FileVerificationCode:
-                    def __init__(self, data):
-                        self.email = data.get('email')
-                        self.code = data.get('code')
-                        self.username = data.get('username')
-                        self.password = data.get('password')
-                        self.location = data.get('location')
-                        self.region_id = data.get('region_id')
-                        self.device_id = data.get('device_id')
-                        expires_at_str = data.get('expires_at')
-                        if expires_at_str:
-                            self.expires_at = datetime.fromisoformat(expires_at_str.replace('Z', '+00:00'))
-                        else:
-                            self.expires_at = None
-                    
-                    def is_expired(self):
-                        if not self.expires_at:
-                            return True
-                        return datetime.utcnow() > self.expires_at.replace(tzinfo=None)
-                return FileVerificationCode(code_data)
+        found = storage.get_verification_code_by_username(username)
+        if found:
+            return FileVerificationCode(*found)
     else:
         return VerificationCode.query.filter_by(username=username).first()
     return None
@@ -161,6 +152,17 @@ def delete_verification_code(email: str):
             db.session.commit()
 
 
+def record_failed_verification(email: str) -> int:
+    """
+    Count a wrong code for email; returns the attempts left (0 = code cleared
+    until resent). File storage only: the SQL VerificationCode model has no
+    attempts column.
+    """
+    if STORAGE_MODE != 'file':
+        raise RuntimeError('Verification attempt limits require file storage')
+    return get_storage().record_failed_verification(email)
+
+
 # Power log operations
 def create_power_log(log_data: Dict):
     """Create a power log"""
@@ -174,6 +176,18 @@ def create_power_log(log_data: Dict):
         return log
 
 
+def create_power_logs(logs: List[Dict]) -> List[Tuple[Dict, bool]]:
+    """
+    Create several power logs in one write, keeping their timestamps and
+    skipping logs whose (user_id, idempotency_key) was already stored.
+    Returns (log, created) pairs in input order. File storage only: the
+    SQL PowerLog model has no idempotency_key column to deduplicate on.
+    """
+    if STORAGE_MODE != 'file':
+        raise RuntimeError('Batch power logging requires file storage')
+    return get_storage().create_power_logs(logs)
+
+
 def get_power_logs_by_user(user_id: str, start_date=None, end_date=None):
     """Get power logs for a user"""
     if STORAGE_MODE == 'file':
@@ -215,6 +229,103 @@ def get_power_logs_by_user(user_id: str, start_date=None, end_date=None):
         return query.order_by(PowerLog.timestamp).all()
 
 
+def get_power_state(user_id: str) -> Optional[Dict]:
+    """
+    The user's latest power event as {'event_type', 'timestamp', 'region_id'}
+    (timestamp an ISO string), or None if they never logged one
+    """
+    if STORAGE_MODE == 'file':
+        return get_storage().get_power_state(user_id)
+    log = PowerLog.query.filter_by(user_id=user_id).order_by(PowerLog.timestamp.desc()).first()
+    if log is None:
+        return None
+    return {'event_type': log.event_type, 'timestamp': log.timestamp.isoformat(), 'region_id': log.region_id}
+
+
+def get_power_states() -> Dict[str, Dict]:
+    """Latest power event of every user, keyed by user_id"""
+    if STORAGE_MODE == 'file':
+        return get_storage().get_power_states()
+    states = {}
+    for log in PowerLog.query.order_by(PowerLog.timestamp).all():
+        states[log.user_id] = {'event_type': log.event_type, 'timestamp': log.timestamp.isoformat(),
+                               'region_id': log.region_id}
+    return states
+
+
+def get_supply_bitmaps():
+    """SupplyBitmaps over every user's power logs, for the supply heatmap"""
+    if STORAGE_MODE == 'file':
+        return get_storage().get_supply_bitmaps()
+    from analytics import to_us
+    from supply_bitmaps import create_supply_bitmaps
+    bitmaps = create_supply_bitmaps()
+    for log in PowerLog.query.order_by(PowerLog.timestamp).all():
+        bitmaps.add(log.user_id, to_us(log.timestamp), log.event_type == 'on', log.region_id)
+    return bitmaps
+
+
+def get_history_tiers():
+    """HistoryTiers over every user's power logs, for long-range history"""
+    if STORAGE_MODE == 'file':
+        return get_storage().get_history_tiers()
+    from analytics import to_us
+    from history_tiers import create_history_tiers
+    tiers = create_history_tiers()
+    for log in PowerLog.query.order_by(PowerLog.timestamp).all():
+        tiers.add(log.user_id, to_us(log.timestamp), log.event_type == 'on')
+    return tiers
+
+
+def get_change_feed():
+    """The power log change feed, or None (SQL mode, or CHANGE_FEED=0)"""
+    if STORAGE_MODE == 'file':
+        return get_storage().changes
+    return None
+
+
+def get_event_series(user_id: str, start_date: date, min_count: int = 1):
+    """
+    The user's events from start_date on (and at least min_count of them) as
+    an analytics EventSeries, for power_stats.build_report
+    """
+    if STORAGE_MODE == 'file':
+        return get_storage().get_event_series(user_id, start_date, min_count)
+    from analytics import series_from_logs
+    logs = get_power_logs_by_user(user_id, start_date=start_date)
+    if len(logs) < min_count:
+        # Newest first under PostgreSQL
+        logs = sorted(get_recent_power_logs(user_id, limit=min_count), key=lambda log: log.timestamp)
+    return series_from_logs(logs)
+
+
+def get_user_data_version(user_id: str) -> Optional[str]:
+    """
+    Token that changes whenever the user's profile or power logs change,
+    for ETags. None when the backend can't provide one.
+    """
+    if STORAGE_MODE == 'file':
+        return get_storage().get_user_data_version(user_id)
+    return None
+
+
+def iter_power_logs_by_user(user_id: str, start_date=None, end_date=None):
+    """
+    A user's power logs as plain dicts (ISO timestamps) by timestamp, read
+    incrementally so exports don't hold the whole history in memory
+    """
+    if STORAGE_MODE == 'file':
+        yield from get_storage().iter_power_logs_by_user(user_id, start_date, end_date)
+        return
+    query = PowerLog.query.filter_by(user_id=user_id)
+    if start_date:
+        query = query.filter(PowerLog.date >= start_date)
+    if end_date:
+        query = query.filter(PowerLog.date <= end_date)
+    for log in query.order_by(PowerLog.timestamp).yield_per(1000):
+        yield log.to_dict()
+
+
 def get_recent_power_logs(user_id: str, limit: int = 20):
     """Get recent power logs"""
     if STORAGE_MODE == 'file':
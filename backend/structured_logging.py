@@ -0,0 +1,130 @@
+"""
+Structured, non-blocking application logging.
+
+setup_logging() installs a QueueHandler on the root logger, so request
+threads only put records on an in-memory queue; a QueueListener thread
+formats them and writes to stdout. Records are emitted as one JSON object
+per line (LOG_FORMAT=json, the default) or as plain text (LOG_FORMAT=text).
+Fields passed via extra={...} become top-level JSON keys.
+
+Environment:
+    LOG_LEVEL               root level (default INFO)
+    LOG_LEVELS              per-logger overrides, e.g. "app=DEBUG,email_queue=WARNING"
+    LOG_FORMAT              json | text
+    LOG_DEBUG_SAMPLE_RATE   fraction of DEBUG records kept (default 1.0)
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Attributes every LogRecord has; anything else came from extra={...}
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with extra fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extras = ' '.join(f'{key}={value}' for key, value in record.__dict__.items()
+                          if key not in _RECORD_FIELDS and not key.startswith('_'))
+        return f'{line} {extras}' if extras else line
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keeps only a random fraction of DEBUG records; other levels always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps exceptions as a separate field instead of folding them into the message"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """'app=DEBUG,email_queue=warning' -> {'app': 'DEBUG', 'email_queue': 'WARNING'}"""
+    levels = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Configure logging from the environment (safe to call more than once)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if os.environ.get('LOG_FORMAT', 'json').lower() == 'text'
+                        else JsonFormatter())
+
+    handler = _QueueHandler(queue.SimpleQueue())
+    handler.addFilter(DebugSamplingFilter(float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 1.0))))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    for name, level in parse_levels(os.environ.get('LOG_LEVELS', '')).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,223 @@
+"""
+Per-user supply bitmaps behind GET /api/heatmap.
+
+Each local day of a user's history is a pair of 96-bit masks, one bit per
+15-minute slot: `on` has a bit set when power was on at the middle of that
+slot, `known` when the user's state was known then (from their first event
+until HEATMAP_STALE_HOURS after their latest one, since an old state says
+little about now). Masks are extended incrementally as events arrive: a new
+event fills the slots since the user's previous event with that event's
+state, so no history is walked again. Events that arrive out of order (e.g.
+a replayed offline batch) rebuild that user's masks from their logs.
+
+A weekday x hour grid is the sum over days of the popcount of each hour's
+4-bit nibble, for `on` and for `known`; their ratio is the probability of
+having power at that hour. Only the last HEATMAP_WEEKS weeks are kept.
+Hours are local time at HEATMAP_UTC_OFFSET_MINUTES (default 60, WAT).
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+from quantile_sketch import RegionWeekSketches, create_region_week_sketches
+from user_event_index import UserEventIndex
+
+SLOT_MINUTES = 15
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+SLOTS_PER_DAY = 24 * SLOTS_PER_HOUR
+SLOT_US = SLOT_MINUTES * 60 * 1000000
+DAY_US = SLOTS_PER_DAY * SLOT_US
+HOUR_MASK = (1 << SLOTS_PER_HOUR) - 1
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+# (on counts, known counts), each 7 weekdays x 24 hours of slot counts
+Grid = Tuple[List[List[int]], List[List[int]]]
+
+
+def _empty_counts() -> List[List[int]]:
+    return [[0] * 24 for _ in range(7)]
+
+
+def _weekday(day: int) -> int:
+    # Day 0 (1970-01-01) was a Thursday
+    return (day + 3) % 7
+
+
+class UserBitmaps:
+    __slots__ = ('days', 'last_us', 'last_on', 'region_id', 'version', 'grid_cache', 'closed_day')
+
+    def __init__(self):
+        self.days: Dict[int, List[int]] = {}  # local day number -> [on mask, known mask]
+        self.last_us: Optional[int] = None    # local time of the latest event
+        self.last_on = False
+        self.region_id: Optional[str] = None
+        self.version = 0
+        self.grid_cache: Optional[Tuple[Tuple[int, int], Grid]] = None
+        self.closed_day: Optional[int] = None  # days before this were passed to the sketches
+
+
+class SupplyBitmaps(UserEventIndex):
+    def __init__(self, weeks: int = 8, stale_hours: float = 24, utc_offset_minutes: int = 60,
+                 sketches: Optional[RegionWeekSketches] = None):
+        self.window_days = max(1, weeks) * 7
+        self.stale_us = int(stale_hours * 3600 * 1000000)
+        self.offset_us = utc_offset_minutes * 60 * 1000000
+        # Fed each user's days as they close, for regional percentiles
+        self.sketches = sketches
+        super().__init__()
+
+    @staticmethod
+    def _slot_range(start_us: int, end_us: int) -> Tuple[int, int]:
+        """Slots whose midpoint lies in [start_us, end_us)"""
+        half = SLOT_US // 2
+        return -(-(start_us - half) // SLOT_US), -(-(end_us - half) // SLOT_US)
+
+    @staticmethod
+    def _fill(days: Dict[int, List[int]], start_us: int, end_us: int, on: bool, first_day: int):
+        first, end = SupplyBitmaps._slot_range(start_us, end_us)
+        first = max(first, first_day * SLOTS_PER_DAY)
+        while first < end:
+            day, offset = divmod(first, SLOTS_PER_DAY)
+            last = min(end, (day + 1) * SLOTS_PER_DAY)
+            bits = ((1 << (last - first)) - 1) << offset
+            masks = days.setdefault(day, [0, 0])
+            masks[1] |= bits
+            if on:
+                masks[0] |= bits
+            first = last
+
+    def _prune(self, user: UserBitmaps, today: int):
+        oldest = today - self.window_days + 1
+        for day in [day for day in user.days if day < oldest]:
+            del user.days[day]
+
+    def _new_user(self, previous: Optional[UserBitmaps]) -> UserBitmaps:
+        user = UserBitmaps()
+        # Days already passed to the sketches aren't passed again
+        user.closed_day = previous.closed_day if previous else None
+        return user
+
+    def _apply(self, user_id: str, user: UserBitmaps, time_us: int, on: bool,
+               region_id: Optional[str] = None) -> bool:
+        local_us = time_us + self.offset_us
+        if user.last_us is not None and local_us < user.last_us:
+            return False
+        today = local_us // DAY_US
+        if user.last_us is not None:
+            end_us = min(local_us, user.last_us + self.stale_us)
+            self._fill(user.days, user.last_us, end_us, user.last_on, today - self.window_days + 1)
+            self._close_days(user_id, user, today)
+            self._prune(user, today)
+        user.closed_day = max(user.closed_day or today, today)
+        user.last_us, user.last_on = local_us, on
+        user.region_id = region_id or user.region_id
+        user.version += 1
+        return True
+
+    def _close_days(self, user_id: str, user: UserBitmaps, today: int):
+        """Pass days that can no longer change to the sketches (caller holds _lock)"""
+        if self.sketches is None:
+            return
+        closed = user.closed_day if user.closed_day is not None else today
+        for day in sorted(day for day in user.days if closed <= day < today):
+            on_mask, known_mask = user.days[day]
+            self.sketches.add_day(user_id, user.region_id, day,
+                                  on_mask.bit_count() / SLOTS_PER_HOUR, known_mask.bit_count() / SLOTS_PER_HOUR)
+
+    def _user_grid(self, user: UserBitmaps, now_us: int) -> Grid:
+        """Counts over the window ending today, including the open tail since the last event"""
+        local_now = now_us + self.offset_us
+        today = local_now // DAY_US
+        first_day = today - self.window_days + 1
+        # Closed days only change with a new event or when the window moves
+        cache_key = (user.version, today)
+        if user.grid_cache is not None and user.grid_cache[0] == cache_key:
+            on_counts, known_counts = user.grid_cache[1]
+        else:
+            on_counts, known_counts = _empty_counts(), _empty_counts()
+            self._count(user.days, first_day, on_counts, known_counts)
+            user.grid_cache = (cache_key, (on_counts, known_counts))
+        if user.last_us is None:
+            return on_counts, known_counts
+
+        tail: Dict[int, List[int]] = {}
+        self._fill(tail, user.last_us, min(local_now, user.last_us + self.stale_us), user.last_on, first_day)
+        if not tail:
+            return on_counts, known_counts
+        on_counts = [row[:] for row in on_counts]
+        known_counts = [row[:] for row in known_counts]
+        self._count(tail, first_day, on_counts, known_counts)
+        return on_counts, known_counts
+
+    @staticmethod
+    def _count(days: Dict[int, List[int]], first_day: int, on_counts, known_counts):
+        for day, (on_mask, known_mask) in days.items():
+            if day < first_day:
+                continue
+            on_row, known_row = on_counts[_weekday(day)], known_counts[_weekday(day)]
+            for hour in range(24):
+                shift = hour * SLOTS_PER_HOUR
+                known_row[hour] += ((known_mask >> shift) & HOUR_MASK).bit_count()
+                on_row[hour] += ((on_mask >> shift) & HOUR_MASK).bit_count()
+
+    def recent_hours(self, user_id: str, now_us: int, days: int = 7) -> Tuple[float, float]:
+        """(on hours, known hours) over the `days` days up to now, including the open tail"""
+        local_now = now_us + self.offset_us
+        first, end = self._slot_range(local_now - days * DAY_US, local_now)
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return 0.0, 0.0
+            window = {day: user.days[day][:] for day in range(first // SLOTS_PER_DAY, end // SLOTS_PER_DAY + 1)
+                      if day in user.days}
+            if user.last_us is not None:
+                self._fill(window, user.last_us, min(local_now, user.last_us + self.stale_us),
+                           user.last_on, first // SLOTS_PER_DAY)
+        on_slots = known_slots = 0
+        for day, (on_mask, known_mask) in window.items():
+            low = max(first - day * SLOTS_PER_DAY, 0)
+            high = min(end - day * SLOTS_PER_DAY, SLOTS_PER_DAY)
+            if low >= high:
+                continue
+            bits = ((1 << (high - low)) - 1) << low
+            on_slots += (on_mask & bits).bit_count()
+            known_slots += (known_mask & bits).bit_count()
+        return on_slots / SLOTS_PER_HOUR, known_slots / SLOTS_PER_HOUR
+
+    def user_grid(self, user_id: str, now_us: int) -> Optional[Grid]:
+        with self._lock:
+            user = self._users.get(user_id)
+            return self._user_grid(user, now_us) if user else None
+
+    def region_grid(self, region_id: str, now_us: int) -> Grid:
+        """Summed counts of every user whose latest event was in region_id"""
+        on_counts, known_counts = _empty_counts(), _empty_counts()
+        with self._lock:
+            users = [user for user in self._users.values() if user.region_id == region_id]
+            for user in users:
+                user_on, user_known = self._user_grid(user, now_us)
+                for weekday in range(7):
+                    on_row, known_row = on_counts[weekday], known_counts[weekday]
+                    for hour, (on, known) in enumerate(zip(user_on[weekday], user_known[weekday])):
+                        on_row[hour] += on
+                        known_row[hour] += known
+        return on_counts, known_counts
+
+
+def grid_response(grid: Optional[Grid]) -> Dict:
+    """{'probability': 7x24 (None where nothing is known), 'observed_hours': 7x24}"""
+    on_counts, known_counts = grid or (_empty_counts(), _empty_counts())
+    return {
+        'probability': [[round(on / known, 3) if known else None for on, known in zip(on_row, known_row)]
+                        for on_row, known_row in zip(on_counts, known_counts)],
+        'observed_hours': [[round(known / SLOTS_PER_HOUR, 2) for known in known_row] for known_row in known_counts],
+    }
+
+
+def create_supply_bitmaps() -> SupplyBitmaps:
+    """Build an empty index from environment variables"""
+    return SupplyBitmaps(
+        weeks=int(os.environ.get('HEATMAP_WEEKS', 8)),
+        stale_hours=float(os.environ.get('HEATMAP_STALE_HOURS', 24)),
+        utc_offset_minutes=int(os.environ.get('HEATMAP_UTC_OFFSET_MINUTES', 60)),
+        sketches=create_region_week_sketches(),
+    )
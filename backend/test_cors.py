@@ -0,0 +1,42 @@
+"""
+CORS preflights in production mode (FRONTEND_URL set).
+
+app.py configures CORS at import time, so each check runs in a fresh
+interpreter with the environment it needs.
+"""
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PREFLIGHT = """
+import json
+import app as backend
+response = backend.app.test_client().options('/api/log-power', headers={
+    'Origin': 'https://example.com',
+    'Access-Control-Request-Method': 'POST',
+    'Access-Control-Request-Headers': 'Authorization, Content-Type, Idempotency-Key',
+})
+print('PREFLIGHT ' + json.dumps({
+    'origin': response.headers.get('Access-Control-Allow-Origin'),
+    'headers': response.headers.get('Access-Control-Allow-Headers', ''),
+}))
+"""
+
+
+def run_preflight(frontend_url: str) -> dict:
+    env = {**os.environ, 'FRONTEND_URL': frontend_url, 'ALLOW_DEV_ORIGINS': 'false'}
+    result = subprocess.run([sys.executable, '-c', PREFLIGHT], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    line = next(line for line in result.stdout.splitlines() if line.startswith('PREFLIGHT '))
+    return json.loads(line[len('PREFLIGHT '):])
+
+
+def test_production_preflight_allows_idempotency_key():
+    preflight = run_preflight('https://example.com')
+    assert preflight['origin'] == 'https://example.com'
+    allowed = {header.strip().lower() for header in preflight['headers'].split(',')}
+    assert {'authorization', 'content-type', 'idempotency-key'} <= allowed
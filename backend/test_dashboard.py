@@ -0,0 +1,51 @@
+"""
+Conditional GET /api/dashboard: ETags are per user and responses vary on Authorization.
+
+Runs against a FileStorage in a temporary directory swapped in for the
+process-wide one.
+"""
+import pytest
+
+import app as backend
+import file_storage
+from file_storage import FileStorage
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    store = FileStorage(str(tmp_path))
+    monkeypatch.setattr(file_storage, 'file_storage', store)
+    yield store
+    store.verifications.stop_sweeper()
+    store.stop_archiver()
+
+
+def auth(username):
+    return {'Authorization': f'Bearer {backend.generate_token(username)}'}
+
+
+def create_user(storage, username):
+    storage.create_user({'username': username, 'password': 'x', 'email': f'{username}@example.com'})
+
+
+def test_unchanged_dashboard_is_304(storage):
+    create_user(storage, 'alice')
+    client = backend.app.test_client()
+    first = client.get('/api/dashboard', headers=auth('alice'))
+    assert first.status_code == 200
+    assert 'Authorization' in first.headers['Vary']
+
+    again = client.get('/api/dashboard', headers={**auth('alice'), 'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert 'Authorization' in again.headers['Vary']
+
+
+def test_other_users_etag_gets_200(storage):
+    # Neither user has written anything, so their write counts are equal
+    create_user(storage, 'alice')
+    create_user(storage, 'bob')
+    client = backend.app.test_client()
+    alice = client.get('/api/dashboard', headers=auth('alice'))
+    bob = client.get('/api/dashboard', headers={**auth('bob'), 'If-None-Match': alice.headers['ETag']})
+    assert bob.status_code == 200
+    assert bob.headers['ETag'] != alice.headers['ETag']
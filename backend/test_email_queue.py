@@ -0,0 +1,202 @@
+"""
+EmailQueue against a local stub of the Resend API (http.server on localhost).
+
+The stub answers each POST with the next scripted (status, body) response,
+repeating the last one, and records what it was sent.
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from email_queue import STATUS_FAILED, STATUS_QUEUED, STATUS_SENT, EmailQueue
+
+
+class StubResend:
+    def __init__(self):
+        self.responses = [(200, {'id': 'stub-1'})]
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub.requests.append({'headers': dict(self.headers), 'json': json.loads(body)})
+                status, payload = stub.responses[0] if len(stub.responses) == 1 else stub.responses.pop(0)
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/emails'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubResend()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def make_queue(stub, tmp_path):
+    queues = []
+
+    def make(**kwargs):
+        options = {'spool_dir': str(tmp_path / 'spool'), 'workers': 1, 'backoff_base': 0.05, 'timeout': 5}
+        options.update(kwargs)
+        queue = EmailQueue(stub.url, 'test-key', **options)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.stop()
+
+
+def wait_for_status(queue, message_id, statuses, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.get_status(message_id)
+        if status['status'] in statuses:
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f'{message_id} still {queue.get_status(message_id)}')
+
+
+def enqueue(queue, code='123456'):
+    return queue.enqueue(to='user@example.com', subject='Verify', html=f'<p>{code}</p>',
+                         sender='noreply@example.com', context={'code': code})
+
+
+def test_delivers_through_stub(stub, make_queue):
+    queue = make_queue()
+    status = wait_for_status(queue, enqueue(queue)['id'], (STATUS_SENT, STATUS_FAILED))
+    assert status['status'] == STATUS_SENT
+    assert status['attempts'] == 1
+    assert status['provider_id'] == 'stub-1'
+    assert stub.requests[0]['headers']['Authorization'] == 'Bearer test-key'
+    assert stub.requests[0]['json']['to'] == ['user@example.com']
+
+
+def test_retries_5xx_with_backoff(stub, make_queue):
+    stub.responses = [(503, {'message': 'busy'}), (502, {'message': 'bad gateway'}), (200, {'id': 'stub-3'})]
+    queue = make_queue(max_attempts=4)
+    message_id = enqueue(queue)['id']
+    status = wait_for_status(queue, message_id, (STATUS_SENT, STATUS_FAILED))
+    assert status['status'] == STATUS_SENT
+    assert status['attempts'] == 3
+    assert status['provider_id'] == 'stub-3'
+    assert len(stub.requests) == 3
+
+
+def test_backoff_delays_the_next_attempt(stub, make_queue):
+    stub.responses = [(500, {'message': 'down'}), (200, {'id': 'late'})]
+    queue = make_queue(backoff_base=30)
+    message_id = enqueue(queue)['id']
+    status = queue.wait(message_id, 5)
+    # First attempt failed and the retry is scheduled ~30s out, not run right away
+    assert status['status'] == STATUS_QUEUED
+    assert status['attempts'] == 1
+    assert status['last_error'].startswith('HTTP 500')
+    assert queue.get_message(message_id)['next_attempt_at'] >= time.time() + 25
+    assert len(stub.requests) == 1
+
+
+def test_undelivered_spool_is_resent_after_restart(stub, make_queue, monkeypatch):
+    crashed = make_queue()
+    monkeypatch.setattr(crashed, 'start', lambda: None)  # Process dies before any worker runs
+    queued_id = enqueue(crashed, '111111')['id']
+    sending_id = enqueue(crashed, '222222')['id']
+    # One of them was mid-delivery when the process died
+    path = os.path.join(crashed.spool_dir, f'{sending_id}.json')
+    with open(path, encoding='utf-8') as f:
+        message = json.load(f)
+    message['status'] = 'sending'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(message, f)
+    assert not stub.requests
+    crashed.stop()  # Its spool locks go with the process
+
+    restarted = make_queue()
+    restarted.start()
+    for message_id in (queued_id, sending_id):
+        assert wait_for_status(restarted, message_id, (STATUS_SENT, STATUS_FAILED))['status'] == STATUS_SENT
+    assert sorted(request['json']['html'] for request in stub.requests) == ['<p>111111</p>', '<p>222222</p>']
+
+
+def test_workers_sharing_a_spool_send_each_message_once(stub, make_queue, monkeypatch):
+    crashed = make_queue()
+    monkeypatch.setattr(crashed, 'start', lambda: None)
+    message_ids = [enqueue(crashed, f'{code:06d}')['id'] for code in range(5)]
+    crashed.stop()
+
+    # Several gunicorn workers come up on the same spool after the restart
+    workers = [make_queue() for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for message_id in message_ids:
+        owner = next(worker for worker in workers if message_id in worker._messages)
+        assert wait_for_status(owner, message_id, (STATUS_SENT, STATUS_FAILED))['status'] == STATUS_SENT
+    time.sleep(0.2)
+    assert len(stub.requests) == len(message_ids)
+
+
+def test_status_is_visible_from_other_workers(stub, make_queue):
+    stub.responses = [(500, {'message': 'down'})]
+    sender, other = make_queue(max_attempts=1), make_queue()
+    message_id = enqueue(sender, '777777')['id']
+    wait_for_status(sender, message_id, (STATUS_SENT, STATUS_FAILED))
+    status = other.get_status(message_id)
+    assert status['status'] == STATUS_FAILED
+    assert other.get_message(message_id)['context']['code'] == '777777'
+    assert other.get_status('../' + message_id) is None
+    # Finished messages aren't re-sent by a worker that scans the spool later
+    with other._cond:
+        other._load_spool()
+    assert message_id not in other._messages
+
+
+def test_failed_delivery_exposes_fallback_code(stub, make_queue, monkeypatch):
+    import app as backend
+    import email_queue
+
+    stub.responses = [(500, {'message': 'down'})]
+    queue = make_queue(max_attempts=2)
+    monkeypatch.setattr(email_queue, 'email_queue', queue)
+    message_id = enqueue(queue, '654321')['id']
+    status = wait_for_status(queue, message_id, (STATUS_SENT, STATUS_FAILED))
+    assert status['status'] == STATUS_FAILED
+    assert status['attempts'] == 2
+
+    client = backend.app.test_client()
+    response = client.get(f'/api/email-status/{message_id}')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['status'] == STATUS_FAILED
+    assert body['fallback_code'] == '654321'
+    assert 'payload' not in body and 'context' not in body
+    assert client.get('/api/email-status/unknown').status_code == 404
+
+
+def test_client_errors_are_not_retried(stub, make_queue):
+    stub.responses = [(422, {'message': 'invalid to'})]
+    queue = make_queue(max_attempts=4)
+    status = wait_for_status(queue, enqueue(queue)['id'], (STATUS_SENT, STATUS_FAILED))
+    assert status['status'] == STATUS_FAILED
+    assert status['attempts'] == 1
+    assert status['last_error'] == 'HTTP 422: invalid to'
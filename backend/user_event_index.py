@@ -0,0 +1,62 @@
+"""
+Base class of the per-user indexes extended as power logs are written
+(supply_bitmaps, history_tiers).
+
+Each keeps one state object per user and extends it one event at a time, in
+time order, so no history is walked again. An event older than the user's
+latest can't be applied that way; the user is then rebuilt by replaying all
+their events, under the index lock so readers never see them half-built.
+"""
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from analytics import log_event
+
+
+class UserEventIndex(ABC):
+    def __init__(self):
+        self._users: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _new_user(self, previous: Optional[Any]) -> Any:
+        """Empty state for a user; previous is the state a rebuild replaces"""
+
+    @abstractmethod
+    def _apply(self, user_id: str, user: Any, time_us: int, on: bool, region_id: Optional[str] = None) -> bool:
+        """Extend user with an event, or return False if it is older than their latest (caller holds _lock)"""
+
+    def add(self, user_id: str, time_us: int, on: bool, region_id: Optional[str] = None) -> bool:
+        """
+        Record an event (time in UTC microseconds since the epoch). Returns
+        False, without recording it, if it is older than the user's latest
+        event; the caller should then rebuild() the user.
+        """
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                user = self._users[user_id] = self._new_user(None)
+            return self._apply(user_id, user, time_us, on, region_id)
+
+    def add_logs(self, logs: Iterable[Dict], history: Callable[[str], Iterable[Dict]] = lambda user_id: ()):
+        """
+        Record stored log dicts. Users with a log older than what is already
+        recorded are rebuilt from history(user_id), all their stored logs.
+        """
+        stale = set()
+        for log in sorted(logs, key=lambda log: str(log.get('timestamp'))):
+            user_id = log.get('user_id')
+            if user_id not in stale and not self.add(user_id, *log_event(log)):
+                stale.add(user_id)
+        for user_id in stale:
+            self.rebuild(user_id, [log_event(log) for log in history(user_id)])
+
+    def rebuild(self, user_id: str, events: Iterable[Tuple[int, bool, Optional[str]]]):
+        """Replace a user's state from all their (time_us, on, region_id) events"""
+        events = sorted(events, key=lambda event: event[0])
+        with self._lock:
+            user = self._new_user(self._users.get(user_id))
+            for event in events:
+                self._apply(user_id, user, *event)
+            self._users[user_id] = user
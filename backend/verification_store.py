@@ -0,0 +1,195 @@
+"""
+Pending email/device verifications for file storage.
+
+Codes used to live in a plain list: every lookup scanned it, deleting one
+rebuilt it, every expiry check parsed the stored ISO string again, and an
+expired code was only removed if someone happened to register the same
+username. VerificationStore keeps them indexed instead:
+
+- by email (the record key; device codes use '<email>_device') and by
+  username, so lookups are dict reads;
+- with each expiry parsed once, and a min-heap of (expires_at, email) so the
+  sweeper finds expired codes without looking at live ones. Replaced codes
+  leave their old heap entry behind; it is skipped when popped and the heap
+  is rebuilt when such entries outnumber live ones;
+- with a count of wrong guesses per code, so limiting brute force is a
+  counter bump. Counters are in memory only (a restart resets them). After
+  VERIFICATION_MAX_ATTEMPTS wrong guesses the code is cleared, so no guess
+  matches it; the record stays so the code can be resent, which resets the
+  count.
+
+A background thread evicts expired codes every VERIFICATION_SWEEP_SECONDS,
+up to VERIFICATION_SWEEP_BATCH at a time with one write of the file per
+batch. Expired codes that haven't been swept yet are still returned; callers
+check is_expired() as before.
+"""
+import heapq
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+MAX_ATTEMPTS = int(os.environ.get('VERIFICATION_MAX_ATTEMPTS', 5))
+
+
+def parse_expiry(value) -> datetime:
+    """Naive UTC expiry of a stored code; a code without one counts as expired"""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if not value:
+        return datetime.min
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return datetime.min
+
+
+class VerificationStore:
+    def __init__(self, records: List[Dict], persist: Callable[[List[Dict]], None],
+                 lock: Optional[threading.RLock] = None, max_attempts: int = MAX_ATTEMPTS,
+                 sweep_seconds: float = 60, sweep_batch: int = 500):
+        # persist(records) writes the full list; it is called with lock held
+        self._persist = persist
+        self._lock = lock or threading.RLock()
+        self.max_attempts = max(1, max_attempts)
+        self.sweep_seconds = sweep_seconds
+        self.sweep_batch = max(1, sweep_batch)
+        self._by_email: Dict[str, Dict] = {}
+        self._by_username: Dict[str, Dict[str, None]] = {}   # username -> emails, oldest first
+        self._expires: Dict[str, datetime] = {}
+        self._heap: List[Tuple[datetime, str]] = []
+        self._attempts: Dict[str, int] = {}
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        for record in records:
+            if record.get('email'):
+                self._index(dict(record))
+
+    def _index(self, record: Dict):
+        """Add or replace a record in every index (caller holds _lock)"""
+        email = record['email']
+        self._unindex_username(email)
+        expires_at = parse_expiry(record.get('expires_at'))
+        self._by_email[email] = record
+        self._by_username.setdefault(record.get('username'), {})[email] = None
+        self._expires[email] = expires_at
+        heapq.heappush(self._heap, (expires_at, email))
+        if len(self._heap) > 2 * len(self._expires) + 64:
+            # Mostly superseded entries; rebuild from the live expiries
+            self._heap = [(expires, email) for email, expires in self._expires.items()]
+            heapq.heapify(self._heap)
+
+    def _unindex_username(self, email: str):
+        previous = self._by_email.get(email)
+        if previous is not None:
+            emails = self._by_username.get(previous.get('username'))
+            if emails is not None:
+                emails.pop(email, None)
+                if not emails:
+                    del self._by_username[previous.get('username')]
+
+    def _remove(self, email: str) -> bool:
+        """Drop a record; its heap entry is skipped when popped (caller holds _lock)"""
+        if email not in self._by_email:
+            return False
+        self._unindex_username(email)
+        del self._by_email[email]
+        del self._expires[email]
+        self._attempts.pop(email, None)
+        return True
+
+    def records(self) -> List[Dict]:
+        return list(self._by_email.values())
+
+    def get(self, email: str) -> Optional[Tuple[Dict, datetime]]:
+        """(record, naive UTC expiry) of the code stored under email"""
+        record = self._by_email.get(email)
+        if record is None:
+            return None
+        return record, self._expires.get(email, datetime.min)
+
+    def get_by_username(self, username: str) -> Optional[Tuple[Dict, datetime]]:
+        """The oldest code pending for username"""
+        emails = self._by_username.get(username)
+        for email in list(emails or ()):
+            found = self.get(email)
+            if found is not None:
+                return found
+        return None
+
+    def put(self, record: Dict) -> Dict:
+        """Create or update the code for record['email'], resetting its attempts"""
+        with self._lock:
+            existing = self._by_email.get(record['email'])
+            merged = {**existing, **record} if existing is not None else dict(record)
+            self._index(merged)
+            self._attempts.pop(record['email'], None)
+            self._persist(self.records())
+        return merged
+
+    def delete(self, email: str):
+        with self._lock:
+            if self._remove(email):
+                self._persist(self.records())
+
+    def record_failure(self, email: str) -> int:
+        """
+        Count a wrong guess at email's code. Returns the guesses left; at 0
+        the code has been cleared until it is replaced.
+        """
+        with self._lock:
+            record = self._by_email.get(email)
+            if record is None:
+                return 0
+            attempts = self._attempts.get(email, 0) + 1
+            self._attempts[email] = attempts
+            if attempts < self.max_attempts:
+                return self.max_attempts - attempts
+            if record.get('code') is not None:
+                self._index({**record, 'code': None})
+                self._persist(self.records())
+            return 0
+
+    def sweep(self, now: Optional[datetime] = None) -> int:
+        """Evict up to sweep_batch expired codes with one persist; returns how many"""
+        now = now or datetime.utcnow()
+        with self._lock:
+            expired = []
+            while self._heap and self._heap[0][0] <= now and len(expired) < self.sweep_batch:
+                expires_at, email = heapq.heappop(self._heap)
+                # Skip entries left behind by a replaced or deleted code
+                if self._expires.get(email) == expires_at and self._remove(email):
+                    expired.append(email)
+            if expired:
+                self._persist(self.records())
+        return len(expired)
+
+    def _sweep_loop(self):
+        while not self._stop.is_set():
+            try:
+                while self.sweep() == self.sweep_batch:
+                    pass
+            except Exception as e:
+                # Evicted codes are written out with the next successful persist
+                print(f"⚠️  Verification code sweep failed: {e}")
+            self._stop.wait(self.sweep_seconds)
+
+    def start_sweeper(self):
+        """Sweep now and then every sweep_seconds on a daemon thread (0 = never)"""
+        if self.sweep_seconds <= 0 or self._sweeper is not None:
+            return
+        self._sweeper = threading.Thread(target=self._sweep_loop, name='verification-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+
+
+def create_verification_store(records: List[Dict], persist: Callable[[List[Dict]], None],
+                              lock: Optional[threading.RLock] = None) -> VerificationStore:
+    """Index records, configured from environment variables"""
+    return VerificationStore(
+        records, persist, lock=lock,
+        sweep_seconds=float(os.environ.get('VERIFICATION_SWEEP_SECONDS', 60)),
+        sweep_batch=int(os.environ.get('VERIFICATION_SWEEP_BATCH', 500)),
+    )
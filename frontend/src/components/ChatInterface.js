@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useRef, useCallback } from 'react';
-import api from '../services/api';
+import api, { newIdempotencyKey } from '../services/api';
 import { FaLightbulb, FaPowerOff, FaCheckCircle, FaChartBar, FaRobot } from 'react-icons/fa';
 import './ChatInterface.css';
 
@@ -33,8 +33,8 @@ const ChatInterface = ({ onLogEvent }) => {
 
   const fetchRecentEvents = useCallback(async () => {
     try {
-      const response = await api.get('/recent-events?limit=20');
-      const events = response.data.events.reverse();
+      const response = await api.get('/dashboard?period=week&limit=20');
+      const events = [...response.data.recent_events].reverse();
       const formattedMessages = formatEventMessages(events);
 
       if (formattedMessages.length === 0) {
@@ -167,7 +167,9 @@ Total Events:
       // Show loading indicator for a moment
       await new Promise(resolve => setTimeout(resolve, 800));
       
-      await api.post('/log-power', { event_type: eventType });
+      await api.post('/log-power', { event_type: eventType }, {
+        headers: { 'Idempotency-Key': newIdempotencyKey() }
+      });
       
       // Add bot confirmation
       const botMessage = {
@@ -189,7 +191,10 @@ Total Events:
     } catch (error) {
       const errorMessage = {
         id: Date.now(),
-        text: 'Error logging event. Please try again.',
+        // 409: the server already has power in this state (e.g. logged from another device)
+        text: error.response?.status === 409 && error.response.data?.error
+          ? `${error.response.data.error}. Refresh to see the latest state.`
+          : 'Error logging event. Please try again.',
         timestamp: new Date().toLocaleString(),
         timestampValue: Date.now(),
         type: 'error',
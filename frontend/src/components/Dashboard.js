@@ -6,6 +6,30 @@ import StatsChart from './StatsChart';
 import { FaBolt, FaChartBar, FaMapMarkerAlt, FaClock, FaCheckCircle } from 'react-icons/fa';
 import './Dashboard.css';
 
+// Monthly hours for the last 12 months next to the same months a year
+// earlier, from the monthly history tier (one bucket per bar)
+const fetchYearOverYear = async () => {
+  const now = new Date();
+  const from = new Date(Date.UTC(now.getUTCFullYear() - 2, now.getUTCMonth() + 1, 1));
+  const response = await api.get(`/history?granularity=month&from=${from.toISOString().slice(0, 10)}`);
+  const hoursByMonth = Object.fromEntries(response.data.series.map(point => [point.start, point.hours]));
+  const monthly = [];
+  for (let offset = 11; offset >= 0; offset--) {
+    const month = new Date(Date.UTC(now.getUTCFullYear(), now.getUTCMonth() - offset, 1));
+    const lastYear = new Date(Date.UTC(month.getUTCFullYear() - 1, month.getUTCMonth(), 1));
+    const key = month.toISOString().slice(0, 10);
+    monthly.push({
+      date: key,
+      hours: hoursByMonth[key] || 0,
+      previous_hours: hoursByMonth[lastYear.toISOString().slice(0, 10)] ?? null
+    });
+  }
+  return {
+    total_hours: Math.round(monthly.reduce((sum, point) => sum + point.hours, 0) * 100) / 100,
+    monthly_stats: monthly
+  };
+};
+
 const Dashboard = () => {
   const { username, logout } = useAuth();
   const [stats, setStats] = useState(null);
@@ -19,8 +43,14 @@ const Dashboard = () => {
   const fetchStats = useCallback(async () => {
     try {
       setLoading(true);
-      const response = await api.get(`/stats?period=${period}`);
-      setStats(response.data);
+      // Same URL as ChatInterface's poll, so the browser revalidates one cached
+      // copy (If-None-Match -> 304) instead of the backend recomputing it
+      if (period === 'year') {
+        setStats(await fetchYearOverYear());
+        return;
+      }
+      const response = await api.get(`/dashboard?period=${period}&limit=20`);
+      setStats(response.data.stats);
       
     } catch (error) {
       console.error('Error fetching stats:', error);
@@ -110,6 +140,12 @@ const Dashboard = () => {
               >
                 Month
               </button>
+              <button
+                className={period === 'year' ? 'active' : ''}
+                onClick={() => setPeriod('year')}
+              >
+                Year
+              </button>
             </div>
           </div>
           
@@ -130,7 +166,11 @@ const Dashboard = () => {
                 <FaChartBar className="toggle-icon" />
                 {showCharts ? 'Hide Charts' : 'Show Charts'}
               </button>
-              {showCharts && <StatsChart data={stats.daily_stats} />}
+              {showCharts && (period === 'year' ? (
+                <StatsChart data={stats.monthly_stats} title="Monthly Hours, Year over Year" monthly />
+              ) : (
+                <StatsChart data={stats.daily_stats} />
+              ))}
             </div>
           ) : (
             <div className="no-data">No data available</div>
@@ -67,7 +67,7 @@ const Login = () => {
         });
         
         // Login directly - no device verification needed
-        login(response.data.token, response.data.username);
+        login(response.data.token, response.data.username, response.data.refresh_token);
         navigate('/dashboard');
       } else {
         // Registration flow with email verification
@@ -91,7 +91,7 @@ const Login = () => {
           if (response.data.deviceId) {
             localStorage.setItem('deviceId', response.data.deviceId);
           }
-          login(response.data.token, response.data.username);
+          login(response.data.token, response.data.username, response.data.refresh_token);
           navigate('/dashboard');
         }
       }
@@ -137,7 +137,7 @@ const Login = () => {
       
       if (response.data.token) {
         // Existing user - log them in
-        login(response.data.token, response.data.username);
+        login(response.data.token, response.data.username, response.data.refresh_token);
         navigate('/dashboard');
       } else if (response.data.isNewUser) {
         // New user - show location input
@@ -179,7 +179,7 @@ const Login = () => {
       
       if (response.data.token) {
         // Account created - log them in
-        login(response.data.token, response.data.username);
+        login(response.data.token, response.data.username, response.data.refresh_token);
         navigate('/dashboard');
       }
     } catch (err) {
@@ -253,7 +253,7 @@ const Login = () => {
           localStorage.setItem('deviceId', response.data.deviceId);
         }
         // Login user
-        login(response.data.token, response.data.username);
+        login(response.data.token, response.data.username, response.data.refresh_token);
         navigate('/dashboard');
       }
     } catch (err) {
@@ -13,7 +13,7 @@ import {
 } from 'recharts';
 import './StatsChart.css';
 
-const StatsChart = ({ data }) => {
+const StatsChart = ({ data, title = 'Daily Hours Breakdown', monthly = false }) => {
   if (!data || data.length === 0) {
     return <div className="no-chart-data">No data to display</div>;
   }
@@ -21,15 +21,21 @@ const StatsChart = ({ data }) => {
   // Format dates for display
   const formattedData = data.map(item => ({
     ...item,
-    dateLabel: new Date(item.date).toLocaleDateString('en-US', {
+    dateLabel: new Date(item.date).toLocaleDateString('en-US', monthly ? {
+      month: 'short',
+      year: '2-digit',
+      timeZone: 'UTC'
+    } : {
       month: 'short',
       day: 'numeric'
     })
   }));
+  // Year-over-year data carries the same period a year earlier
+  const hasPrevious = data.some(item => item.previous_hours !== undefined && item.previous_hours !== null);
 
   return (
     <div className="stats-chart">
-      <h3>Daily Hours Breakdown</h3>
+      <h3>{title}</h3>
       <ResponsiveContainer width="100%" height={300}>
         <BarChart data={formattedData} margin={{ top: 10, right: 10, left: 0, bottom: 10 }}>
           <CartesianGrid strokeDasharray="3 3" stroke="#e0e0e0" />
@@ -50,11 +56,20 @@ const StatsChart = ({ data }) => {
               borderRadius: '8px',
               padding: '10px'
             }}
-            formatter={(value) => [`${value} hours`, 'Light Hours']}
+            formatter={(value, name) => [`${value} hours`, name]}
           />
           <Legend />
+          {hasPrevious && (
+            <Bar
+              dataKey="previous_hours"
+              name="Year Before"
+              fill="#c3c8e8"
+              radius={[8, 8, 0, 0]}
+            />
+          )}
           <Bar
             dataKey="hours"
+            name="Light Hours"
             fill="url(#colorGradient)"
             radius={[8, 8, 0, 0]}
           />
@@ -88,12 +103,24 @@ const StatsChart = ({ data }) => {
                 borderRadius: '8px',
                 padding: '10px'
               }}
-              formatter={(value) => [`${value} hours`, 'Light Hours']}
+              formatter={(value, name) => [`${value} hours`, name]}
             />
             <Legend />
+            {hasPrevious && (
+              <Line
+                type="monotone"
+                dataKey="previous_hours"
+                name="Year Before"
+                stroke="#c3c8e8"
+                strokeWidth={2}
+                strokeDasharray="5 5"
+                connectNulls
+              />
+            )}
             <Line
               type="monotone"
               dataKey="hours"
+              name="Light Hours"
               stroke="#667eea"
               strokeWidth={3}
               dot={{ fill: '#764ba2', r: 5 }}
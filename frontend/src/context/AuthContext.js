@@ -28,16 +28,33 @@ export const AuthProvider = ({ children }) => {
     setLoading(false);
   }, []);
 
-  const login = (token, username) => {
+  useEffect(() => {
+    // api.js fires this when the session can no longer be refreshed
+    const handleForcedLogout = () => logout();
+    window.addEventListener('auth:logout', handleForcedLogout);
+    return () => window.removeEventListener('auth:logout', handleForcedLogout);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, []);
+
+  const login = (token, username, refreshToken) => {
     localStorage.setItem('token', token);
     localStorage.setItem('username', username);
+    if (refreshToken) {
+      localStorage.setItem('refreshToken', refreshToken);
+    }
     api.defaults.headers.common['Authorization'] = `Bearer ${token}`;
     setIsAuthenticated(true);
     setUsername(username);
   };
 
   const logout = () => {
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (refreshToken) {
+      // Best effort: revoke tokens server-side
+      api.post('/logout', { refresh_token: refreshToken }).catch(() => {});
+    }
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     localStorage.removeItem('username');
     // Note: We keep deviceId stored even after logout for future logins
     delete api.defaults.headers.common['Authorization'];
@@ -18,10 +18,73 @@ const api = axios.create({
   timeout: 10000, // 10 second timeout
 });
 
+// Access tokens are short-lived; one refresh request is shared by all
+// requests that fail with an expired token at the same time
+let refreshPromise = null;
+
+const refreshAccessToken = () => {
+  if (!refreshPromise) {
+    const refreshToken = localStorage.getItem('refreshToken');
+    refreshPromise = (refreshToken
+      ? axios.post(`${getApiUrl()}/token/refresh`, { refresh_token: refreshToken }, { timeout: 10000 })
+      : Promise.reject(new Error('No refresh token'))
+    )
+      .then((response) => {
+        const { token, refresh_token: newRefreshToken } = response.data;
+        localStorage.setItem('token', token);
+        localStorage.setItem('refreshToken', newRefreshToken);
+        api.defaults.headers.common['Authorization'] = `Bearer ${token}`;
+        return token;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
+// Sent as the Idempotency-Key header: the server replays its first response
+// for repeats, so a write that timed out can be retried without duplicating it
+export const newIdempotencyKey = () =>
+  (window.crypto && window.crypto.randomUUID)
+    ? window.crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
 // Add request interceptor for error handling
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
+    const originalRequest = error.config;
+    if (
+      !error.response &&
+      originalRequest &&
+      !originalRequest._idempotentRetried &&
+      originalRequest.headers &&
+      originalRequest.headers['Idempotency-Key']
+    ) {
+      // No response (timeout or dropped connection): safe to send again
+      originalRequest._idempotentRetried = true;
+      return api(originalRequest);
+    }
+    if (
+      error.response &&
+      error.response.status === 401 &&
+      originalRequest &&
+      !originalRequest._retried &&
+      originalRequest.headers &&
+      originalRequest.headers.Authorization
+    ) {
+      originalRequest._retried = true;
+      try {
+        const token = await refreshAccessToken();
+        originalRequest.headers.Authorization = `Bearer ${token}`;
+        return api(originalRequest);
+      } catch (refreshError) {
+        // Refresh token expired or revoked - the user has to sign in again
+        window.dispatchEvent(new Event('auth:logout'));
+      }
+    }
+
     if (error.response) {
       // Server responded with error status
       const status = error.response.status;